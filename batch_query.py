@@ -0,0 +1,58 @@
+"""
+Batch FAQ pre-generation for College Assistant
+Sends a list of questions to /query/batch and fills the response cache
+Usage: python batch_query.py questions.txt [output.ndjson]
+"""
+
+import requests
+import json
+import sys
+
+# Base URL of your backend
+BASE_URL = "http://localhost:8000"
+
+def load_questions(path):
+    """Read one question per line, skipping blanks and # comments"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+def run_batch(questions, output_path=None, max_concurrency=4):
+    """Stream answers back and optionally save them as NDJSON"""
+    print(f"\n📤 Sending {len(questions)} questions (concurrency {max_concurrency})...")
+    
+    out = open(output_path, 'w', encoding='utf-8') if output_path else None
+    try:
+        response = requests.post(
+            f"{BASE_URL}/query/batch",
+            json={"questions": questions, "max_concurrency": max_concurrency},
+            stream=True
+        )
+        if response.status_code != 200:
+            print(f"❌ Batch failed: {response.text}")
+            return False
+        
+        for line in response.iter_lines(decode_unicode=True):
+            if not line:
+                continue
+            item = json.loads(line)
+            if item.get("done"):
+                print(f"\n✅ {item['total']} answered ({item['unique']} unique) in {item['elapsed_seconds']}s")
+                continue
+            marker = "⚡" if item["cached"] else "🤖"
+            print(f"{marker} [{item['index']}] {item['question']}")
+            if out:
+                out.write(line + "\n")
+        return True
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        print("Make sure the backend server is running!")
+        return False
+    finally:
+        if out:
+            out.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    run_batch(load_questions(sys.argv[1]), sys.argv[2] if len(sys.argv) > 2 else None)
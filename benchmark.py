@@ -0,0 +1,129 @@
+"""
+Micro-benchmarks for College Assistant internals
+Run this to measure hot paths without starting the server
+"""
+
+import timeit
+import main
+
+def print_section(title):
+    """Print a section header"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def legacy_intents(query):
+    """The substring any() passes get_relevant_context used before KeywordRouter"""
+    q = query.lower()
+    intents = set()
+    for intent, keywords in main.INTENT_KEYWORDS.items():
+        if any(keyword in q for keyword in keywords):
+            intents.add(intent)
+    return intents
+
+def bench_routing():
+    """Compare one-pass KeywordRouter with the substring scans"""
+    print_section("BENCH: Intent Routing")
+    
+    router = main.KeywordRouter()
+    # None of these are schedule questions
+    non_schedule = [
+        "What is the attendance policy?",
+        "What's the date of the fest?",
+        "Is there a cafeteria?",
+        "What happens if I cheat?",
+        "Where can I eat lunch?",
+        "Who is the director?",
+    ]
+    schedule = [
+        "What's my schedule for Monday?",
+        "When is my Operating Systems class?",
+        "Which classes are at 10?",
+    ]
+    queries = non_schedule + schedule
+    
+    runs = 20000
+    legacy = timeit.timeit(lambda: [legacy_intents(q) for q in queries], number=runs // len(queries))
+    routed = timeit.timeit(lambda: [router.intents(q) for q in queries], number=runs // len(queries))
+    per_query = runs // len(queries) * len(queries)
+    print(f"Substring scans: {legacy / per_query * 1e6:.2f} µs/query")
+    print(f"KeywordRouter:   {routed / per_query * 1e6:.2f} µs/query")
+    
+    legacy_fp = sum("timetable" in legacy_intents(q) for q in non_schedule)
+    routed_fp = sum("timetable" in router.intents(q) for q in non_schedule)
+    missed = sum("timetable" not in router.intents(q) for q in schedule)
+    print(f"Timetable false positives: {legacy_fp} -> {routed_fp} (of {len(non_schedule)})")
+    print(f"Schedule questions missed: {missed} (of {len(schedule)})")
+
+def bench_email_render():
+    """Render cost per message for the precompiled email templates"""
+    print_section("BENCH: Email Rendering")
+    
+    manager = main.EmailManager("bench@example.com", "")
+    args = ("Linked List Implementation", "Implement insert, delete & search <b>operations</b>\n" * 5,
+            "2024-12-30", "23:59", "https://calendar.google.com/event?eid=abc&x=1")
+    
+    runs = 20000
+    html_time = timeit.timeit(lambda: manager.create_assignment_email_body(*args), number=runs)
+    text_time = timeit.timeit(lambda: manager.create_assignment_email_text(*args), number=runs)
+    html = manager.create_assignment_email_body(*args)
+    text = manager.create_assignment_email_text(*args)
+    print(f"HTML render: {html_time / runs * 1e6:.2f} µs/message ({len(html.encode())} bytes)")
+    print(f"Text render: {text_time / runs * 1e6:.2f} µs/message ({len(text.encode())} bytes)")
+
+def bench_assignments_due():
+    """Due-date range queries over a year of assignments across many sections"""
+    print_section("BENCH: Assignments Due")
+    
+    import random
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    
+    random.seed(7)
+    registry = main.AssignmentRegistry(":memory:")
+    sections = [[f"s{sec}-{i}@college.edu" for i in range(60)] for sec in range(40)]
+    subjects = ["Data Structures", "Operating Systems", "Computer Networks", "DBMS", "Compiler Design"]
+    year_start = datetime(2024, 7, 1)
+    
+    started = timeit.default_timer()
+    for n in range(20000):
+        due = year_start + timedelta(minutes=random.randrange(365 * 24 * 60))
+        assignment = SimpleNamespace(
+            subject=random.choice(subjects), assignment_title=f"Assignment {n}", description="",
+            due_date=due.strftime("%Y-%m-%d"), due_time=due.strftime("%H:%M"),
+            student_emails=random.choice(sections))
+        registry.add(assignment, due)
+    print(f"Loaded {len(registry.items)} assignments in {timeit.default_timer() - started:.2f}s")
+    
+    week = (datetime(2024, 11, 4), datetime(2024, 11, 11))
+    queries = {
+        "week, everyone": lambda: registry.due(*week),
+        "week, one student": lambda: registry.due(*week, student="s3-7@college.edu"),
+        "year, one student + subject": lambda: registry.due(year_start, year_start + timedelta(days=365),
+                                                            student="s3-7@college.edu", subject="DBMS"),
+        "question context": lambda: registry.describe_due("what's due next week for dbms?",
+                                                          now=week[0] - timedelta(days=3)),
+    }
+    runs = 2000
+    for label, query in queries.items():
+        elapsed = timeit.timeit(query, number=runs)
+        result = query()
+        size = len(result) if isinstance(result, list) else len(result.splitlines()) - 1
+        print(f"{label:30s} {elapsed / runs * 1e3:.3f} ms/query ({size} results)")
+    
+    # What a linear scan of the same rows costs
+    records = list(registry.items.values())
+    lo, hi = (d.timestamp() for d in week)
+    scan = timeit.timeit(lambda: [r for r in records if lo <= r["due_at"] < hi
+                                  and "s3-7@college.edu" in r["recipients"]], number=runs // 10)
+    print(f"{'linear scan, one student':30s} {scan / (runs // 10) * 1e3:.3f} ms/query")
+
+def main_bench():
+    """Run all benchmarks"""
+    print("\n⏱️ College Assistant Micro-benchmarks")
+    bench_routing()
+    bench_email_render()
+    bench_assignments_due()
+
+if __name__ == "__main__":
+    main_bench()
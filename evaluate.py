@@ -0,0 +1,252 @@
+"""
+Offline retrieval evaluation for College Assistant
+Scores each retrieval strategy on golden_questions.json: fact recall, prompt tokens and
+retrieval time, plus end-to-end latency and answer recall against Ollama with --e2e
+Usage: python evaluate.py [--e2e] [--output eval_report.json] [--baseline previous_report.json]
+
+Exits with status 1 when --baseline is given and recall, prompt size or latency regressed.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+import main
+
+DOC_HEADERS = {"timetable": "TIMETABLE", "syllabus": "SYLLABUS", "info": "COLLEGE INFORMATION"}
+
+def print_section(title):
+    """Print a section header"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+# ---------- Strategies: (store, question) -> main.Context ----------
+
+def whole_documents(store, doc_types):
+    sections = []
+    for doc_type in doc_types:
+        document = getattr(store, store.DOC_ATTRS[doc_type])
+        if document:
+            sections.append((DOC_HEADERS[doc_type], document))
+    return main.Context(sections)
+
+def fallback(store):
+    """What retrieval sends when no intent matches"""
+    return main.Context([(header, document.prefix(size)) for header, document, size in
+                         [("TIMETABLE", store.timetable, 2000), ("COLLEGE INFO", store.college_info, 1000)]
+                         if document])
+
+def strategy_full(store, question):
+    """Every document, whole: the recall ceiling and the token worst case"""
+    return whole_documents(store, DOC_HEADERS)
+
+def strategy_keywords(store, question):
+    """Substring keyword matching with whole documents, as retrieval started out"""
+    q = question.lower()
+    doc_types = [t for t in DOC_HEADERS if any(keyword in q for keyword in main.INTENT_KEYWORDS[t])]
+    return whole_documents(store, doc_types) if doc_types else fallback(store)
+
+def strategy_router(store, question):
+    """KeywordRouter intents with whole documents, without slices or chunks"""
+    doc_types = [t for t in DOC_HEADERS if t in store.router.intents(question)]
+    return whole_documents(store, doc_types) if doc_types else fallback(store)
+
+def strategy_indexed(store, question):
+    """What the API serves: timetable slices, syllabus chunks and computed table results"""
+    return store.retrieve(question)[0]
+
+STRATEGIES = {
+    "full": strategy_full,
+    "keywords": strategy_keywords,
+    "router": strategy_router,
+    "indexed": strategy_indexed,
+}
+
+# ---------- Evaluation ----------
+
+def build_store(dataset):
+    """A DocumentStore with the built-in data plus the dataset's files, ingested as uploads are"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        store = main.DocumentStore()
+        for doc_type, path in dataset.get("files", {}).items():
+            with open(path, 'r', encoding='utf-8') as f:
+                store.set_document(doc_type, store.compact(f.read(), doc_type))
+    return store
+
+def fact_recall(facts, text):
+    text = normalize(text)
+    missing = [fact for fact in facts if normalize(fact) not in text]
+    return 1 - len(missing) / len(facts), missing
+
+def prompt_tokens(agent, question, context):
+    messages = agent.build_messages(question, context)
+    return main.estimate_tokens("\n".join(m["content"] for m in messages))
+
+def evaluate_question(agent, strategy, store, item, repeat, e2e_timeout):
+    strategy(store, item["question"])   # warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        context = strategy(store, item["question"])
+        timings.append((time.perf_counter() - started) * 1000)
+    
+    recall, missing = fact_recall(item["facts"], str(context))
+    result = {
+        "id": item["id"],
+        "category": item["category"],
+        "recall": round(recall, 3),
+        "missing": missing,
+        "prompt_tokens": prompt_tokens(agent, item["question"], context),
+        "retrieval_ms": round(statistics.median(timings), 4),
+    }
+    
+    if e2e_timeout:
+        started = time.perf_counter()
+        answer = agent.generate_response(item["question"], context, deadline=time.monotonic() + e2e_timeout)
+        result["e2e_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if answer.startswith("Error:"):
+            result["error"] = answer
+        else:
+            result["answer_recall"] = round(fact_recall(item["facts"], answer)[0], 3)
+    return result
+
+def summarize(results):
+    summary = {
+        "recall": round(statistics.mean(r["recall"] for r in results), 4),
+        "perfect_recall_rate": round(sum(r["recall"] == 1 for r in results) / len(results), 4),
+        "recall_by_category": {},
+        "prompt_tokens_mean": round(statistics.mean(r["prompt_tokens"] for r in results), 1),
+        "prompt_tokens_p95": percentile([r["prompt_tokens"] for r in results], 95),
+        "retrieval_ms_p50": round(percentile([r["retrieval_ms"] for r in results], 50), 4),
+        "retrieval_ms_p95": round(percentile([r["retrieval_ms"] for r in results], 95), 4),
+    }
+    for category in sorted({r["category"] for r in results}):
+        scores = [r["recall"] for r in results if r["category"] == category]
+        summary["recall_by_category"][category] = round(statistics.mean(scores), 4)
+    
+    answered = [r for r in results if "answer_recall" in r]
+    if any("e2e_ms" in r for r in results):
+        summary["e2e_ms_p50"] = percentile([r["e2e_ms"] for r in results], 50)
+        summary["e2e_ms_p95"] = percentile([r["e2e_ms"] for r in results], 95)
+        summary["errors"] = sum("error" in r for r in results)
+        summary["answer_recall"] = round(statistics.mean(r["answer_recall"] for r in answered), 4) if answered else None
+    return summary
+
+def evaluate(golden, strategies, repeat, agent, e2e_timeout=None):
+    stores = {name: build_store(dataset) for name, dataset in golden["datasets"].items()}
+    report = {
+        "generated": datetime.now().isoformat(timespec='seconds'),
+        "golden_version": golden.get("version"),
+        "questions": len(golden["questions"]),
+        "repeat": repeat,
+        "model": agent.model if e2e_timeout else None,
+        "strategies": {},
+    }
+    for name in strategies:
+        results = [evaluate_question(agent, STRATEGIES[name], stores[item["dataset"]], item, repeat, e2e_timeout)
+                   for item in golden["questions"]]
+        report["strategies"][name] = {"summary": summarize(results), "questions": results}
+    return report
+
+def regressions(report, baseline, max_recall_drop, max_slowdown, max_token_growth):
+    """Human-readable regressions of report against baseline, strategy by strategy"""
+    problems = []
+    for name, current in report["strategies"].items():
+        previous = baseline.get("strategies", {}).get(name)
+        if not previous:
+            continue
+        now, before = current["summary"], previous["summary"]
+        if now["recall"] < before["recall"] - max_recall_drop:
+            problems.append(f"{name}: recall {before['recall']} -> {now['recall']}")
+        if now["prompt_tokens_mean"] > before["prompt_tokens_mean"] * max_token_growth:
+            problems.append(f"{name}: prompt tokens {before['prompt_tokens_mean']} -> {now['prompt_tokens_mean']}")
+        # Sub-millisecond timings are noisy, so small absolute changes are ignored
+        if now["retrieval_ms_p50"] > before["retrieval_ms_p50"] * max_slowdown + 0.05:
+            problems.append(f"{name}: retrieval p50 {before['retrieval_ms_p50']} -> {now['retrieval_ms_p50']} ms")
+        if now.get("e2e_ms_p50") and before.get("e2e_ms_p50"):
+            if now["e2e_ms_p50"] > before["e2e_ms_p50"] * max_slowdown:
+                problems.append(f"{name}: end-to-end p50 {before['e2e_ms_p50']} -> {now['e2e_ms_p50']} ms")
+            if (now.get("answer_recall") or 0) < (before.get("answer_recall") or 0) - max_recall_drop:
+                problems.append(f"{name}: answer recall {before['answer_recall']} -> {now['answer_recall']}")
+    return problems
+
+def print_report(report):
+    print_section("EVAL: Retrieval Strategies")
+    e2e = report["model"] is not None
+    header = f"{'strategy':10s} {'recall':>7s} {'perfect':>8s} {'tokens':>8s} {'ret p50':>9s} {'ret p95':>9s}"
+    print(header + (f" {'e2e p50':>9s} {'answer':>7s}" if e2e else ""))
+    for name, strategy in report["strategies"].items():
+        s = strategy["summary"]
+        line = (f"{name:10s} {s['recall']:7.3f} {s['perfect_recall_rate']:8.2f} {s['prompt_tokens_mean']:8.0f} "
+                f"{s['retrieval_ms_p50']:7.3f}ms {s['retrieval_ms_p95']:7.3f}ms")
+        if e2e:
+            answer = f"{s['answer_recall']:7.3f}" if s["answer_recall"] is not None else "      -"
+            line += f" {s['e2e_ms_p50']:7.0f}ms {answer}"
+        print(line)
+    
+    for name, strategy in report["strategies"].items():
+        misses = [r for r in strategy["questions"] if r["missing"]]
+        if misses:
+            print(f"\n{name}: {len(misses)} questions missing facts")
+            for r in misses:
+                print(f"  {r['id']}: {'; '.join(r['missing'])}")
+
+def run():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency on the golden set")
+    parser.add_argument("--golden", default="golden_questions.json")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+                        help="comma-separated subset of " + ", ".join(STRATEGIES))
+    parser.add_argument("--repeat", type=int, default=50, help="timed retrievals per question")
+    parser.add_argument("--e2e", action="store_true", help="also generate answers with Ollama")
+    parser.add_argument("--host", default=main.settings.ollama.host, help="Ollama (or stand-in) URL")
+    parser.add_argument("--model", default=main.settings.ollama.model)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds per answer")
+    parser.add_argument("--output", default="eval_report.json")
+    parser.add_argument("--baseline", help="previous report to compare against")
+    parser.add_argument("--max-recall-drop", type=float, default=0.0)
+    parser.add_argument("--max-slowdown", type=float, default=1.5)
+    parser.add_argument("--max-token-growth", type=float, default=1.1)
+    args = parser.parse_args()
+    
+    with open(args.golden, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    unknown = [s for s in strategies if s not in STRATEGIES]
+    if unknown:
+        parser.error(f"unknown strategies: {', '.join(unknown)}")
+    
+    agent = main.CollegeAgent(args.model, main.OllamaPool(args.host, main.settings.ollama.connect_timeout, args.timeout))
+    print(f"\n📏 Evaluating {len(golden['questions'])} questions x {len(strategies)} strategies"
+          f"{' with end-to-end answers' if args.e2e else ''}")
+    report = evaluate(golden, strategies, args.repeat, agent, args.timeout if args.e2e else None)
+    print_report(report)
+    
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Report written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = regressions(report, baseline, args.max_recall_drop, args.max_slowdown, args.max_token_growth)
+        if problems:
+            print("\n❌ Regressions against baseline:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        print("\n✅ No regressions against baseline")
+
+if __name__ == "__main__":
+    run()
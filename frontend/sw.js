@@ -0,0 +1,90 @@
+// Service worker for College Assistant: keeps the app shell available offline.
+// Registered by index.html when the page is served over http(s), e.g.
+//     cd frontend && python -m http.server 3000
+// Bump SHELL_VERSION when index.html's script/style dependencies change.
+
+const SHELL_VERSION = 'v1';
+const SHELL_CACHE = `college-shell-${SHELL_VERSION}`;
+const DATA_CACHE = 'college-data';
+
+const SHELL_FILES = [
+  './',
+  './index.html',
+];
+
+// Third-party scripts index.html loads; unpkg allows CORS, the Tailwind CDN is cached opaque
+const CDN_FILES = [
+  'https://unpkg.com/react@18/umd/react.production.min.js',
+  'https://unpkg.com/react-dom@18/umd/react-dom.production.min.js',
+  'https://unpkg.com/@babel/standalone/babel.min.js',
+  'https://cdn.tailwindcss.com',
+];
+
+const CDN_URLS = new Set(CDN_FILES.map(url => new URL(url).href));
+
+// API responses worth keeping for offline use; everything else goes straight to the network
+const CACHED_API_PATHS = ['/timetable.json'];
+
+self.addEventListener('install', (event) => {
+  event.waitUntil((async () => {
+    const cache = await caches.open(SHELL_CACHE);
+    await cache.addAll(SHELL_FILES);
+    // A CDN being unreachable at install time must not block the shell
+    await Promise.all(CDN_FILES.map(async (url) => {
+      try {
+        const mode = url.startsWith('https://unpkg.com/') ? 'cors' : 'no-cors';
+        await cache.put(url, await fetch(new Request(url, { mode })));
+      } catch (error) {
+        // Cached on first successful page load instead
+      }
+    }));
+    await self.skipWaiting();
+  })());
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil((async () => {
+    const names = await caches.keys();
+    await Promise.all(names
+      .filter(name => name.startsWith('college-shell-') && name !== SHELL_CACHE)
+      .map(name => caches.delete(name)));
+    await self.clients.claim();
+  })());
+});
+
+// Shell: answer from cache at once and refresh it in the background
+const staleWhileRevalidate = async (request) => {
+  const cache = await caches.open(SHELL_CACHE);
+  const cached = await cache.match(request, { ignoreSearch: true });
+  const refresh = fetch(request).then((response) => {
+    if (response.ok || response.type === 'opaque') cache.put(request, response.clone());
+    return response;
+  }).catch(() => cached);
+  return cached || refresh;
+};
+
+// Data: the server's answer when reachable (it handles If-None-Match), the last copy when not
+const networkFirst = async (request) => {
+  const cache = await caches.open(DATA_CACHE);
+  try {
+    const response = await fetch(request);
+    if (response.ok) cache.put(request.url, response.clone());
+    return response;
+  } catch (error) {
+    const cached = await cache.match(request.url);
+    if (cached) return cached;
+    throw error;
+  }
+};
+
+self.addEventListener('fetch', (event) => {
+  const { request } = event;
+  if (request.method !== 'GET') return;
+  const url = new URL(request.url);
+
+  if (CACHED_API_PATHS.includes(url.pathname)) {
+    event.respondWith(networkFirst(request));
+  } else if (url.origin === self.location.origin || CDN_URLS.has(url.href)) {
+    event.respondWith(staleWhileRevalidate(request));
+  }
+});
@@ -0,0 +1,159 @@
+"""
+Load test for College Assistant admission control
+Floods /query from several student clients and runs batches while a professor client
+makes interactive calls, then reports per-class outcomes and latency
+Usage: python loadtest.py [--url http://127.0.0.1:8000] [--students 20] [--duration 30]
+
+Each simulated client connects from its own loopback address (127.0.0.N) so the server
+gives it its own rate limit bucket; run the server on 127.0.0.1 or 0.0.0.0.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import defaultdict
+import httpx
+
+STUDENT_QUESTIONS = [
+    "What classes do I have on Monday?",
+    "What is the minimum attendance required?",
+    "When is the DBMS lab?",
+    "What is the library fine for late returns?",
+    "What topics are in unit 3 of the operating systems syllabus?",
+]
+
+def print_section(title):
+    """Print a section header"""
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+class Results:
+    def __init__(self):
+        self.status = defaultdict(lambda: defaultdict(int))   # class -> status -> count
+        self.latency = defaultdict(list)                      # class -> ms of successful calls
+        self.retry_after = defaultdict(list)
+
+    def record(self, name, response, started):
+        self.status[name][response.status_code] += 1
+        if response.status_code < 400:
+            self.latency[name].append((time.perf_counter() - started) * 1000)
+        elif "retry-after" in response.headers:
+            self.retry_after[name].append(int(response.headers["retry-after"]))
+
+def client(url, address):
+    transport = httpx.AsyncHTTPTransport(local_address=address)
+    return httpx.AsyncClient(base_url=url, transport=transport, timeout=120)
+
+async def student(url, address, results, stop_at, honour_retry_after):
+    """Asks questions back to back, backing off only when told to"""
+    async with client(url, address) as http:
+        i = 0
+        while time.monotonic() < stop_at:
+            question = f"{STUDENT_QUESTIONS[i % len(STUDENT_QUESTIONS)]} ({address} #{i})"
+            started = time.perf_counter()
+            try:
+                response = await http.post("/query", json={"message": question})
+            except httpx.HTTPError:
+                results.status["chat"]["network error"] += 1
+                continue
+            results.record("chat", response, started)
+            if honour_retry_after and response.status_code in (429, 503):
+                await asyncio.sleep(min(int(response.headers.get("retry-after", "1")), 5))
+            i += 1
+
+async def professor(url, address, results, stop_at, interval):
+    """A cheap interactive action every interval seconds; its latency is what admission protects"""
+    async with client(url, address) as http:
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                response = await http.delete("/assignments/loadtest-probe")
+            except httpx.HTTPError:
+                results.status["interactive"]["network error"] += 1
+                continue
+            # 404 is the expected answer: the probe assignment never exists
+            if response.status_code == 404:
+                response.status_code = 200
+            results.record("interactive", response, started)
+            await asyncio.sleep(interval)
+
+async def batch(url, address, results, stop_at, size):
+    async with client(url, address) as http:
+        while time.monotonic() < stop_at:
+            questions = [f"{q} (batch {time.monotonic():.3f})" for q in STUDENT_QUESTIONS][:size]
+            started = time.perf_counter()
+            try:
+                async with http.stream("POST", "/query/batch", json={"questions": questions}) as response:
+                    busy = 0
+                    if response.status_code == 200:
+                        async for line in response.aiter_lines():
+                            if line and json.loads(line).get("response", "").startswith("Error: Server busy"):
+                                busy += 1
+                    results.record("batch", response, started)
+                    results.status["batch"]["questions shed"] += busy
+            except httpx.HTTPError:
+                results.status["batch"]["network error"] += 1
+            await asyncio.sleep(1)
+
+async def run_load(args):
+    stop_at = time.monotonic() + args.duration
+    results = Results()
+    tasks = [student(args.url, f"127.0.0.{10 + i}", results, stop_at, args.honour_retry_after)
+             for i in range(args.students)]
+    tasks.append(professor(args.url, "127.0.0.2", results, stop_at, args.professor_interval))
+    if args.batch:
+        tasks.append(batch(args.url, "127.0.0.3", results, stop_at, args.batch))
+    await asyncio.gather(*tasks)
+
+    async with httpx.AsyncClient(base_url=args.url) as http:
+        server = (await http.get("/debug/admission")).json()
+    return results, server
+
+def print_results(results, server, duration):
+    print_section("LOAD: Client View")
+    for name in ("interactive", "chat", "batch"):
+        if name not in results.status:
+            continue
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(results.status[name].items(), key=str))
+        print(f"{name:12s} {statuses}")
+        latency = results.latency[name]
+        if latency:
+            print(f"{'':12s} ok latency p50 {percentile(latency, 50):.0f}ms  p95 {percentile(latency, 95):.0f}ms  "
+                  f"({len(latency) / duration:.1f}/s)")
+        if results.retry_after[name]:
+            print(f"{'':12s} Retry-After {min(results.retry_after[name])}-{max(results.retry_after[name])}s")
+
+    print_section("LOAD: Server View")
+    print(f"capacity {server['capacity']}, {server['clients']} clients tracked")
+    for name, s in server["classes"].items():
+        if s["ceiling"] is None:
+            print(f"{name:12s} rate limited {s['rate_limited']:5d}")
+            continue
+        print(f"{name:12s} admitted {s['admitted']:5d}  rate limited {s['rate_limited']:5d}  "
+              f"queue full {s['queue_full']:4d}  timed out {s['timed_out']:4d}  "
+              f"wait p50 {s['wait_ms_p50']}ms p95 {s['wait_ms_p95']}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test admission control and priority classes")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--students", type=int, default=20, help="concurrent student chat clients")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run")
+    parser.add_argument("--professor-interval", type=float, default=0.5)
+    parser.add_argument("--batch", type=int, default=5, help="questions per batch request, 0 for none")
+    parser.add_argument("--honour-retry-after", action="store_true",
+                        help="students back off for Retry-After instead of retrying at once")
+    args = parser.parse_args()
+
+    print(f"\n🚦 {args.students} students, 1 professor{', 1 batch client' if args.batch else ''} "
+          f"for {args.duration:.0f}s against {args.url}")
+    results, server = asyncio.run(run_load(args))
+    print_results(results, server, args.duration)
+
+if __name__ == "__main__":
+    main()
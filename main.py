@@ -2,25 +2,53 @@
 College Assistant Agent - Fixed Backend with Better Context Understanding
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import (FastAPI, UploadFile, File, Header, HTTPException, Query, Request as HttpRequest, Response,
+                     WebSocket, WebSocketDisconnect)
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, field_validator
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.routing import Match
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
 from typing import Optional, List
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import array
+import asyncio
+import base64
+import bisect
+import contextlib
+import csv
+import functools
+import io
+import hashlib
+import hmac
+import httpx
+import mmap
+import json
+import math
+import threading
+import tracemalloc
+import time
+import uuid
+import zoneinfo
 import ollama
 import PyPDF2
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 import re
+import signal
+import sys
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
-from email import encoders
+from html import escape as html_escape
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 import pickle
+import sqlite3
+import numpy as np
 from PIL import Image
 import pytesseract
 
@@ -35,13 +63,174 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Gmail Config
-GMAIL_USER = "mridulkalra700@gmail.com"
-GMAIL_APP_PASSWORD = "frqd peuk jyef znta"
-
 # Calendar Scopes
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# ==================== CONFIGURATION ====================
+
+class OllamaSettings(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    host: Optional[str] = None
+    model: str = "llama3.2"
+    connect_timeout: float = Field(5.0, gt=0)
+    read_timeout: float = Field(120.0, gt=0)
+    max_connections: int = Field(8, ge=1)
+    # A request gives up on the model after this many seconds
+    request_deadline: float = Field(90.0, gt=0)
+
+class EmailSettings(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    gmail_user: str = "mridulkalra700@gmail.com"
+    gmail_app_password: str = "frqd peuk jyef znta"
+    smtp_host: str = "smtp.gmail.com"
+    smtp_port: int = 587
+    smtp_timeout: float = Field(30.0, gt=0)
+
+class CalendarSettings(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    time_zone: str = "Asia/Kolkata"
+    
+    @field_validator("time_zone")
+    @classmethod
+    def known_zone(cls, v):
+        try:
+            zoneinfo.ZoneInfo(v)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown time zone: {v}")
+        return v
+
+class LimitSettings(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    # Concurrent model-bound requests admitted per worker; see ADMISSION_CLASSES for the split
+    admission_capacity: int = Field(8, ge=1)
+    response_cache_entries: int = Field(2048, ge=1)
+    response_cache_ttl: int = Field(6 * 3600, ge=1)
+    sessions: int = Field(1000, ge=1)
+    # Recent messages kept verbatim per session (and sent to the model); older ones are summarized
+    session_window: int = Field(4, ge=2, le=40)
+    prefetch_ttl: float = Field(30.0, gt=0)
+    prefetch_entries: int = Field(1024, ge=1)
+    reminder_slots: int = Field(1440, ge=1)
+    attachment_cache_bytes: int = Field(512 * 1024 * 1024, ge=0)
+
+class ServerSettings(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    # Multi-worker mode: path of the SQLite database shared by all workers (see serve.py)
+    shared_state: Optional[str] = None
+    # Start allocation tracing at import (also switchable at runtime via /debug/memory)
+    tracemalloc_frames: int = Field(0, ge=0)
+    # Required in X-Admin-Token by /admin endpoints when set; /debug/memory is closed without it
+    admin_token: Optional[str] = None
+    # Signs the tokens /ws/chat requires to subscribe to one student's notifications;
+    # the college portal mints them through /admin/notification-token
+    notification_secret: Optional[str] = None
+
+class Settings(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    
+    ollama: OllamaSettings = OllamaSettings()
+    email: EmailSettings = EmailSettings()
+    calendar: CalendarSettings = CalendarSettings()
+    limits: LimitSettings = LimitSettings()
+    server: ServerSettings = ServerSettings()
+
+# Environment variables win over the config file
+CONFIG_ENV = {
+    "OLLAMA_HOST": "ollama.host",
+    "COLLEGE_MODEL": "ollama.model",
+    "COLLEGE_REQUEST_DEADLINE": "ollama.request_deadline",
+    "COLLEGE_GMAIL_USER": "email.gmail_user",
+    "COLLEGE_GMAIL_APP_PASSWORD": "email.gmail_app_password",
+    "COLLEGE_TIME_ZONE": "calendar.time_zone",
+    "COLLEGE_ADMISSION_CAPACITY": "limits.admission_capacity",
+    "COLLEGE_SHARED_STATE": "server.shared_state",
+    "COLLEGE_TRACEMALLOC": "server.tracemalloc_frames",
+    "COLLEGE_ADMIN_TOKEN": "server.admin_token",
+    "COLLEGE_NOTIFICATION_SECRET": "server.notification_secret",
+}
+
+# Read once at startup; a reload reports changes to these instead of applying them
+RESTART_REQUIRED = {"server.shared_state", "server.tracemalloc_frames"}
+SECRET_SETTINGS = {"email.gmail_app_password", "server.admin_token", "server.notification_secret"}
+
+def flatten_settings(settings: Settings) -> dict:
+    return {f"{section}.{name}": value for section, values in settings.model_dump().items()
+            for name, value in values.items()}
+
+class ConfigManager:
+    """Typed settings from a JSON file overlaid with environment variables.
+    
+    reload() validates the new settings before anything changes, so a bad edit leaves the
+    running configuration alone. Listeners are called with the new Settings and resize
+    what they own in place, keeping caches, sessions and pooled connections warm.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.listeners = []
+        self.reloads = 0
+        self.settings = self.load()
+        self.startup = flatten_settings(self.settings)
+        self.loaded_at = time.time()
+    
+    def load(self) -> Settings:
+        data = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError(f"{self.path} must hold a JSON object")
+        for variable, key in CONFIG_ENV.items():
+            if variable in os.environ:
+                section, name = key.split(".")
+                data.setdefault(section, {})[name] = os.environ[variable]
+        return Settings.model_validate(data)
+    
+    def reload(self) -> dict:
+        """Re-read file and environment, apply what changed, and report it"""
+        new = self.load()
+        before = flatten_settings(self.settings)
+        changed = sorted(key for key, value in flatten_settings(new).items() if before[key] != value)
+        self.settings = new
+        for listener in self.listeners:
+            listener(new)
+        self.reloads += 1
+        self.loaded_at = time.time()
+        return {"changed": changed, "restart_required": self.restart_required()}
+    
+    def restart_required(self) -> List[str]:
+        """Startup-only settings whose configured value differs from the one in use"""
+        current = flatten_settings(self.settings)
+        return sorted(key for key in RESTART_REQUIRED if current[key] != self.startup[key])
+    
+    def public(self) -> dict:
+        """Current settings with secrets masked"""
+        values = flatten_settings(self.settings)
+        for key in SECRET_SETTINGS:
+            if values[key]:
+                values[key] = "***"
+        return values
+    
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "file_found": os.path.exists(self.path),
+            "reloads": self.reloads,
+            "loaded_at": datetime.fromtimestamp(self.loaded_at).isoformat(timespec='seconds'),
+            "restart_required": self.restart_required(),
+        }
+
+config = ConfigManager(os.environ.get("COLLEGE_CONFIG", "college_config.json"))
+
+def college_zone() -> zoneinfo.ZoneInfo:
+    """The college's time zone; due dates and "today" are read in it, not the server's"""
+    return zoneinfo.ZoneInfo(config.settings.calendar.time_zone)
+
 # ==================== DATA MODELS ====================
 
 class ChatMessage(BaseModel):
@@ -50,53 +239,365 @@ class ChatMessage(BaseModel):
 
 class QueryRequest(BaseModel):
     message: str
+    # Preferred: only the new message plus a session id, history stays on the server
+    session_id: Optional[str] = None
     conversation_history: List[ChatMessage] = []
 
+class PrefetchRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
 class QueryResponse(BaseModel):
     response: str
     context_used: Optional[str] = None
+    session_id: Optional[str] = None
+
+class AgentQueryRequest(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+    max_steps: int = 4
+    # create_event and send_email only run when the caller opts in
+    allow_actions: bool = False
+    
+    @field_validator('max_steps')
+    @classmethod
+    def bounded_steps(cls, v):
+        if not 1 <= v <= 8:
+            raise ValueError("max_steps must be between 1 and 8")
+        return v
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    max_concurrency: int = 4
+    
+    @field_validator('questions', mode='before')
+    @classmethod
+    def clean_questions(cls, v):
+        if not isinstance(v, list) or not all(isinstance(q, str) for q in v):
+            raise ValueError("Questions must be a list of strings")
+        v = [q.strip() for q in v if q.strip()]
+        if not v:
+            raise ValueError("At least one question required")
+        return v
+    
+    @field_validator('max_concurrency')
+    @classmethod
+    def clamp_concurrency(cls, v):
+        return max(1, min(v, 16))
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+
+def normalize_email(email: str) -> Optional[str]:
+    """Lowercased address, or None when it isn't a valid email"""
+    email = email.strip()
+    return email.lower() if EMAIL_PATTERN.match(email) else None
 
 class AssignmentEmail(BaseModel):
-    student_emails: List[str]
+    student_emails: List[str] = []
+    roster_id: Optional[str] = None    # send to a stored class roster instead of (or as well as) a list
     subject: str
     assignment_title: str
     description: str
     due_date: str
     due_time: str = "23:59"
+    attachment: Optional[str] = None   # filename returned by POST /attachments
     
     @field_validator('student_emails', mode='before')
     @classmethod
     def validate_emails(cls, v):
         if isinstance(v, str):
-            v = [email.strip() for email in v.split(',')]
-        elif isinstance(v, list):
-            v = [email.strip() for email in v]
-        
-        v = [email for email in v if email]
-        
-        email_pattern = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
-        validated_emails = []
+            v = v.split(',')
         
+        validated_emails = {}
         for email in v:
-            if email_pattern.match(email):
-                validated_emails.append(email.lower())
-            else:
-                raise ValueError(f"Invalid email: {email}")
+            if not email.strip():
+                continue
+            normalized = normalize_email(email)
+            if normalized is None:
+                raise ValueError(f"Invalid email: {email.strip()}")
+            validated_emails[normalized] = None
         
-        if not validated_emails:
+        # dict keeps first-seen order while dropping duplicates
+        return list(validated_emails)
+    
+    @model_validator(mode='after')
+    def require_recipients(self):
+        if not self.student_emails and not self.roster_id:
             raise ValueError("At least one valid email required")
+        return self
+
+# ==================== EMAIL TEMPLATES ====================
+
+class EmailTemplate:
+    """Template compiled once into static fragments and slots.
+    
+    {{ name }} is HTML-escaped (for html templates), {{ name|safe }} is inserted as is.
+    Rendering fills a preallocated part list and joins it once.
+    """
+    
+    SLOT = re.compile(r'\{\{\s*(\w+)(\|safe)?\s*\}\}')
+    
+    def __init__(self, source: str, html: bool = True):
+        if html:
+            # Indentation and newlines between tags are only for reading the source
+            source = re.sub(r'>\s+<', '><', re.sub(r'\s*\n\s*', ' ', source.strip()))
+        else:
+            source = "\n".join(line.strip() for line in source.strip().splitlines()) + "\n"
+        pieces = self.SLOT.split(source)
+        # split() yields static, name, safe-flag, static, name, safe-flag, ..., static
+        self.parts = [None] * (len(pieces) // 3 * 2 + 1)
+        self.parts[0::2] = pieces[0::3]
+        self.slots = [(pieces[i], html and not pieces[i + 1]) for i in range(1, len(pieces), 3)]
+    
+    def render(self, **values) -> str:
+        parts = self.parts.copy()
+        for i, (name, escape) in enumerate(self.slots):
+            value = str(values.get(name) or "")
+            parts[2 * i + 1] = html_escape(value) if escape else value
+        return "".join(parts)
+
+CALENDAR_BUTTON_HTML = EmailTemplate("""
+    <div style="margin: 20px 0; text-align: center;">
+        <a href="{{ calendar_link }}" 
+           style="display: inline-block; background-color: #4285f4; color: white; 
+                  padding: 14px 28px; text-decoration: none; border-radius: 6px; 
+                  font-weight: bold; font-size: 16px;">
+            📅 Add to Google Calendar
+        </a>
+    </div>
+""")
+
+ASSIGNMENT_HTML = EmailTemplate("""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f5f5f5;">
+            <div style="background-color: white; border-radius: 10px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                <div style="background: linear-gradient(135deg, #ff6b35 0%, #ff8c42 100%); padding: 30px; text-align: center;">
+                    <h1 style="color: white; margin: 0; font-size: 28px;">📚 New Assignment</h1>
+                </div>
+                <div style="padding: 30px;">
+                    <h2 style="color: #ff6b35; margin-top: 0;">{{ assignment_title }}</h2>
+                    <div style="background-color: #f0f8ff; padding: 20px; border-radius: 6px; margin: 20px 0;">
+                        <p style="margin: 0; white-space: pre-wrap;">{{ description }}</p>
+                    </div>
+                    <div style="background: linear-gradient(135deg, #fff3e0 0%, #ffe0b2 100%); padding: 20px; border-radius: 6px;">
+                        <p><strong>📅 Due Date:</strong> {{ due_date }}</p>
+                        <p><strong>⏰ Due Time:</strong> {{ due_time }}</p>
+                    </div>
+                    {{ calendar_btn|safe }}
+                </div>
+            </div>
+        </div>
+    </body>
+    </html>
+""")
+
+ASSIGNMENT_TEXT = EmailTemplate("""
+    📚 New Assignment: {{ assignment_title }}
+    
+    {{ description }}
+    
+    📅 Due Date: {{ due_date }}
+    ⏰ Due Time: {{ due_time }}
+    {{ calendar_line }}
+""", html=False)
+
+REMINDER_HTML = EmailTemplate("""
+    <html>
+    <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f5f5f5;">
+            <div style="background-color: white; border-radius: 10px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                <div style="background: linear-gradient(135deg, #ff6b35 0%, #ff8c42 100%); padding: 30px; text-align: center;">
+                    <h1 style="color: white; margin: 0; font-size: 28px;">⏰ Due in {{ time_left }}</h1>
+                </div>
+                <div style="padding: 30px;">
+                    <h2 style="color: #ff6b35; margin-top: 0;">{{ assignment_title }}</h2>
+                    <p><strong>📚 Subject:</strong> {{ subject }}</p>
+                    <p><strong>📅 Due Date:</strong> {{ due_date }}</p>
+                    <p><strong>⏰ Due Time:</strong> {{ due_time }}</p>
+                </div>
+            </div>
+        </div>
+    </body>
+    </html>
+""")
+
+REMINDER_TEXT = EmailTemplate("""
+    ⏰ Reminder: {{ assignment_title }} is due in {{ time_left }}
+    
+    📚 Subject: {{ subject }}
+    📅 Due Date: {{ due_date }}
+    ⏰ Due Time: {{ due_time }}
+""", html=False)
+
+# ==================== ATTACHMENT CACHE ====================
+
+# Stands in for the attachment payload until the cached encoding is streamed in
+ATTACHMENT_MARKER = "@@ATTACHMENT-PAYLOAD@@"
+
+def smtp_data(text: str) -> bytes:
+    """CRLF line endings and dot-stuffing, as smtplib.sendmail would apply"""
+    return re.sub(r'(?m)^\.', '..', re.sub(r'\r\n|\r|\n', '\r\n', text)).encode('utf-8')
+
+class AttachmentCache:
+    """Attachments base64-encoded once per content hash and kept on disk in MIME form.
+    
+    Encoding streams the file in 57 KiB reads (whole 76-character base64 lines), and
+    sending maps the cached encoding with mmap, so memory use stays flat however large
+    the file or however many sends run at once.
+    """
+    
+    CHUNK = 57 * 1024
+    
+    def __init__(self, cache_dir: str = "attachment_cache", max_bytes: int = 512 * 1024 * 1024,
+                 max_hashes: int = 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_hashes = max_hashes
+        self._hashes = OrderedDict()   # (path, size, mtime) -> sha256, so unchanged files aren't rehashed
+        self._in_use = {}              # cached encoding -> sends currently reading it
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest:
+                self._hashes.move_to_end(key)
+                return digest
+        digest = hashlib.sha256()
+        if stat.st_size:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest.update(mm)
+        with self._lock:
+            self._hashes[key] = digest.hexdigest()
+            while len(self._hashes) > self.max_hashes:
+                self._hashes.popitem(last=False)
+        return digest.hexdigest()
+    
+    @staticmethod
+    def encoded_size(size: int) -> int:
+        """Bytes of the CRLF-wrapped base64 encoding: 76 characters plus CRLF per 57 input bytes"""
+        full, rest = divmod(size, 57)
+        return full * 78 + ((rest + 2) // 3 * 4 + 2 if rest else 0)
+    
+    def _encode(self, path: str, target: str):
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+            while True:
+                chunk = src.read(self.CHUNK)
+                if not chunk:
+                    break
+                dst.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+        # Concurrent encoders of the same file race harmlessly to identical content
+        os.replace(tmp, target)
+    
+    @contextlib.contextmanager
+    def encoded(self, path: str):
+        """The base64 (CRLF-wrapped) encoding of a file, mapped read-only for one send.
+        
+        The encoding is held open for the whole send, so pruning (here or in another
+        worker) can't pull it away, and entries in use are never evicted. A file whose
+        encoding alone exceeds the budget is encoded to a temporary file instead of the cache.
+        """
+        if self.encoded_size(os.path.getsize(path)) > self.max_bytes:
+            target = os.path.join(self.cache_dir, f"{uuid.uuid4().hex}.uncached")
+            cached = False
+        else:
+            target = os.path.join(self.cache_dir, f"{self.content_hash(path)}.b64")
+            cached = True
         
-        return validated_emails
+        with self._lock:
+            self._in_use[target] = self._in_use.get(target, 0) + 1
+        try:
+            if cached and os.path.exists(target):
+                os.utime(target)
+            else:
+                self._encode(path, target)
+            with open(target, 'rb') as f:
+                if cached:
+                    self._prune()
+                if not os.fstat(f.fileno()).st_size:
+                    yield b""
+                    return
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    yield mm
+        finally:
+            with self._lock:
+                self._in_use[target] -= 1
+                if not self._in_use[target]:
+                    del self._in_use[target]
+            if not cached:
+                with contextlib.suppress(OSError):
+                    os.remove(target)
+    
+    def _prune(self):
+        """Evict least recently used encodings over budget, never one a send is reading"""
+        with self._lock:
+            files = []
+            for name in os.listdir(self.cache_dir):
+                file_path = os.path.join(self.cache_dir, name)
+                with contextlib.suppress(OSError):
+                    if name.endswith(".b64"):
+                        stat = os.stat(file_path)
+                        files.append((stat.st_mtime, stat.st_size, file_path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            for _, size, file_path in files:
+                if total <= self.max_bytes:
+                    break
+                if file_path in self._in_use:
+                    continue
+                with contextlib.suppress(OSError):   # already pruned by another worker
+                    os.remove(file_path)
+                total -= size
+    
+    @staticmethod
+    def sendmail(server: smtplib.SMTP, sender: str, recipient: str, message: str, payload):
+        """SMTP transaction that streams the encoded attachment (from encoded()) into the DATA phase"""
+        head, _, tail = message.partition(ATTACHMENT_MARKER)
+        try:
+            code, resp = server.mail(sender)
+            if code != 250:
+                raise smtplib.SMTPSenderRefused(code, resp, sender)
+            code, resp = server.rcpt(recipient)
+            if code not in (250, 251):
+                raise smtplib.SMTPRecipientsRefused({recipient: (code, resp)})
+            server.putcmd("data")
+            code, resp = server.getreply()
+            if code != 354:
+                raise smtplib.SMTPDataError(code, resp)
+            
+            server.send(smtp_data(head))
+            if len(payload):
+                server.send(payload)
+            server.send(smtp_data(tail) + b"\r\n.\r\n")
+            
+            code, resp = server.getreply()
+            if code != 250:
+                raise smtplib.SMTPDataError(code, resp)
+        except smtplib.SMTPException:
+            server.rset()
+            raise
 
 # ==================== EMAIL MANAGER ====================
 
 class EmailManager:
-    def __init__(self, gmail_user: str, gmail_password: str):
+    def __init__(self, gmail_user: str, gmail_password: str, smtp_host: str = 'smtp.gmail.com',
+                 smtp_port: int = 587, smtp_timeout: float = 30):
         self.gmail_user = gmail_user
         self.gmail_password = gmail_password
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.smtp_timeout = smtp_timeout
+        self.attachments = AttachmentCache()
     
     def send_email(self, to_emails: List[str], subject: str, body: str, 
-                   attachment_path: Optional[str] = None):
+                   attachment_path: Optional[str] = None, text_body: Optional[str] = None):
+        # Holds the encoded attachment (if any) open until every recipient is sent
+        attachment = contextlib.ExitStack()
         try:
             print(f"\n📧 Sending email to: {to_emails}")
             
@@ -104,24 +605,37 @@ class EmailManager:
             msg['From'] = self.gmail_user
             msg['To'] = ', '.join(to_emails)
             msg['Subject'] = subject
-            msg.attach(MIMEText(body, 'html'))
+            if text_body:
+                # Plain-text clients read the first part, HTML clients the last
+                alternative = MIMEMultipart('alternative')
+                alternative.attach(MIMEText(text_body, 'plain'))
+                alternative.attach(MIMEText(body, 'html'))
+                msg.attach(alternative)
+            else:
+                msg.attach(MIMEText(body, 'html'))
             
+            payload = None
             if attachment_path and os.path.exists(attachment_path):
-                with open(attachment_path, 'rb') as f:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(f.read())
-                    encoders.encode_base64(part)
-                    part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment_path)}')
-                    msg.attach(part)
+                # The payload is streamed from the encoded-attachment cache at send time
+                payload = attachment.enter_context(self.attachments.encoded(attachment_path))
+                part = MIMEBase('application', 'octet-stream')
+                part['Content-Transfer-Encoding'] = 'base64'
+                part.set_payload(ATTACHMENT_MARKER)
+                part.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment_path)}')
+                msg.attach(part)
             
-            with smtplib.SMTP('smtp.gmail.com', 587, timeout=30) as server:
+            message = msg.as_string()
+            with smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=self.smtp_timeout) as server:
                 server.starttls()
                 server.login(self.gmail_user, self.gmail_password)
                 
                 successful = []
                 for recipient in to_emails:
                     try:
-                        server.sendmail(self.gmail_user, [recipient], msg.as_string())
+                        if payload is not None:
+                            self.attachments.sendmail(server, self.gmail_user, recipient, message, payload)
+                        else:
+                            server.sendmail(self.gmail_user, [recipient], message)
                         successful.append(recipient)
                         print(f"   ✅ Sent to: {recipient}")
                     except Exception as e:
@@ -132,55 +646,42 @@ class EmailManager:
         except Exception as e:
             print(f"❌ Email error: {e}")
             return False
+        finally:
+            attachment.close()
     
     def create_assignment_email_body(self, assignment_title: str, description: str, 
                                      due_date: str, due_time: str, 
                                      calendar_link: str = None) -> str:
-        
-        calendar_btn = ""
-        if calendar_link:
-            calendar_btn = f"""
-            <div style="margin: 20px 0; text-align: center;">
-                <a href="{calendar_link}" 
-                   style="display: inline-block; background-color: #4285f4; color: white; 
-                          padding: 14px 28px; text-decoration: none; border-radius: 6px; 
-                          font-weight: bold; font-size: 16px;">
-                    📅 Add to Google Calendar
-                </a>
-            </div>
-            """
-        
-        return f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f5f5f5;">
-                <div style="background-color: white; border-radius: 10px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                    <div style="background: linear-gradient(135deg, #ff6b35 0%, #ff8c42 100%); padding: 30px; text-align: center;">
-                        <h1 style="color: white; margin: 0; font-size: 28px;">📚 New Assignment</h1>
-                    </div>
-                    <div style="padding: 30px;">
-                        <h2 style="color: #ff6b35; margin-top: 0;">{assignment_title}</h2>
-                        <div style="background-color: #f0f8ff; padding: 20px; border-radius: 6px; margin: 20px 0;">
-                            <p style="margin: 0; white-space: pre-wrap;">{description}</p>
-                        </div>
-                        <div style="background: linear-gradient(135deg, #fff3e0 0%, #ffe0b2 100%); padding: 20px; border-radius: 6px;">
-                            <p><strong>📅 Due Date:</strong> {due_date}</p>
-                            <p><strong>⏰ Due Time:</strong> {due_time}</p>
-                        </div>
-                        {calendar_btn}
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        calendar_btn = CALENDAR_BUTTON_HTML.render(calendar_link=calendar_link) if calendar_link else ""
+        return ASSIGNMENT_HTML.render(assignment_title=assignment_title, description=description,
+                                      due_date=due_date, due_time=due_time, calendar_btn=calendar_btn)
+    
+    def create_assignment_email_text(self, assignment_title: str, description: str,
+                                     due_date: str, due_time: str,
+                                     calendar_link: str = None) -> str:
+        calendar_line = f"Add to Google Calendar: {calendar_link}\n" if calendar_link else ""
+        return ASSIGNMENT_TEXT.render(assignment_title=assignment_title, description=description,
+                                      due_date=due_date, due_time=due_time, calendar_line=calendar_line)
+    
+    def create_reminder_email_body(self, assignment_title: str, subject: str,
+                                   due_date: str, due_time: str, time_left: str) -> str:
+        return REMINDER_HTML.render(assignment_title=assignment_title, subject=subject,
+                                    due_date=due_date, due_time=due_time, time_left=time_left)
+    
+    def create_reminder_email_text(self, assignment_title: str, subject: str,
+                                   due_date: str, due_time: str, time_left: str) -> str:
+        return REMINDER_TEXT.render(assignment_title=assignment_title, subject=subject,
+                                    due_date=due_date, due_time=due_time, time_left=time_left)
 
 # ==================== CALENDAR MANAGER ====================
 
 class CalendarManager:
-    def __init__(self):
+    def __init__(self, interactive: bool = True, time_zone: str = 'Asia/Kolkata'):
         self.creds = None
         self.service = None
+        self.time_zone = time_zone
+        # Workers must not each open a browser; serve.py authenticates once up front
+        self.interactive = interactive
         self.authenticate()
     
     def authenticate(self):
@@ -196,6 +697,9 @@ class CalendarManager:
                     except Exception as e:
                         print(f"⚠️ Token refresh failed: {e}")
                         os.remove('token.pickle')
+                        if not self.interactive:
+                            print("⚠️ Calendar token invalid - run setup_calendar.py")
+                            return
                         if os.path.exists('credentials.json'):
                             flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
                             self.creds = flow.run_local_server(port=0)
@@ -203,6 +707,9 @@ class CalendarManager:
                             print("⚠️ credentials.json not found - Calendar disabled")
                             return
                 else:
+                    if not self.interactive:
+                        print("⚠️ No calendar token - run setup_calendar.py (Calendar disabled)")
+                        return
                     if os.path.exists('credentials.json'):
                         flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
                         self.creds = flow.run_local_server(port=0)
@@ -232,11 +739,11 @@ class CalendarManager:
                 'description': description,
                 'start': {
                     'dateTime': start_datetime.isoformat(),
-                    'timeZone': 'Asia/Kolkata',
+                    'timeZone': self.time_zone,
                 },
                 'end': {
                     'dateTime': end_datetime.isoformat(),
-                    'timeZone': 'Asia/Kolkata',
+                    'timeZone': self.time_zone,
                 },
                 'reminders': {
                     'useDefault': False,
@@ -267,218 +774,3110 @@ class CalendarManager:
             print(f"❌ Calendar error: {e}")
             return None, None
 
-# ==================== DOCUMENT STORE ====================
-
-class DocumentStore:
-    def __init__(self):
-        self.timetable = ""
-        self.syllabus = ""
-        self.college_info = ""
-        self.uploads_dir = "uploads"
-        os.makedirs(self.uploads_dir, exist_ok=True)
-        
-        # Load default data if available
-        self.load_default_data()
-    
-    def load_default_data(self):
-        """Load default college data"""
-        # Default UIT RGPV Timetable
-        default_timetable = """
-UIT RGPV - COMPUTER SCIENCE DEPARTMENT
-B.Tech 3rd Year - 5th Semester Timetable
+# ==================== KEYWORD ROUTER ====================
 
-MONDAY:
-9:00 AM - 10:00 AM: Computer Networks (CN) - Room 301 - Dr. Sharma
-10:00 AM - 11:00 AM: Software Engineering (SE) - Room 302 - Prof. Verma
-11:15 AM - 12:15 PM: Database Management Systems (DBMS) - Lab A - Dr. Patel
-12:15 PM - 1:15 PM: Theory of Computation (TOC) - Room 303 - Dr. Singh
-2:00 PM - 3:00 PM: Operating Systems (OS) - Room 301 - Prof. Kumar
-3:00 PM - 4:00 PM: Soft Skills Lab - Room 205
+# Intent -> keywords used to decide which documents go into the prompt
+INTENT_KEYWORDS = {
+    "timetable": ['time', 'schedule', 'timetable', 'class', 'when', 'at', 'monday', 'tuesday',
+                  'wednesday', 'thursday', 'friday', 'saturday', 'today', 'tomorrow'],
+    "syllabus": ['syllabus', 'course', 'subject', 'curriculum', 'topic'],
+    "info": ['college', 'campus', 'facility', 'facilities', 'rule', 'regulation', 'hostel',
+             'library', 'exam', 'examination'],
+    "deadlines": ['due', 'deadline', 'assignment', 'homework', 'submission', 'submit', 'overdue'],
+}
 
-TUESDAY:
-9:00 AM - 10:00 AM: Software Engineering Lab - Lab B - Prof. Verma
-10:00 AM - 11:00 AM: Computer Networks - Room 301 - Dr. Sharma
-11:15 AM - 12:15 PM: Operating Systems - Room 302 - Prof. Kumar
-12:15 PM - 1:15 PM: DBMS - Room 303 - Dr. Patel
-2:00 PM - 4:00 PM: Computer Networks Lab - Lab A - Dr. Sharma
+def _trie_pattern(words: List[str]) -> str:
+    """Regex for a word list with shared prefixes factored out (a regex trie)"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+    
+    def render(node):
+        end = '' in node
+        branches = [re.escape(ch) + render(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not end:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        return body + '?' if end else body
+    
+    return render(trie)
 
-WEDNESDAY:
-9:00 AM - 10:00 AM: Theory of Computation - Room 301 - Dr. Singh
-10:00 AM - 11:00 AM: Operating Systems Lab - Lab B - Prof. Kumar
-11:15 AM - 12:15 PM: Database Management Systems - Room 302 - Dr. Patel
-12:15 PM - 1:15 PM: Software Engineering - Room 303 - Prof. Verma
-2:00 PM - 3:00 PM: Project Work - Room 401
+class KeywordRouter:
+    """Word-boundary aware multi-intent matcher compiled once into a single regex"""
+    
+    def __init__(self, intent_keywords: dict = None):
+        self.intent_keywords = intent_keywords or INTENT_KEYWORDS
+        groups = []
+        for intent, keywords in self.intent_keywords.items():
+            trie = _trie_pattern(sorted({k.lower() for k in keywords}))
+            # Plurals ("rules", "classes") count as the keyword
+            groups.append(f"(?P<{intent}>{trie})")
+        # Matching a lowercased query is cheaper than re.IGNORECASE
+        self.pattern = re.compile(r"\b(?:" + "|".join(groups) + r")(?:e?s)?\b")
+    
+    def match(self, query: str) -> dict:
+        """Intent -> list of (start, end) spans, found in a single scan"""
+        found = {}
+        for m in self.pattern.finditer(query.lower()):
+            found.setdefault(m.lastgroup, []).append(m.span())
+        return found
+    
+    def intents(self, query: str) -> set:
+        return set(self.match(query))
 
-THURSDAY:
-9:00 AM - 10:00 AM: Computer Networks - Room 301 - Dr. Sharma
-10:00 AM - 11:00 AM: DBMS Lab - Lab A - Dr. Patel
-11:15 AM - 12:15 PM: Operating Systems - Room 302 - Prof. Kumar
-12:15 PM - 1:15 PM: Theory of Computation - Room 303 - Dr. Singh
-2:00 PM - 4:00 PM: Software Engineering Lab - Lab B - Prof. Verma
+# ==================== TIMETABLE INDEX ====================
 
-FRIDAY:
-9:00 AM - 10:00 AM: Operating Systems - Room 301 - Prof. Kumar
-10:00 AM - 11:00 AM: Database Management Systems - Room 302 - Dr. Patel
-11:15 AM - 12:15 PM: Computer Networks - Room 303 - Dr. Sharma
-12:15 PM - 1:15 PM: Software Engineering - Room 301 - Prof. Verma
-2:00 PM - 3:00 PM: Seminar/Guest Lecture - Auditorium
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
 
-SATURDAY:
-9:00 AM - 11:00 AM: Practical Exams/Project Review - As per schedule
-11:00 AM - 1:00 PM: Sports/Cultural Activities
+class TimetableIndex:
+    """Precomputed day/subject/professor slices of a timetable, built once per upload"""
+    
+    DAY_HEADER = re.compile(r'^(MONDAY|TUESDAY|WEDNESDAY|THURSDAY|FRIDAY|SATURDAY|SUNDAY)\s*:?\s*$', re.IGNORECASE)
+    SLOT = re.compile(r'^(\d{1,2}:\d{2}\s*[AP]M\s*-\s*\d{1,2}:\d{2}\s*[AP]M)\s*:\s*(.+)$', re.IGNORECASE)
+    PROFESSOR = re.compile(r'^(Dr|Prof|Mr|Mrs|Ms)\.?\s+(.+)$', re.IGNORECASE)
+    ABBREVIATION = re.compile(r'\(([A-Z]{2,6})\)')
+    COMMON_WORDS = {'am', 'an', 'as', 'at', 'be', 'by', 'do', 'go', 'in', 'is', 'it', 'me', 'no',
+                    'of', 'on', 'or', 'per', 'pm', 'so', 'to', 'up', 'us', 'we'}
+    
+    def __init__(self, text: str = ""):
+        self.header = ""
+        self.slices = {}      # slice id -> list of lines
+        self.entities = {}    # lowercase entity -> set of slice ids
+        self.legend = {}      # abbreviation -> full subject name
+        self.slots = []       # [day, start, end, subject, room, professor] per slot line
+        self.build(text)
+    
+    @staticmethod
+    def subject_key(name: str) -> str:
+        name = TimetableIndex.ABBREVIATION.sub('', name)
+        name = re.sub(r'\blab\b', '', name, flags=re.IGNORECASE)
+        return " ".join(name.lower().split())
+    
+    def build(self, text: str):
+        self.header = ""
+        self.slices = {}
+        self.entities = {}
+        self.legend = {}
+        self.slots = []
+        header, notes = [], []
+        day = None
+        aliases = {}
+        
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line:
+                continue
+            day_match = self.DAY_HEADER.match(line)
+            if day_match:
+                day = day_match.group(1).lower()
+                self.slices.setdefault(f"day:{day}", [])
+                self._link(day, f"day:{day}")
+                continue
+            
+            slot = self.SLOT.match(line)
+            if not slot or day is None:
+                (notes if day else header).append(line)
+                continue
+            
+            self.slices[f"day:{day}"].append(line)
+            parts = [p.strip() for p in slot.group(2).split(' - ')]
+            entry = f"{day.title()} {line}"
+            
+            subject = self.subject_key(parts[0])
+            for abbr in self.ABBREVIATION.findall(parts[0]):
+                aliases[abbr.lower()] = subject
+                self.legend[abbr] = self.ABBREVIATION.sub('', parts[0]).strip()
+            self.slices.setdefault(f"subject:{subject}", []).append(entry)
+            
+            start, end = [t.strip() for t in slot.group(1).split('-')]
+            self.slots.append([day.title(), start, end, parts[0],
+                               next((p for p in parts[1:] if not self.PROFESSOR.match(p)), ""),
+                               next((p for p in parts[1:] if self.PROFESSOR.match(p)), "")])
+            
+            for part in parts[1:]:
+                prof = self.PROFESSOR.match(part)
+                if prof:
+                    name = prof.group(2).lower()
+                    self.slices.setdefault(f"prof:{name}", []).append(entry)
+                    self._link(name, f"prof:{name}")
+                    self._link(f"{prof.group(1).lower()}. {name}", f"prof:{name}")
+        
+        # Subjects written by abbreviation on some days ("DBMS") fold into the full name
+        for abbr, subject in aliases.items():
+            short = self.slices.pop(f"subject:{abbr}", None) if abbr != subject else None
+            if short:
+                self.slices[f"subject:{subject}"].extend(short)
+        
+        for slice_id in list(self.slices):
+            if not slice_id.startswith("subject:"):
+                continue
+            self.slices[slice_id].sort(key=lambda l: WEEKDAYS.index(l.split(' ', 1)[0].lower()))
+            subject = slice_id.split(":", 1)[1]
+            self._link(subject, slice_id)
+            words = subject.split()
+            acronym = "".join(w[0] for w in words)
+            if len(words) > 1 and acronym not in self.COMMON_WORDS:
+                self._link(acronym, slice_id)
+        for abbr, subject in aliases.items():
+            self._link(abbr, f"subject:{subject}")
+        
+        self.header = "\n".join(header[:2] + notes)
+    
+    def _link(self, entity: str, slice_id: str):
+        self.entities.setdefault(entity, set()).add(slice_id)
+    
+    def match_entities(self, query: str) -> set:
+        q = query.lower()
+        if 'today' in q:
+            q += " " + datetime.now().strftime('%A').lower()
+        if 'tomorrow' in q:
+            q += " " + (datetime.now() + timedelta(days=1)).strftime('%A').lower()
+        
+        tokens = re.findall(r"[a-z0-9.]+", q)
+        text = " " + " ".join(tokens) + " "
+        matched = set()
+        for entity, slice_ids in self.entities.items():
+            if f" {entity} " in text or f" {entity}. " in text:
+                matched |= slice_ids
+        return matched
+    
+    def lookup(self, query: str) -> str:
+        """Minimal timetable text for the entities named in the query, '' if none"""
+        matched = self.match_entities(query)
+        if not matched:
+            return ""
+        
+        days = sorted((s for s in matched if s.startswith("day:")), key=lambda s: WEEKDAYS.index(s[4:]))
+        others = [s for s in matched if not s.startswith("day:")]
+        
+        lines = []
+        if days and others:
+            # "CN on Monday" only needs the Monday CN slot
+            wanted = {d[4:].title() for d in days}
+            for slice_id in others:
+                lines.extend(l for l in self.slices[slice_id] if l.split(' ', 1)[0] in wanted)
+        if not lines:
+            for slice_id in days:
+                lines.append(f"{slice_id[4:].upper()}:")
+                lines.extend(self.slices[slice_id])
+            for slice_id in sorted(others):
+                lines.extend(self.slices[slice_id])
+        
+        seen = set()
+        lines = [l for l in lines if not (l in seen or seen.add(l))]
+        
+        # Compacted timetables use bare abbreviations after their first definition
+        body = "\n".join(lines)
+        used = [f"{abbr} = {full}" for abbr, full in self.legend.items() if re.search(rf'\b{abbr}\b', body)]
+        legend = f"Abbreviations: {', '.join(used)}" if used else ""
+        return "\n".join(filter(None, [self.header, legend, body]))
 
-Note: Lunch Break is from 1:15 PM to 2:00 PM daily
-"""
+    @staticmethod
+    def _minutes(clock: str) -> int:
+        parsed = datetime.strptime(clock.replace(' ', '').upper(), '%I:%M%p')
+        return parsed.hour * 60 + parsed.minute
 
-        default_rules = """
-UIT RGPV - COLLEGE RULES AND REGULATIONS
+    def to_table(self) -> "Table":
+        """One row per slot, so counts and group-bys over the timetable run as table queries"""
+        rows = []
+        for day, start, end, subject, room, professor in self.slots:
+            kind = "lab" if re.search(r'\blab\b', subject, re.IGNORECASE) else "lecture"
+            name = " ".join(re.sub(r'\blab\b', '', self.ABBREVIATION.sub('', subject), flags=re.IGNORECASE).split())
+            name = self.legend.get(name.upper(), name)
+            begin = self._minutes(start)
+            rows.append([day, start, end, name, kind, room, professor,
+                         str(begin), str(self._minutes(end) - begin)])
+        header = ["day", "start", "end", "subject", "kind", "room", "professor", "start_minute", "duration_minutes"]
+        keywords = {"class", "classes", "lecture", "lectures", "lab", "labs", "timetable", "schedule",
+                    "slot", "slots", "period", "periods", "teach", "teaches", "professor", "room"}
+        return Table.from_rows("timetable", header, rows, keywords=keywords)
+    
+    def export(self) -> dict:
+        """Compact JSON form for clients that answer simple schedule questions themselves"""
+        days = {}
+        for day, start, end, subject, room, professor in self.slots:
+            # Spell out abbreviations compaction left bare ("OS" -> "Operating Systems (OS)")
+            if '(' not in subject:
+                subject = re.sub(r'\b[A-Z]{2,6}\b', lambda m: f"{self.legend[m.group()]} ({m.group()})"
+                                 if m.group() in self.legend else m.group(), subject)
+            days.setdefault(day, []).append([self._minutes(start), self._minutes(end), subject, room, professor])
+        for slots in days.values():
+            slots.sort()
+        return {"columns": ["start_minute", "end_minute", "subject", "room", "professor"],
+                "days": days, "legend": self.legend, "notes": self.header}
 
-ATTENDANCE POLICY:
-- Minimum 75% attendance is mandatory for appearing in exams
-- Medical leaves require valid certificates from authorized doctors
-- Late arrivals (after 10 minutes) will be marked as absent
-- Attendance is taken in the first 5 minutes of each class
+# ==================== CONTEXT COMPACTION ====================
 
-DRESS CODE:
-- Formal/Semi-formal attire is mandatory on campus
-- ID cards must be displayed at all times
-- Sports shoes only during sports activities
-- College uniform mandatory on specific days (Mondays & Thursdays)
+SEPARATOR_LINE = re.compile(r'^[\W_]{3,}$')
+# "Page 3", "Page 3 of 9", "3 of 9" are page markers anywhere; a bare "3" only at a page edge
+PAGE_MARKER = re.compile(r'^(page\s*\d+(\s*(of|/)\s*\d+)?|\d+\s*(of|/)\s*\d+)$', re.IGNORECASE)
+PAGE_NUMBER = re.compile(r'^-?\s*\d+\s*-?$')
+LIST_OR_SLOT = re.compile(r'^([-*•]|\d{1,2}:\d{2})')
+PAGE_BREAK = "\f"   # extract_text_from_pdf separates pages with a form feed
+EDGE_LINES = 3      # lines at the top and bottom of a page where running headers and footers sit
+DEFINED_ABBREVIATION = re.compile(r'\b([A-Z][A-Za-z]+(?: (?:of|and|[A-Z][A-Za-z]+))+) \(([A-Z]{2,6})\)')
 
-EXAMINATION RULES:
-- Students must reach exam hall 15 minutes before exam time
-- Mobile phones and electronic devices strictly prohibited
-- Any form of unfair means leads to immediate expulsion
-- Carrying university admit card is mandatory
+def estimate_tokens(text: str) -> int:
+    """Rough token count (words and punctuation), close enough to compare prompt sizes"""
+    return len(re.findall(r"\w+|[^\w\s]", text))
 
-LIBRARY RULES:
-- Books can be issued for 15 days maximum
-- Fine of Rs. 5 per day for late returns
-- Maintain silence in reading rooms
-- Reference books cannot be taken out
+def page_edges(page: List[str]) -> set:
+    """Indexes of the first and last EDGE_LINES non-empty lines of a page"""
+    content = [i for i, line in enumerate(page) if line]
+    return set(content[:EDGE_LINES] + content[-EDGE_LINES:])
 
-HOSTEL RULES:
-- Entry timings: 6:00 AM to 9:00 PM for girls, 6:00 AM to 10:00 PM for boys
-- Visitors allowed only in common areas with prior permission
-- Ragging is strictly prohibited and punishable by law
-- Regular room inspections will be conducted
+def running_lines(pages: List[List[str]]) -> set:
+    """Page headers and footers: lines at a page edge on at least half the pages, or, in text
+    without page breaks, lines recurring 3+ times at an even spacing. Headings that merely
+    repeat ("Topics:" in every unit) match neither; slots and list items are never included."""
+    if len(pages) > 1:
+        counts = {}
+        for page in pages:
+            for line in {page[i] for i in page_edges(page)}:
+                counts[line] = counts.get(line, 0) + 1
+        needed = max(2, (len(pages) + 1) // 2)
+        return {line for line, n in counts.items() if n >= needed and not LIST_OR_SLOT.match(line)}
+    
+    positions = {}
+    for i, line in enumerate(pages[0]):
+        if line and not LIST_OR_SLOT.match(line):
+            positions.setdefault(line, []).append(i)
+    running = set()
+    for line, where in positions.items():
+        gaps = [b - a for a, b in zip(where, where[1:])]
+        if len(where) >= 3 and min(gaps) >= 10 and max(gaps) - min(gaps) <= max(2, min(gaps) // 10):
+            running.add(line)
+    return running
 
-GENERAL CONDUCT:
-- Respectful behavior with faculty and staff is mandatory
-- Damaging college property will result in penalties
-- Political activities on campus are prohibited
-- Smoking and alcohol strictly prohibited on campus
+def compact_text(text: str) -> str:
+    """Normalize extracted text once at ingest so prompts don't carry layout noise"""
+    pages = [[" ".join(raw.split()) for raw in page.splitlines()] for page in text.split(PAGE_BREAK)]
+    running = running_lines(pages)
+    lines = []
+    seen = set()
+    for page in pages:
+        edges = page_edges(page) if len(pages) > 1 else set()
+        for i, line in enumerate(page):
+            if not line:
+                if lines and lines[-1]:
+                    lines.append("")
+                continue
+            if SEPARATOR_LINE.match(line) or PAGE_MARKER.match(line) or (i in edges and PAGE_NUMBER.match(line)):
+                continue
+            # A running header/footer is kept once, where it first appears
+            if line in running:
+                if line in seen:
+                    continue
+                seen.add(line)
+            lines.append(line)
+    compact = "\n".join(lines).strip()
+    
+    # "Database Management Systems (DBMS)" defines DBMS for every later mention
+    for full, abbr in dict(DEFINED_ABBREVIATION.findall(compact)).items():
+        definition = f"{full} ({abbr})"
+        head, sep, tail = compact.partition(definition)
+        compact = head + sep + re.sub(rf'\b{re.escape(full)}\b', abbr, tail)
+    return compact
 
-FACILITIES AVAILABLE:
-- Wi-Fi Campus (24/7)
-- Computer Labs with latest software
-- Library with 50,000+ books
-- Sports Complex (Cricket, Football, Basketball, Volleyball)
-- Gym and Fitness Center
-- Cafeteria and Food Courts
-- Medical Room with nurse on duty
-- Bus facility for day scholars
-- ATM and Banking facilities
-- Auditorium with 500 seating capacity
-- Innovation and Incubation Center
-"""
+# ==================== CHUNK INDEX ====================
 
-        if not self.timetable:
-            self.timetable = default_timetable
-            print("✅ Loaded default timetable")
-        
-        if not self.college_info:
-            self.college_info = default_rules
-            print("✅ Loaded default college rules")
+class ChunkIndex:
+    """Content-addressed document chunks with an incrementally maintained term index"""
     
-    def extract_text_from_pdf(self, file_path: str) -> str:
-        try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
-        except Exception as e:
-            print(f"PDF extraction error: {e}")
-            return ""
+    HEADING = re.compile(r'^[A-Z][A-Z0-9 &/().,-]*:\s*$')
+    TERM = re.compile(r'[a-z0-9]{2,}')
+    STOPWORDS = {'the', 'is', 'am', 'are', 'to', 'of', 'in', 'on', 'at', 'my', 'me', 'what', 'when',
+                 'which', 'who', 'how', 'do', 'does', 'and', 'or', 'for', 'with', 'about', 'tell', 'a'}
     
-    def extract_text_from_txt(self, file_path: str) -> str:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except Exception as e:
-            print(f"Text extraction error: {e}")
+    def __init__(self):
+        self.docs = {}        # doc type -> ordered chunk ids
+        self.chunks = {}      # chunk id -> {"text" or "span", "terms", "refs"}
+        self.postings = {}    # term -> chunk ids containing it
+        self.line_owner = {}  # hash of a stripped line -> chunk id
+    
+    @classmethod
+    def terms(cls, text: str) -> set:
+        return set(cls.TERM.findall(text.lower())) - cls.STOPWORDS
+    
+    @classmethod
+    def split(cls, text: str) -> List[str]:
+        """Chunks break at blank lines and before section headings like 'MONDAY:'"""
+        chunks, current = [], []
+        for raw in text.splitlines():
+            line = raw.strip()
+            if not line or (cls.HEADING.match(line) and current):
+                if current:
+                    chunks.append("\n".join(current))
+                current = [line] if line else []
+            else:
+                current.append(line)
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+    
+    @classmethod
+    def prepare(cls, text: str) -> List[tuple]:
+        """(chunk id, text, terms) per chunk; the hashing and tokenizing half of update()"""
+        return [(hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16], chunk, cls.terms(chunk))
+                for chunk in cls.split(text)]
+    
+    def text(self, chunk_id: str) -> str:
+        chunk = self.chunks[chunk_id]
+        return chunk["text"] if "text" in chunk else str(chunk["span"], 'utf-8')
+    
+    def update(self, doc_type: str, text: str, prepared: List[tuple] = None, buffer=None) -> dict:
+        """Replace a document, touching only the chunks whose content changed.
+        
+        With buffer (the document's DocumentBuffer), chunks found verbatim in it keep a
+        memoryview span into it instead of their own copy of the text.
+        """
+        new_ids = []
+        added = set()
+        cursor = 0
+        for chunk_id, chunk, terms in prepared if prepared is not None else self.prepare(text):
+            new_ids.append(chunk_id)
+            entry = self.chunks.get(chunk_id)
+            if entry is None:
+                entry = self.chunks[chunk_id] = {"text": chunk, "terms": terms, "refs": 0}
+                added.add(chunk_id)
+            if buffer is None:
+                continue
+            encoded = chunk.encode('utf-8')
+            start = buffer.data.find(encoded, cursor)
+            if start >= 0:
+                entry.pop("text", None)
+                entry["span"] = buffer.view[start:start + len(encoded)]
+                cursor = start + len(encoded)
+            elif "span" in entry:
+                # Don't keep an old document version alive through a reused chunk
+                entry["text"] = chunk
+                del entry["span"]
+        
+        old_ids = self.docs.get(doc_type, [])
+        for chunk_id in set(new_ids) - set(old_ids):
+            self._ref(chunk_id)
+        removed = set(old_ids) - set(new_ids)
+        for chunk_id in removed:
+            self._unref(chunk_id)
+        self.docs[doc_type] = new_ids
+        
+        return {
+            "added": added,
+            "removed": removed,
+            "added_terms": set().union(*(self.chunks[c]["terms"] for c in added)),
+            "reused": len(set(new_ids) - added),
+        }
+    
+    def _ref(self, chunk_id: str):
+        chunk = self.chunks[chunk_id]
+        chunk["refs"] += 1
+        if chunk["refs"] > 1:
+            return
+        for term in chunk["terms"]:
+            self.postings.setdefault(term, set()).add(chunk_id)
+        for line in self.text(chunk_id).splitlines():
+            self.line_owner[hash(line)] = chunk_id
+    
+    def _unref(self, chunk_id: str):
+        chunk = self.chunks[chunk_id]
+        chunk["refs"] -= 1
+        if chunk["refs"] > 0:
+            return
+        for term in chunk["terms"]:
+            ids = self.postings.get(term)
+            if ids:
+                ids.discard(chunk_id)
+                if not ids:
+                    del self.postings[term]
+        for line in self.text(chunk_id).splitlines():
+            if self.line_owner.get(hash(line)) == chunk_id:
+                del self.line_owner[hash(line)]
+        del self.chunks[chunk_id]
+    
+    def search(self, query: str, doc_type: str, limit: int = 3) -> List[str]:
+        """Chunk ids of one document ranked by how many query terms they contain"""
+        in_doc = set(self.docs.get(doc_type, []))
+        scores = {}
+        for term in self.terms(query):
+            for chunk_id in self.postings.get(term, ()):
+                if chunk_id in in_doc:
+                    scores[chunk_id] = scores.get(chunk_id, 0) + 1
+        order = {chunk_id: i for i, chunk_id in enumerate(self.docs.get(doc_type, []))}
+        # Ties go to the earlier chunk, so results don't depend on set iteration order
+        best = sorted(scores, key=lambda c: (-scores[c], order[c]))[:limit]
+        return sorted(best, key=order.get)
+    
+    def chunks_for_lines(self, lines: List[str]) -> set:
+        owners = set()
+        for line in lines:
+            owner = self.line_owner.get(hash(line))
+            if owner is None and ' ' in line:
+                # Timetable slices prefix slot lines with their day
+                owner = self.line_owner.get(hash(line.split(' ', 1)[1]))
+            if owner:
+                owners.add(owner)
+        return owners
+
+# ==================== SHARED STATE ====================
+
+class SharedState:
+    """SQLite (WAL) store that lets uvicorn/gunicorn workers share documents and cached answers"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_type TEXT PRIMARY KEY, content TEXT, compaction TEXT, version INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, answer TEXT, created REAL, deps TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY, data TEXT, updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY, value INTEGER
+            );
+        """)
+        self.conn.commit()
+        self.documents_version = -1   # unknown until the first changed()
+    
+    def changed(self) -> bool:
+        """True when any worker saved a document since the last call (one primary key lookup).
+        
+        Sessions, cached answers and idempotency keys commit to the same database on almost
+        every request, so this reads a counter only save_document() bumps.
+        """
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'documents_version'").fetchone()
+        version = row[0] if row else 0
+        changed = version != self.documents_version
+        self.documents_version = version
+        return changed
+    
+    def save_document(self, doc_type: str, content: str, compaction: dict = None) -> int:
+        """Store a document for the other workers; returns its new version"""
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, 1) ON CONFLICT(doc_type) DO UPDATE SET "
+                "content = excluded.content, compaction = excluded.compaction, version = version + 1",
+                (doc_type, content, json.dumps(compaction)))
+            self.conn.execute(
+                "INSERT INTO meta VALUES ('documents_version', 1) ON CONFLICT(key) DO UPDATE SET value = value + 1")
+            return self.conn.execute("SELECT version FROM documents WHERE doc_type = ?", (doc_type,)).fetchone()[0]
+    
+    def documents(self) -> List[tuple]:
+        with self._lock:
+            rows = self.conn.execute("SELECT doc_type, content, compaction, version FROM documents").fetchall()
+        return [(doc_type, content, json.loads(compaction) if compaction else None, version)
+                for doc_type, content, compaction, version in rows]
+    
+    def cache_get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            row = self.conn.execute("SELECT answer, created, deps FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2]) if row[2] else None
+    
+    def cache_put(self, key: str, answer: str, created: float, deps: Optional[set]):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                              (key, answer, created, json.dumps(sorted(deps)) if deps is not None else None))
+    
+    def cache_delete(self, keys: List[str]):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in keys])
+    
+    def cache_entries(self) -> List[tuple]:
+        with self._lock:
+            rows = self.conn.execute("SELECT key, deps FROM responses").fetchall()
+        return [(key, json.loads(deps) if deps else None) for key, deps in rows]
+    
+    def cache_clear(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+    
+    def session_get(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def session_put(self, session_id: str, data: dict):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                              (session_id, json.dumps(data), time.time()))
+
+# ==================== TABULAR DATA ====================
+
+MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+          'august', 'september', 'october', 'november', 'december']
+
+def plain_words(text: str) -> str:
+    """Lowercase words joined by single spaces, so 'Dr. Sharma' and 'dr sharma' compare equal"""
+    return " ".join(re.findall(r'[a-z0-9]+', text.lower()))
+
+class Table:
+    """Column-oriented in-memory table built from CSV rows or parsed timetable slots.
+
+    Columns are filled as array('d') (NaN = missing) and array('q') of day ordinals
+    (0 = missing) while loading, then exposed as zero-copy NumPy views; text columns
+    become object arrays. Filters are boolean masks, range filters bisect a sorted
+    index built the first time a column is filtered on, and group-bys are bincounts.
+    """
+
+    DATE_FORMATS = ['%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%m/%d/%Y']
+    FILTER_OPS = {"==", "!=", ">", ">=", "<", "<=", "between", "in", "month", "contains"}
+    AGGREGATES = {"count", "avg", "sum", "min", "max"}
+    MAX_GROUPS = 20
+    KEYWORD_VALUES = 50   # text columns with at most this many distinct values feed self.keywords
+
+    def __init__(self, name: str, keywords=()):
+        self.name = name
+        self.columns = {}
+        self.types = {}
+        self.rows = 0
+        self.keywords = set(keywords)
+        self._indexes = {}   # column -> (sorted values, row ids in that order)
+        self._lowered = {}   # text column -> lowercase copy for case-insensitive filters
+
+    @classmethod
+    def _parse_date(cls, value: str) -> Optional[int]:
+        for fmt in cls.DATE_FORMATS:
+            try:
+                return datetime.strptime(value, fmt).toordinal()
+            except ValueError:
+                continue
+        return None
+
+    @classmethod
+    def _infer(cls, values: List[str]) -> str:
+        present = [v for v in values if v.strip()]
+        if not present:
+            return "text"
+        try:
+            [float(v) for v in present]
+            return "number"
+        except ValueError:
+            pass
+        if all(cls._parse_date(v.strip()) for v in present):
+            return "date"
+        return "text"
+
+    def _append(self, column: str, value: str):
+        kind = self.types[column]
+        value = value.strip()
+        if kind == "number":
+            try:
+                self.columns[column].append(float(value))
+            except ValueError:
+                self.columns[column].append(float('nan'))
+        elif kind == "date":
+            self.columns[column].append(self._parse_date(value) or 0)
+        else:
+            self.columns[column].append(value)
+
+    @classmethod
+    def from_rows(cls, name: str, header: List[str], rows, sample_rows: int = 100, keywords=()) -> "Table":
+        """Load an iterable of string rows; types come from the first sample_rows rows"""
+        table = cls(name, keywords)
+        rows = iter(rows)
+        sample = []
+        for row in rows:
+            sample.append(row)
+            if len(sample) >= sample_rows:
+                break
+        for i, column in enumerate(header):
+            kind = cls._infer([row[i] if i < len(row) else "" for row in sample])
+            table.types[column] = kind
+            table.columns[column] = array.array('d') if kind == "number" else array.array('q') if kind == "date" else []
+
+        def add(row):
+            for i, column in enumerate(header):
+                table._append(column, row[i] if i < len(row) else "")
+            table.rows += 1
+
+        for row in sample:
+            add(row)
+        for row in rows:
+            add(row)
+        table._freeze()
+        return table
+
+    @classmethod
+    def from_csv(cls, name: str, stream, sample_rows: int = 100) -> "Table":
+        """Parse rows incrementally; types come from the first sample_rows rows"""
+        reader = csv.reader(stream)
+        header = [h.strip() or f"column_{i}" for i, h in enumerate(next(reader, []))]
+        return cls.from_rows(name, header, reader, sample_rows)
+
+    def _freeze(self):
+        for column, kind in self.types.items():
+            values = self.columns[column]
+            if kind == "text":
+                self.columns[column] = np.array(values, dtype=object)
+            else:
+                dtype = np.float64 if kind == "number" else np.int64
+                self.columns[column] = np.frombuffer(values, dtype=dtype) if len(values) else np.empty(0, dtype)
+
+        self.keywords.update(plain_words(self.name.replace('_', ' ')).split())
+        for column, kind in self.types.items():
+            self.keywords.update(plain_words(column.replace('_', ' ')).split())
+            if kind == "text":
+                distinct = set(self.column_lower(column).tolist())
+                if len(distinct) <= self.KEYWORD_VALUES:
+                    self.keywords.update(plain_words(v) for v in distinct if len(v) > 2)
+
+    def column(self, name: str) -> Optional[str]:
+        """Case-insensitive column lookup"""
+        for column in self.columns:
+            if column.lower() == str(name).lower():
+                return column
+        return None
+
+    def column_lower(self, column: str):
+        if column not in self._lowered:
+            self._lowered[column] = np.array([v.lower() for v in self.columns[column]], dtype=object)
+        return self._lowered[column]
+
+    def relevant(self, question: str) -> bool:
+        """Whether the question names this table, one of its columns or a categorical value"""
+        words = plain_words(question).split()
+        text = " " + " ".join(words) + " "
+        singular = {w[:-1] for w in words if w.endswith('s')}
+        return any(f" {k} " in text or k in singular for k in self.keywords)
+
+    def sorted_index(self, column: str) -> tuple:
+        if column not in self._indexes:
+            values = self.columns[column]
+            order = np.argsort(values, kind='stable')
+            self._indexes[column] = (values[order], order)
+        return self._indexes[column]
+
+    def _range(self, column: str, low, high, low_inclusive: bool = True, high_inclusive: bool = True):
+        """Mask of rows with low <= value <= high, found by bisecting the column's sorted index"""
+        values, order = self.sorted_index(column)
+        if self.types[column] == "date":
+            low = max(low, 1)    # 0 marks a missing date
+        start = np.searchsorted(values, low, side='left' if low_inclusive else 'right')
+        stop = np.searchsorted(values, high, side='right' if high_inclusive else 'left')
+        mask = np.zeros(self.rows, dtype=bool)
+        mask[order[start:stop]] = True
+        return mask
+
+    def _coerce(self, column: str, value):
+        """Query values arrive as JSON; turn them into the column's storage type"""
+        kind = self.types[column]
+        if isinstance(value, (list, tuple)):
+            return [self._coerce(column, v) for v in value]
+        if kind == "date":
+            if isinstance(value, (int, float)):
+                return int(value)
+            parsed = self._parse_date(str(value).strip())
+            if parsed is None:
+                raise ValueError(f"{column} expects a date, got {value!r}")
+            return parsed
+        if kind == "number":
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{column} expects a number, got {value!r}")
+        return str(value).lower()
+
+    def _mask(self, f: dict):
+        column, op, value = f["column"], f["op"], f.get("value")
+        if op == "month":
+            values, _ = self.sorted_index(column)
+            present = values[values > 0]
+            if not len(present):
+                return np.zeros(self.rows, dtype=bool)
+            years = [int(value["year"])] if value.get("year") else \
+                range(date.fromordinal(int(present[0])).year, date.fromordinal(int(present[-1])).year + 1)
+            mask = np.zeros(self.rows, dtype=bool)
+            for year in years:
+                start = date(year, value["month"], 1)
+                end = date(year + value["month"] // 12, value["month"] % 12 + 1, 1)
+                mask |= self._range(column, start.toordinal(), end.toordinal(), high_inclusive=False)
+            return mask
+
+        value = self._coerce(column, value)
+        if self.types[column] == "text":
+            lowered = self.column_lower(column)
+            if op == "==":
+                return lowered == value
+            if op == "!=":
+                return lowered != value
+            if op == "in":
+                return np.isin(lowered, value)
+            if op == "contains":
+                return np.fromiter((value in v for v in lowered), dtype=bool, count=self.rows)
+            raise ValueError(f"{op} is not supported on text column {column}")
+
+        if op == "==":
+            return self._range(column, value, value)
+        if op == "!=":
+            return ~self._range(column, value, value)
+        if op == "in":
+            return np.isin(self.columns[column], value)
+        if op in (">", ">="):
+            return self._range(column, value, np.inf, low_inclusive=op == ">=")
+        if op in ("<", "<="):
+            return self._range(column, -np.inf, value, high_inclusive=op == "<=")
+        if op == "between":
+            return self._range(column, value[0], value[1])
+        raise ValueError(f"{op} is not supported on {self.types[column]} column {column}")
+
+    def select(self, filters: List[dict]):
+        """Boolean mask of rows matching every filter; None means all rows"""
+        selected = None
+        for f in filters:
+            mask = self._mask(f)
+            selected = mask if selected is None else selected & mask
+        return selected
+
+    def validate(self, query: dict) -> dict:
+        """Normalize a structured query (possibly model-written) against this table's schema"""
+        if not isinstance(query, dict):
+            raise ValueError("Query must be an object")
+
+        def resolve(name, numeric=False):
+            column = self.column(name) if name else None
+            if column is None:
+                raise ValueError(f"Unknown column in {self.name}: {name}")
+            if numeric and self.types[column] == "text":
+                raise ValueError(f"{column} is not numeric")
+            return column
+
+        filters = []
+        for f in query.get("filters") or []:
+            if not isinstance(f, dict) or f.get("op") not in self.FILTER_OPS:
+                raise ValueError(f"Unsupported filter: {f}")
+            column = resolve(f.get("column"))
+            value = f.get("value")
+            if f["op"] == "month":
+                if self.types[column] != "date" or not isinstance(value, dict) or value.get("month") not in range(1, 13):
+                    raise ValueError(f"Bad month filter: {f}")
+            elif f["op"] in ("between", "in") and not isinstance(value, list):
+                raise ValueError(f"{f['op']} needs a list value: {f}")
+            elif f["op"] == "between" and len(value) != 2:
+                raise ValueError(f"between needs [low, high]: {f}")
+            filters.append({"column": column, "op": f["op"], "value": value})
+
+        aggregate = query.get("aggregate") or {"op": "count"}
+        if isinstance(aggregate, str):
+            aggregate = {"op": aggregate}
+        op = str(aggregate.get("op", "count")).lower()
+        if op not in self.AGGREGATES:
+            raise ValueError(f"Unsupported aggregate: {op}")
+        target = None
+        if op != "count":
+            target = resolve(aggregate.get("column"), numeric=True)
+            if op in ("avg", "sum") and self.types[target] != "number":
+                raise ValueError(f"{op} needs a number column, {target} is {self.types[target]}")
+
+        group_by = resolve(query["group_by"]) if query.get("group_by") else None
+        order = query.get("order") if query.get("order") in ("asc", "desc") else None
+        try:
+            limit = max(1, min(int(query.get("limit") or self.MAX_GROUPS), self.MAX_GROUPS))
+        except (TypeError, ValueError):
+            limit = self.MAX_GROUPS
+        return {"filters": filters, "group_by": group_by, "aggregate": {"op": op, "column": target},
+                "order": order, "limit": limit}
+
+    def _display(self, column: Optional[str], value):
+        if value is None:
+            return None
+        if column and self.types[column] == "date":
+            return date.fromordinal(int(value)).isoformat() if value > 0 else None
+        if isinstance(value, (np.floating, float)):
+            value = float(value)
+            return None if value != value else (int(value) if value.is_integer() else round(value, 3))
+        return value.item() if isinstance(value, np.generic) else value
+
+    def aggregate(self, op: str, column: Optional[str], mask=None):
+        if op == "count":
+            return self.rows if mask is None else int(mask.sum())
+        values = self.columns[column] if mask is None else self.columns[column][mask]
+        values = values[values > 0] if self.types[column] == "date" else values[~np.isnan(values)]
+        if not len(values):
+            return None
+        if op == "avg":
+            return self._display(column, values.mean())
+        if op == "sum":
+            return self._display(column, values.sum())
+        if op == "min":
+            return self._display(column, values.min())
+        if op == "max":
+            return self._display(column, values.max())
+        raise ValueError(f"Unsupported aggregate: {op}")
+
+    def group(self, group_by: str, op: str, column: Optional[str], mask=None) -> List[list]:
+        """[key, value] per distinct group_by value, computed with one bincount per aggregate"""
+        keys = self.columns[group_by] if mask is None else self.columns[group_by][mask]
+        if not len(keys):
+            return []
+        groups, inverse = np.unique(keys, return_inverse=True)
+        if op == "count":
+            values = np.bincount(inverse, minlength=len(groups))
+        else:
+            target = self.columns[column] if mask is None else self.columns[column][mask]
+            present = target > 0 if self.types[column] == "date" else ~np.isnan(target)
+            inverse, target = inverse[present], target[present]
+            counts = np.bincount(inverse, minlength=len(groups))
+            if op in ("sum", "avg"):
+                values = np.bincount(inverse, weights=target, minlength=len(groups))
+                if op == "avg":
+                    values = np.divide(values, counts, out=np.full(len(groups), np.nan), where=counts > 0)
+            else:
+                values = np.full(len(groups), np.inf if op == "min" else -np.inf)
+                (np.minimum if op == "min" else np.maximum).at(values, inverse, target)
+            values = np.where(counts > 0, values, np.nan)
+        return [[self._display(group_by, k), self._display(column, v)] for k, v in zip(groups, values)]
+
+    def execute(self, query: dict) -> dict:
+        """Run {"filters", "group_by", "aggregate": {"op", "column"}, "order", "limit"}; returns the compact result"""
+        query = self.validate(query)
+        mask = self.select(query["filters"])
+        aggregate = query["aggregate"]
+        result = {
+            "table": self.name,
+            "aggregate": aggregate,
+            "filters": query["filters"],
+            "group_by": query["group_by"],
+            "matched_rows": self.rows if mask is None else int(mask.sum()),
+        }
+        if query["group_by"]:
+            groups = self.group(query["group_by"], aggregate["op"], aggregate["column"], mask)
+            if query["order"]:
+                # Groups without a value go last whichever way the rest are sorted
+                present = sorted((g for g in groups if g[1] is not None), key=lambda g: g[1],
+                                 reverse=query["order"] == "desc")
+                groups = present + [g for g in groups if g[1] is None]
+            result["groups"] = groups[:query["limit"]]
+            result["truncated"] = len(groups) > query["limit"]
+        else:
+            result["value"] = self.aggregate(aggregate["op"], aggregate["column"], mask)
+        return result
+
+    def describe(self) -> str:
+        return f"{self.name}: {self.rows} rows; columns " + ", ".join(f"{c} ({t})" for c, t in self.types.items())
+
+    def schema(self) -> dict:
+        """Column types plus a few example values, small enough to put in a planning prompt"""
+        columns = {}
+        for column, kind in self.types.items():
+            values = self.columns[column]
+            if kind == "text":
+                distinct = list(dict.fromkeys(values[:200].tolist()))
+                columns[column] = {"type": kind, "examples": distinct[:8]}
+            else:
+                present = values[values > 0] if kind == "date" else values[~np.isnan(values)]
+                columns[column] = {"type": kind, "range": [self._display(column, present.min()),
+                                                           self._display(column, present.max())]
+                                   if len(present) else None}
+        return {"table": self.name, "rows": self.rows, "columns": columns}
+
+AGGREGATE_WORDS = [
+    (re.compile(r'\b(average|avg|mean)\b'), "avg"),
+    (re.compile(r'\b(how many|count|number of)\b'), "count"),
+    (re.compile(r'\b(total|sum)\b'), "sum"),
+    (re.compile(r'\b(highest|max|maximum|best)\b'), "max"),
+    (re.compile(r'\b(lowest|min|minimum|worst)\b'), "min"),
+]
+STAR_FILTER = re.compile(r'\b(\d)[- ]?stars?\b')
+MONTH_FILTER = re.compile(r'\b(' + '|'.join(MONTHS) + r')\b(?:\s+(\d{4}))?')
+GROUP_FILTER = re.compile(r'\b(?:per|by|for each|each)\s+([a-z_]+)')
+ANALYTIC_WORDS = re.compile(
+    r'\b(how many|count|number of|average|avg|mean|total|sum|most|least|highest|lowest|'
+    r'max|maximum|min|minimum|per|each|more than|less than|at least|at most|above|below|top \d+)\b')
+# Words that frame a question rather than name a value, even when some value contains them
+# (the room "as per schedule")
+QUESTION_WORDS = {'as', 'per', 'each', 'by', 'there', 'have', 'has', 'many', 'much', 'all',
+                  'day', 'days', 'week', 'schedule', 'timetable'}
+
+def parse_table_question(table: Table, question: str) -> Optional[dict]:
+    """Rule-based structured query for common aggregate questions, None if not one"""
+    q = question.lower()
+    op = next((op for pattern, op in AGGREGATE_WORDS if pattern.search(q)), None)
+    if op is None:
+        return None
+
+    numeric = [c for c, t in table.types.items() if t == "number"]
+    dates = [c for c, t in table.types.items() if t == "date"]
+    target = next((c for c in numeric if c.lower() in q), numeric[0] if numeric and op != "count" else None)
+    if op != "count" and target is None:
+        return None
+
+    filters = []
+    star = STAR_FILTER.search(q)
+    rating = next((c for c in numeric if 'rating' in c.lower() or 'star' in c.lower()), None)
+    if star and rating:
+        filters.append({"column": rating, "op": "==", "value": float(star.group(1))})
+    month = MONTH_FILTER.search(q)
+    if month and dates:
+        filters.append({"column": dates[0], "op": "month", "value": {
+            "month": MONTHS.index(month.group(1)) + 1,
+            "year": int(month.group(2)) if month.group(2) else None,
+        }})
+
+    # Categorical values named in the question ("on monday", "labs", "by dr. sharma") become filters
+    words = plain_words(q).split()
+    text = f" {' '.join(words)} "
+    vocabulary, used = set(), set()
+    for column, kind in table.types.items():
+        if kind != "text":
+            continue
+        distinct = set(table.column_lower(column).tolist())
+        if len(distinct) > Table.KEYWORD_VALUES:
+            continue
+        named = []
+        for value in sorted(distinct):
+            plain = plain_words(value)
+            vocabulary.update(plain.split())
+            if plain and any(f" {plain}{suffix} " in text for suffix in ("", "s", "es")):
+                named.append(value)
+                used.update(plain.split())
+        # "compiler design" names that subject, not also the "compiler" lab
+        named = [v for v in named if not any(v != other and f" {plain_words(v)} " in f" {plain_words(other)} "
+                                             for other in named)]
+        if len(named) == 1:
+            filters.append({"column": column, "op": "==", "value": named[0]})
+        elif named:
+            filters.append({"column": column, "op": "in", "value": named})
+    
+    # A value word the plan doesn't use ("prof" in "prof. verma", who isn't in the table) means
+    # the question asks for something the rules can't express; a number that ignores it would
+    # be wrong, so leave the question to the model planner
+    for word in set(words) - ChunkIndex.STOPWORDS - QUESTION_WORDS:
+        forms = {word, word[:-1] if word.endswith('s') else word, word[:-2] if word.endswith('es') else word}
+        if forms & vocabulary and not forms & used:
+            return None
+
+    group_by = None
+    for word in GROUP_FILTER.findall(q):
+        group_by = table.column(word) or table.column(word.rstrip('s'))
+        if group_by:
+            break
+    return {"filters": filters, "group_by": group_by, "aggregate": {"op": op, "column": target}}
+
+def format_table_result(result: dict) -> str:
+    aggregate = result["aggregate"]
+    described = []
+    for f in result["filters"]:
+        if f["op"] == "month":
+            month = MONTHS[f["value"]["month"] - 1].title()
+            described.append(f"{f['column']} in {month} {f['value'].get('year') or ''}".strip())
+        else:
+            described.append(f"{f['column']} {f['op']} {f['value']}")
+    what = aggregate["op"] + (f"({aggregate['column']})" if aggregate.get("column") else "")
+    where = f" where {' and '.join(described)}" if described else ""
+    over = f"(over {result['matched_rows']} of the rows in {result['table']})"
+    if result.get("group_by"):
+        groups = "; ".join(f"{key if key not in ('', None) else '(blank)'}: {value}" for key, value in result["groups"])
+        more = " (more groups omitted)" if result.get("truncated") else ""
+        return f"{what} by {result['group_by']}{where} {over}: {groups}{more}"
+    return f"{what}{where} = {result['value']} {over}"
+
+# ==================== DOCUMENT STORE ====================
+
+class DocumentBuffer:
+    """A document's text stored once as UTF-8; prefixes are memoryview spans, not copies"""
+    
+    __slots__ = ("data", "view")
+    
+    def __init__(self, text: str = ""):
+        self.data = text.encode('utf-8')
+        self.view = memoryview(self.data)
+    
+    def __len__(self) -> int:
+        return len(self.data)
+    
+    def __bool__(self) -> bool:
+        return bool(self.data)
+    
+    def __str__(self) -> str:
+        return self.data.decode('utf-8')
+    
+    def __eq__(self, other) -> bool:
+        if isinstance(other, str):
+            return self.data == other.encode('utf-8')
+        return isinstance(other, DocumentBuffer) and self.data == other.data
+    
+    __hash__ = None
+    
+    def prefix(self, max_bytes: int) -> memoryview:
+        """At most max_bytes, cut back to a character boundary"""
+        end = min(max_bytes, len(self.data))
+        while end < len(self.data) and self.data[end] & 0xC0 == 0x80:
+            end -= 1
+        return self.view[:end]
+
+class Context:
+    """Retrieved (header, body) sections, rendered only when the prompt is built.
+    
+    Bodies may be str or DocumentBuffer/memoryview spans; rendering straight into the
+    prompt means a whole document is copied once per request rather than once per layer.
+    """
+    
+    EMPTY = "No relevant documents found."
+    
+    __slots__ = ("sections", "text")
+    
+    def __init__(self, sections: List[tuple] = None):
+        self.sections = sections or []
+        self.text = None   # set by prepare()
+    
+    def prepare(self) -> "Context":
+        """Render the body ahead of time (while the user is still typing), so that building
+        the prompt later is only a concatenation"""
+        self.text = self.render()
+        return self
+    
+    def _parts(self):
+        if not self.sections:
+            yield self.EMPTY.encode('utf-8')
+        for i, (header, body) in enumerate(self.sections):
+            yield (b"\n\n" if i else b"") + f"=== {header} ===\n".encode('utf-8')
+            if isinstance(body, DocumentBuffer):
+                body = body.view
+            yield body.encode('utf-8') if isinstance(body, str) else body
+    
+    def render(self, prefix: str = "", suffix: str = "") -> str:
+        """prefix + context + suffix with one bytes join and one decode"""
+        if self.text is not None:
+            return prefix + self.text + suffix
+        return b"".join([prefix.encode('utf-8'), *self._parts(), suffix.encode('utf-8')]).decode('utf-8')
+    
+    def __str__(self) -> str:
+        return self.render()
+    
+    def preview(self, chars: int) -> str:
+        """The first chars characters, decoding only as much as needed"""
+        if self.text is not None:
+            return self.text[:chars]
+        parts, size = [], 0
+        for part in self._parts():
+            parts.append(part[:chars * 4 - size])
+            size += len(parts[-1])
+            if size >= chars * 4:
+                break
+        return b"".join(parts).decode('utf-8', errors='ignore')[:chars]
+
+class DocumentStore:
+    DOC_ATTRS = {"timetable": "timetable", "syllabus": "syllabus", "info": "college_info"}
+    
+    def __init__(self, shared: SharedState = None, assignments=None):
+        # Text documents as DocumentBuffer (UTF-8, stored once); str() when a copy is really needed
+        self.timetable = DocumentBuffer()
+        self.syllabus = DocumentBuffer()
+        self.college_info = DocumentBuffer()
+        self.uploads_dir = "uploads"
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        self.timetable_index = TimetableIndex()
+        self.chunk_index = ChunkIndex()
+        self.router = KeywordRouter()
+        self.listeners = []   # called with (doc_type, changes) after a document is replaced
+        self.compaction = {}  # doc type -> token counts before/after compact_text
+        self.shared = shared
+        self.versions = {}    # doc type -> shared version already applied
+        self.tables = {}      # table name -> Table for uploaded CSV files
+        self.timetable_table = None   # timetable slots as a Table, rebuilt with the index
+        self._timetable_export = None   # (index, etag, body) for the index it was built from
+        self.lock = threading.RLock()  # index swaps from the ingestion pool vs. readers
+        self.assignments = assignments  # AssignmentRegistry, for deadline questions
+        
+        # Documents uploaded through another worker win over the defaults
+        if self.shared:
+            self.sync()
+        
+        # Load default data if available
+        self.load_default_data()
+    
+    def load_default_data(self):
+        """Load default college data"""
+        # Default UIT RGPV Timetable
+        default_timetable = """
+UIT RGPV - COMPUTER SCIENCE DEPARTMENT
+B.Tech 3rd Year - 5th Semester Timetable
+
+MONDAY:
+9:00 AM - 10:00 AM: Computer Networks (CN) - Room 301 - Dr. Sharma
+10:00 AM - 11:00 AM: Software Engineering (SE) - Room 302 - Prof. Verma
+11:15 AM - 12:15 PM: Database Management Systems (DBMS) - Lab A - Dr. Patel
+12:15 PM - 1:15 PM: Theory of Computation (TOC) - Room 303 - Dr. Singh
+2:00 PM - 3:00 PM: Operating Systems (OS) - Room 301 - Prof. Kumar
+3:00 PM - 4:00 PM: Soft Skills Lab - Room 205
+
+TUESDAY:
+9:00 AM - 10:00 AM: Software Engineering Lab - Lab B - Prof. Verma
+10:00 AM - 11:00 AM: Computer Networks - Room 301 - Dr. Sharma
+11:15 AM - 12:15 PM: Operating Systems - Room 302 - Prof. Kumar
+12:15 PM - 1:15 PM: DBMS - Room 303 - Dr. Patel
+2:00 PM - 4:00 PM: Computer Networks Lab - Lab A - Dr. Sharma
+
+WEDNESDAY:
+9:00 AM - 10:00 AM: Theory of Computation - Room 301 - Dr. Singh
+10:00 AM - 11:00 AM: Operating Systems Lab - Lab B - Prof. Kumar
+11:15 AM - 12:15 PM: Database Management Systems - Room 302 - Dr. Patel
+12:15 PM - 1:15 PM: Software Engineering - Room 303 - Prof. Verma
+2:00 PM - 3:00 PM: Project Work - Room 401
+
+THURSDAY:
+9:00 AM - 10:00 AM: Computer Networks - Room 301 - Dr. Sharma
+10:00 AM - 11:00 AM: DBMS Lab - Lab A - Dr. Patel
+11:15 AM - 12:15 PM: Operating Systems - Room 302 - Prof. Kumar
+12:15 PM - 1:15 PM: Theory of Computation - Room 303 - Dr. Singh
+2:00 PM - 4:00 PM: Software Engineering Lab - Lab B - Prof. Verma
+
+FRIDAY:
+9:00 AM - 10:00 AM: Operating Systems - Room 301 - Prof. Kumar
+10:00 AM - 11:00 AM: Database Management Systems - Room 302 - Dr. Patel
+11:15 AM - 12:15 PM: Computer Networks - Room 303 - Dr. Sharma
+12:15 PM - 1:15 PM: Software Engineering - Room 301 - Prof. Verma
+2:00 PM - 3:00 PM: Seminar/Guest Lecture - Auditorium
+
+SATURDAY:
+9:00 AM - 11:00 AM: Practical Exams/Project Review - As per schedule
+11:00 AM - 1:00 PM: Sports/Cultural Activities
+
+Note: Lunch Break is from 1:15 PM to 2:00 PM daily
+"""
+
+        default_rules = """
+UIT RGPV - COLLEGE RULES AND REGULATIONS
+
+ATTENDANCE POLICY:
+- Minimum 75% attendance is mandatory for appearing in exams
+- Medical leaves require valid certificates from authorized doctors
+- Late arrivals (after 10 minutes) will be marked as absent
+- Attendance is taken in the first 5 minutes of each class
+
+DRESS CODE:
+- Formal/Semi-formal attire is mandatory on campus
+- ID cards must be displayed at all times
+- Sports shoes only during sports activities
+- College uniform mandatory on specific days (Mondays & Thursdays)
+
+EXAMINATION RULES:
+- Students must reach exam hall 15 minutes before exam time
+- Mobile phones and electronic devices strictly prohibited
+- Any form of unfair means leads to immediate expulsion
+- Carrying university admit card is mandatory
+
+LIBRARY RULES:
+- Books can be issued for 15 days maximum
+- Fine of Rs. 5 per day for late returns
+- Maintain silence in reading rooms
+- Reference books cannot be taken out
+
+HOSTEL RULES:
+- Entry timings: 6:00 AM to 9:00 PM for girls, 6:00 AM to 10:00 PM for boys
+- Visitors allowed only in common areas with prior permission
+- Ragging is strictly prohibited and punishable by law
+- Regular room inspections will be conducted
+
+GENERAL CONDUCT:
+- Respectful behavior with faculty and staff is mandatory
+- Damaging college property will result in penalties
+- Political activities on campus are prohibited
+- Smoking and alcohol strictly prohibited on campus
+
+FACILITIES AVAILABLE:
+- Wi-Fi Campus (24/7)
+- Computer Labs with latest software
+- Library with 50,000+ books
+- Sports Complex (Cricket, Football, Basketball, Volleyball)
+- Gym and Fitness Center
+- Cafeteria and Food Courts
+- Medical Room with nurse on duty
+- Bus facility for day scholars
+- ATM and Banking facilities
+- Auditorium with 500 seating capacity
+- Innovation and Incubation Center
+"""
+
+        if not self.timetable:
+            self.set_document("timetable", self.compact(default_timetable, "timetable"))
+            print("✅ Loaded default timetable")
+        
+        if not self.college_info:
+            self.set_document("info", self.compact(default_rules, "info"))
+            print("✅ Loaded default college rules")
+    
+    def compact(self, text: str, doc_type: str) -> str:
+        compact = compact_text(text)
+        before, after = estimate_tokens(text), estimate_tokens(compact)
+        self.compaction[doc_type] = {
+            "raw_tokens": before,
+            "compact_tokens": after,
+            "tokens_saved": before - after,
+        }
+        return compact
+    
+    def extract_text_from_pdf(self, file_path: str) -> str:
+        try:
+            text = ""
+            with open(file_path, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                for page in pdf_reader.pages:
+                    text += page.extract_text() + PAGE_BREAK
+            return text
+        except Exception as e:
+            print(f"PDF extraction error: {e}")
+            return ""
+    
+    def extract_text_from_txt(self, file_path: str) -> str:
+        try:
+            with open(file_path, 'r', encoding='utf-8') as file:
+                return file.read()
+        except Exception as e:
+            print(f"Text extraction error: {e}")
+            return ""
+    
+    def extract_text_from_image(self, file_path: str) -> str:
+        try:
+            image = Image.open(file_path)
+            return pytesseract.image_to_string(image)
+        except Exception as e:
+            print(f"OCR extraction error: {e}")
+            return ""
+    
+    def extract(self, file_path: str) -> Optional[str]:
+        """Raw text of an uploaded document, None for unsupported file types"""
+        if file_path.lower().endswith('.pdf'):
+            return self.extract_text_from_pdf(file_path)
+        if file_path.lower().endswith('.txt'):
+            return self.extract_text_from_txt(file_path)
+        if file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
+            return self.extract_text_from_image(file_path)
+        return None
+    
+    def store_document(self, file_path: str, doc_type: str) -> bool:
+        """Synchronous ingestion, for scripts; the API goes through IngestPipeline"""
+        try:
+            if file_path.lower().endswith('.csv'):
+                # Tabular data is queried, never pasted into the prompt
+                self.load_table(file_path)
+                return True
+            content = self.extract(file_path)
+            if content is None:
+                return False
+            self.set_document(doc_type, self.compact(content, doc_type))
+            return True
+        except Exception as e:
+            print(f"Document storage error: {e}")
+            return False
+    
+    @staticmethod
+    def read_table(file_path: str) -> Table:
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            return Table.from_csv(name, f)
+    
+    def load_table(self, file_path: str, local: bool = True, table: Table = None) -> Table:
+        table = table or self.read_table(file_path)
+        with self.lock:
+            self.tables[table.name] = table
+        print(f"📊 Table {table.describe()}")
+        if local and self.shared:
+            self.versions[f"table:{table.name}"] = self.shared.save_document(f"table:{table.name}",
+                                                                            os.path.abspath(file_path))
+        return table
+    
+    def set_document(self, doc_type: str, content: str, local: bool = True,
+                     prepared: List[tuple] = None, timetable: TimetableIndex = None):
+        """Replace a document and its derived indexes; local=False when applying another worker's upload.
+        
+        prepared (ChunkIndex.prepare) and timetable (a built TimetableIndex) let the ingestion
+        pipeline do the expensive parts beforehand, so the lock is only held for the swap.
+        """
+        if doc_type == "timetable":
+            timetable = timetable or TimetableIndex(content)
+            timetable_table = timetable.to_table()
+        with self.lock:
+            buffer = DocumentBuffer(content)
+            setattr(self, self.DOC_ATTRS[doc_type], buffer)
+            if doc_type == "timetable":
+                self.timetable_index = timetable
+                self.timetable_table = timetable_table
+            changes = self.chunk_index.update(doc_type, content, prepared, buffer)
+        changes["local"] = local
+        print(f"🧩 {doc_type}: {len(changes['added'])} new chunks, "
+              f"{len(changes['removed'])} removed, {changes['reused']} reused")
+        
+        if local and self.shared:
+            self.versions[doc_type] = self.shared.save_document(doc_type, content, self.compaction.get(doc_type))
+        for listener in self.listeners:
+            listener(doc_type, changes)
+    
+    def sync(self):
+        """Apply documents other workers replaced since the last sync"""
+        if not self.shared or not self.shared.changed():
+            return
+        for doc_type, content, compaction, version in self.shared.documents():
+            if self.versions.get(doc_type) == version:
+                continue
+            self.versions[doc_type] = version
+            if doc_type.startswith("table:"):
+                self.load_table(content, local=False)
+            elif content != getattr(self, self.DOC_ATTRS[doc_type]):
+                if compaction:
+                    self.compaction[doc_type] = compaction
+                self.set_document(doc_type, content, local=False)
+    
+    def timetable_export(self) -> tuple:
+        """(etag, JSON body) of the current timetable, serialized once per timetable.
+        
+        The version is a hash of the export itself, so every worker (and every restart)
+        gives the same timetable the same ETag.
+        """
+        with self.lock:
+            index, cached = self.timetable_index, self._timetable_export
+        if cached and cached[0] is index:
+            return cached[1], cached[2]
+        export = index.export()
+        version = hashlib.sha256(json.dumps(export, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        body = json.dumps({"version": version, **export}, separators=(',', ':')).encode('utf-8')
+        self._timetable_export = (index, f'"{version}"', body)
+        return self._timetable_export[1], body
+    
+    def get_relevant_context(self, query: str) -> str:
+        """Enhanced context retrieval with better matching"""
+        return str(self.retrieve(query)[0])
+    
+    def analytic_tables(self, query: str) -> List[Table]:
+        """Tables an analytic question may be about; call with the lock held"""
+        if not ANALYTIC_WORDS.search(query.lower()):
+            return []
+        return [t for t in [*self.tables.values(), self.timetable_table] if t and t.rows and t.relevant(query)]
+    
+    def query_tables(self, query: str, planner=None, tables: List[Table] = None) -> List[tuple]:
+        """(table, result) for analytic questions about uploaded tables or the timetable.
+        
+        The rule-based parser goes first; planner(query, tables) is only asked, once, for
+        the tables it couldn't handle, and its model-written query is validated against the
+        table schema. tables is a snapshot taken under the lock; tables are replaced on
+        upload, never changed, so it can be queried without holding the lock.
+        """
+        if tables is None:
+            with self.lock:
+                tables = self.analytic_tables(query)
+        if not tables:
+            return []
+        
+        results = []
+        unparsed = []
+        for table in tables:
+            structured = parse_table_question(table, query)
+            if structured:
+                try:
+                    results.append((table, table.execute(structured)))
+                    continue
+                except (ValueError, KeyError, TypeError) as e:
+                    print(f"Table query rejected for {table.name}: {e}")
+            unparsed.append(table)
+        
+        plan = planner(query, unparsed) if planner and unparsed else None
+        table = next((t for t in unparsed if plan and t.name == plan.get("table")), None)
+        if table:
+            try:
+                results.append((table, table.execute(plan)))
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Planned query rejected for {table.name}: {e}")
+        return results
+    
+    def retrieve(self, query: str, planner=None) -> tuple:
+        """Context (rendered lazily) for a query plus the chunk ids ('doc:<type>' for whole documents) it used"""
+        with self.lock:
+            sections, deps = self._retrieve(query)
+            tables = self.analytic_tables(query)
+            timetable, college_info, timetable_table = self.timetable, self.college_info, self.timetable_table
+        
+        # Aggregates over tables are computed here; only the result goes in the prompt.
+        # Planning may be a model round trip, so it runs on the snapshot without the lock
+        for table, result in self.query_tables(query, planner, tables):
+            sections.append((f"DATA: {table.name}", f"{table.describe()}\nComputed: {format_table_result(result)}"))
+            deps.add("doc:timetable" if table is timetable_table else f"doc:table:{table.name}")
+        
+        # If no specific keywords but documents exist, provide all
+        if not sections:
+            if timetable:
+                sections.append(("TIMETABLE", timetable.prefix(2000)))
+                deps.add("doc:timetable")
+            if college_info:
+                sections.append(("COLLEGE INFO", college_info.prefix(1000)))
+                deps.add("doc:info")
+        
+        return Context(sections), deps
+    
+    def _retrieve(self, query: str) -> tuple:
+        """Sections built from the documents and indexes; call with the lock held"""
+        sections = []   # (header, body); whole documents go in as buffers and are copied once, at the join
+        deps = set()
+        intents = self.router.intents(query)
+        
+        # Named days, subjects or professors only need their precomputed slices
+        timetable_slices = self.timetable_index.lookup(query)
+        if timetable_slices:
+            sections.append(("TIMETABLE", timetable_slices))
+            deps |= self.chunk_index.chunks_for_lines(timetable_slices.splitlines())
+        elif "timetable" in intents:
+            if self.timetable:
+                sections.append(("TIMETABLE", self.timetable))
+                deps.add("doc:timetable")
+        
+        # Syllabus queries - only the matching chunks of a long syllabus
+        if "syllabus" in intents:
+            if self.syllabus:
+                chunk_ids = self.chunk_index.search(query, "syllabus")
+                if chunk_ids:
+                    chunks = "\n\n".join(self.chunk_index.text(c) for c in chunk_ids)
+                    sections.append(("SYLLABUS", chunks))
+                    deps.update(chunk_ids)
+                else:
+                    sections.append(("SYLLABUS", self.syllabus))
+                    deps.add("doc:syllabus")
+        
+        # College info queries
+        if "info" in intents:
+            if self.college_info:
+                sections.append(("COLLEGE INFORMATION", self.college_info))
+                deps.add("doc:info")
+        
+        # Deadlines come from the assignments actually sent, never from the model's guess.
+        # The answer depends on them even while there are none yet ("nothing is due")
+        if "deadlines" in intents and self.assignments:
+            deps.add("doc:assignments")
+            deadlines = self.assignments.describe_due(query)
+            if deadlines:
+                sections.append(("DEADLINES", deadlines))
+        
+        return sections, deps
+    
+    def memory_usage(self) -> dict:
+        """Bytes held by documents and their derived indexes"""
+        def text_bytes(values):
+            return sum(sys.getsizeof(v) for v in values)
+        
+        tables = [*self.tables.values(), self.timetable_table]
+        return {
+            "documents": {doc_type: len(getattr(self, attr)) for doc_type, attr in self.DOC_ATTRS.items()},
+            "chunks": {"count": len(self.chunk_index.chunks),
+                       "own_text_bytes": text_bytes(c["text"] for c in self.chunk_index.chunks.values() if "text" in c),
+                       "spans": sum("span" in c for c in self.chunk_index.chunks.values())},
+            "timetable_slices": text_bytes(l for lines in self.timetable_index.slices.values() for l in lines),
+            "tables": {t.name: sum(c.nbytes + (text_bytes(c) if c.dtype == object else 0)
+                                   for c in t.columns.values()) for t in tables if t},
+        }
+
+# ==================== INGESTION PIPELINE ====================
+
+WARM_QUESTIONS = {
+    "timetable": ["What classes are on {day}?"],
+    "syllabus": ["What topics are covered in the syllabus?"],
+    "info": ["What are the college rules?", "What is the attendance requirement?"],
+}
+
+class IngestJob:
+    def __init__(self, job_id: str, doc_type: str, file_path: str):
+        self.job_id = job_id
+        self.doc_type = doc_type
+        self.file_path = file_path
+        self.state = "queued"
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.stages = OrderedDict((name, {"status": "pending", "ms": None}) for name in IngestPipeline.STAGES)
+        self.outputs = {}
+    
+    @property
+    def key(self) -> str:
+        """What the upload replaces; a newer job for the same key supersedes this one"""
+        if self.file_path.lower().endswith('.csv'):
+            return "table:" + os.path.splitext(os.path.basename(self.file_path))[0]
+        return self.doc_type
+    
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "doc_type": self.doc_type,
+            "filename": os.path.basename(self.file_path),
+            "state": self.state,
+            "error": self.error,
+            "created": datetime.fromtimestamp(self.created).isoformat(),
+            "elapsed_ms": round(((self.finished or time.time()) - self.created) * 1000, 1),
+            "stages": self.stages,
+        }
+
+class IngestPipeline:
+    """Upload processing as a DAG of stages on a background thread pool.
+    
+    extract -> normalize -> (chunk, parse_timetable) -> index -> warm. chunk and
+    parse_timetable are independent and run side by side; index only swaps their
+    results in, so the document lock is held briefly; warm answers likely questions
+    so the first real query after an upload is a cache hit.
+    """
+    
+    STAGES = {
+        "extract": (),
+        "normalize": ("extract",),
+        "chunk": ("normalize",),
+        "parse_timetable": ("normalize",),
+        "index": ("chunk", "parse_timetable"),
+        "warm": ("index",),
+    }
+    
+    def __init__(self, doc_store, warm=None, workers: int = 2, history: int = 20):
+        self.doc_store = doc_store
+        self.warm_question = warm
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self.jobs = OrderedDict()   # job id -> IngestJob, newest last
+        self.latest = {}            # job key -> newest job id
+        self.history = history
+        self.listeners = []         # called with each finished IngestJob
+        self._tasks = set()
+    
+    def submit(self, file_path: str, doc_type: str) -> IngestJob:
+        job = IngestJob(uuid.uuid4().hex[:12], doc_type, file_path)
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > self.history:
+            self.jobs.popitem(last=False)
+        self.latest[job.key] = job.job_id
+        task = asyncio.create_task(self.run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+    
+    async def run(self, job: IngestJob):
+        loop = asyncio.get_running_loop()
+        job.state = "running"
+        pending = dict(self.STAGES)
+        running = {}
+        while pending or running:
+            for name, deps in list(pending.items()):
+                if all(job.stages[d]["status"] in ("done", "skipped") for d in deps):
+                    del pending[name]
+                    running[loop.run_in_executor(self.pool, self._run_stage, job, name)] = name
+            if not running:
+                break
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                running.pop(future)
+        
+        for name in pending:
+            job.stages[name]["status"] = "cancelled"
+        if job.state == "running":
+            job.state = "failed" if job.error else "done"
+        job.finished = time.time()
+        job.outputs.clear()
+        print(f"📥 {job.doc_type} ({os.path.basename(job.file_path)}): {job.state} in "
+              f"{(job.finished - job.created) * 1000:.0f} ms")
+        for listener in self.listeners:
+            listener(job)
+    
+    def _run_stage(self, job: IngestJob, name: str):
+        stage = job.stages[name]
+        stage["status"] = "running"
+        started = time.perf_counter()
+        try:
+            stage["status"] = "done" if getattr(self, f"_{name}")(job) is not False else "skipped"
+        except Exception as e:
+            stage["status"] = "failed"
+            job.error = f"{name}: {e}"
+            print(f"Ingestion error in {name}: {e}")
+        stage["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    
+    def _extract(self, job: IngestJob):
+        if job.key.startswith("table:"):
+            job.outputs["table"] = self.doc_store.read_table(job.file_path)
+            return
+        if job.doc_type not in DocumentStore.DOC_ATTRS:
+            raise ValueError(f"{job.doc_type} uploads must be CSV files")
+        content = self.doc_store.extract(job.file_path)
+        if content is None:
+            raise ValueError("Unsupported file type")
+        job.outputs["raw"] = content
+    
+    def _normalize(self, job: IngestJob):
+        if "table" in job.outputs:
+            return False
+        job.outputs["content"] = self.doc_store.compact(job.outputs.pop("raw"), job.doc_type)
+    
+    def _chunk(self, job: IngestJob):
+        if "table" in job.outputs:
+            return False
+        job.outputs["prepared"] = ChunkIndex.prepare(job.outputs["content"])
+    
+    def _parse_timetable(self, job: IngestJob):
+        if job.doc_type != "timetable" or "table" in job.outputs:
+            return False
+        job.outputs["timetable"] = TimetableIndex(job.outputs["content"])
+    
+    def _index(self, job: IngestJob):
+        if self.latest.get(job.key) != job.job_id:
+            job.state = "superseded"
+            return False
+        if "table" in job.outputs:
+            self.doc_store.load_table(job.file_path, table=job.outputs["table"])
+        else:
+            self.doc_store.set_document(job.doc_type, job.outputs["content"],
+                                        prepared=job.outputs.get("prepared"),
+                                        timetable=job.outputs.get("timetable"))
+    
+    def _warm(self, job: IngestJob):
+        if job.state == "superseded":
+            return False
+        table = job.outputs.get("table")
+        if table:
+            # Build every column's filter index now instead of on the first question
+            for column, kind in table.types.items():
+                table.column_lower(column) if kind == "text" else table.sorted_index(column)
+            return
+        if not self.warm_question:
+            return False
+        questions = []
+        for template in WARM_QUESTIONS.get(job.doc_type, []):
+            if "{day}" in template:
+                days = [s[4:] for s in self.doc_store.timetable_index.slices if s.startswith("day:")]
+                questions.extend(template.format(day=day.title()) for day in days)
+            else:
+                questions.append(template)
+        for i, question in enumerate(questions, 1):
+            if self.warm_question(question) is False:
+                # Live traffic holds the slots; its first askers fill the cache instead
+                job.stages["warm"]["progress"] = f"{i - 1}/{len(questions)} (server busy)"
+                break
+            job.stages["warm"]["progress"] = f"{i}/{len(questions)}"
+
+# ==================== RESPONSE CACHE ====================
+
+class ResponseCache:
+    """LRU cache of generated answers keyed by normalized question"""
+    
+    # Answers relative to the current time ("what's due this week") are never cached
+    VOLATILE_DEPS = {"doc:assignments"}
+    # Questions that resolve to a different day depending on when they are asked
+    RELATIVE_DATE = re.compile(r'today|tonight|tomorrow|yesterday|this week|next week')
+    
+    def __init__(self, max_entries: int = 2048, ttl_seconds: int = 6 * 3600,
+                 shared: SharedState = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # In multi-worker mode SQLite is the second level behind the in-process LRU
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(question.lower().split()).rstrip("?!. ")
+    
+    @classmethod
+    def key(cls, question: str) -> str:
+        """Normalized question, tagged with the date it was asked if it says "today", "tomorrow" etc."""
+        key = cls.normalize(question)
+        if cls.RELATIVE_DATE.search(key):
+            # A tab can't survive normalize(), so it separates the date unambiguously
+            key += "\t" + date.today().isoformat()
+        return key
+    
+    def get(self, question: str) -> Optional[str]:
+        key = self.key(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self.shared:
+                entry = self.shared.cache_get(key)
+                if entry is not None:
+                    self._entries[key] = entry = (entry[0], entry[1], frozenset(entry[2]) if entry[2] is not None else None)
+            if entry is None or time.time() - entry[1] > self.ttl_seconds:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:   # a shared hit may have added one
+                self._entries.popitem(last=False)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, question: str, answer: str, deps: set = None):
+        """deps are the chunk ids the answer's context came from; None means 'everything'"""
+        if deps and self.VOLATILE_DEPS.intersection(deps):
+            return
+        key = self.key(question)
+        created = time.time()
+        with self._lock:
+            self._entries[key] = (answer, created, frozenset(deps) if deps is not None else None)
+            self._entries.move_to_end(key)
+            if self.shared:
+                self.shared.cache_put(key, answer, created, deps)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self.shared:
+                self.shared.cache_clear()
+    
+    def resize(self, max_entries: int, ttl_seconds: int):
+        """Apply new limits, evicting least recently used answers only when shrinking"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl_seconds = ttl_seconds
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def on_document_change(self, doc_type: str, changes: dict):
+        """Drop only answers built from changed chunks or that new chunks may now answer"""
+        stale = set(changes["removed"]) | {f"doc:{doc_type}"}
+        
+        def is_stale(key, deps):
+            question = key.partition("\t")[0]
+            return deps is None or stale.intersection(deps) or ChunkIndex.terms(question) & changes["added_terms"]
+        
+        with self._lock:
+            for key, (_, _, deps) in list(self._entries.items()):
+                if is_stale(key, deps):
+                    del self._entries[key]
+            # Only the worker that took the upload cleans the shared table
+            if self.shared and changes.get("local", True):
+                self.shared.cache_delete([key for key, deps in self.shared.cache_entries() if is_stale(key, deps)])
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+# ==================== CONVERSATION SESSIONS ====================
+
+class SessionStore:
+    """Bounded LRU of server-side chat histories, persisted through SharedState when enabled"""
+    
+    def __init__(self, max_sessions: int = 1000, window: int = 4, summary_chars: int = 1200,
+                 shared: SharedState = None):
+        self.max_sessions = max_sessions
+        self.window = window              # recent messages kept verbatim
+        self.summary_chars = summary_chars
+        self.shared = shared
+        self._sessions = OrderedDict()    # session id -> {"summary": str, "messages": [[role, content]]}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+    
+    def _load(self, session_id: str) -> dict:
+        session = self._sessions.get(session_id)
+        if session is None and self.shared:
+            session = self.shared.session_get(session_id)
+        if session is None:
+            session = {"summary": "", "messages": []}
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session
+    
+    def history(self, session_id: str) -> List[ChatMessage]:
+        """Compacted history: a summary of older turns followed by the recent window"""
+        with self._lock:
+            session = self._load(session_id)
+            history = []
+            if session["summary"]:
+                history.append(ChatMessage(role="system", content=f"Earlier in this conversation:\n{session['summary']}"))
+            history.extend(ChatMessage(role=role, content=content) for role, content in session["messages"])
+            return history
+    
+    def append(self, session_id: str, user_message: str, assistant_message: str):
+        """Record one turn; messages leaving the window are folded into the summary once, here"""
+        with self._lock:
+            session = self._load(session_id)
+            session["messages"].extend([["user", user_message], ["assistant", assistant_message]])
+            while len(session["messages"]) > self.window:
+                role, content = session["messages"].pop(0)
+                line = " ".join(content.split())[:150]
+                session["summary"] = f"{session['summary']}\n{role}: {line}".strip()[-self.summary_chars:]
+            if self.shared:
+                self.shared.session_put(session_id, session)
+    
+    def resize(self, max_sessions: int, window: int):
+        """Longer histories are folded into the summary on their next append"""
+        with self._lock:
+            self.max_sessions = max_sessions
+            self.window = window
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+# ==================== PREFETCH ====================
+
+class PrefetchCache:
+    """Retrieval started from debounced partial input, at most one entry per session.
+    
+    /query takes the entry when its message normalizes to the prefetched text, awaiting it
+    if it is still running, so generation starts without a retrieval round trip.
+    Lives on the event loop; document changes only bump a counter, so ingestion threads
+    never touch the entries.
+    """
+    
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # session id -> (normalized text, task, started, generation)
+        self.generation = 0
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def _fresh(self, entry: tuple) -> bool:
+        return time.monotonic() - entry[2] <= self.ttl_seconds and entry[3] == self.generation
+    
+    @staticmethod
+    def _failed(entry: tuple) -> bool:
+        task = entry[1]
+        return task.done() and (task.cancelled() or task.exception() is not None)
+    
+    def _drop(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry:
+            entry[1].cancel()
+    
+    def start(self, session_id: str, text: str, retrieve) -> bool:
+        """Run retrieve() for text unless that text is already prefetched for the session.
+        
+        The session's previous prefetch is cancelled, so each client has at most one
+        retrieval in flight for the text it typed last.
+        """
+        key = ResponseCache.normalize(text)
+        entry = self._entries.get(session_id)
+        if entry and entry[0] == key and self._fresh(entry) and not self._failed(entry):
+            return False
+        self._drop(session_id)
+        task = asyncio.ensure_future(retrieve())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._entries[session_id] = (key, task, time.monotonic(), self.generation)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+        self.started += 1
+        return True
+    
+    async def take(self, session_id: Optional[str], text: str) -> Optional[tuple]:
+        """The prefetched (context, deps) for this exact message, or None"""
+        entry = self._entries.pop(session_id, None) if session_id else None
+        if entry is None:
+            return None
+        if entry[0] != ResponseCache.normalize(text) or not self._fresh(entry):
+            self.misses += 1
+            return None
+        try:
+            result = await entry[1]
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+    
+    def on_document_change(self, doc_type: str, changes: dict):
+        self.generation += 1
+    
+    def resize(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+    
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "started": self.started, "hits": self.hits, "misses": self.misses}
+
+# ==================== NOTIFICATIONS ====================
+
+class NotificationHub:
+    """Server events fanned out to connected WebSocket clients.
+    
+    publish() may be called from any thread (ingestion pool, assignment delivery); each
+    subscriber's queue is fed on its own event loop. Queues are bounded: a slow client
+    loses its oldest notifications instead of holding up the publisher.
+    """
+    
+    def __init__(self, max_queued: int = 100):
+        self.max_queued = max_queued
+        self._subscribers = {}   # queue -> (event loop, email or None)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+    
+    def subscribe(self, email: Optional[str] = None) -> asyncio.Queue:
+        queue = asyncio.Queue(self.max_queued)
+        with self._lock:
+            self._subscribers[queue] = (asyncio.get_running_loop(), email)
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+    
+    def publish(self, event: str, data: dict, recipients: List[str] = None):
+        """Send to every subscriber, or only those whose email is in recipients"""
+        message = {"type": "notification", "event": event, "data": data}
+        wanted = set(recipients) if recipients is not None else None
+        with self._lock:
+            targets = [(queue, loop) for queue, (loop, email) in self._subscribers.items()
+                       if wanted is None or email in wanted]
+        self.published += 1
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                pass   # that client's loop has shut down
+    
+    def _offer(self, queue: asyncio.Queue, message: dict):
+        if queue.full():
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait(message)
+    
+    def stats(self) -> dict:
+        return {"connections": len(self._subscribers), "published": self.published, "dropped": self.dropped}
+
+def notification_token(email: str) -> Optional[str]:
+    """HMAC of a normalized address that lets a /ws/chat client subscribe to its notifications"""
+    secret = config.settings.server.notification_secret
+    if not secret:
+        return None
+    return hmac.new(secret.encode('utf-8'), email.encode('utf-8'), hashlib.sha256).hexdigest()
+
+# ==================== ADMISSION CONTROL ====================
+
+# Priority order, highest first. rate/burst: token bucket per client (requests per second);
+# share: fraction of the model slots the class may fill, so lower classes always leave
+# room for higher ones; queue/wait: waiters allowed and seconds they may wait before being shed.
+ADMISSION_CLASSES = OrderedDict([
+    ("interactive", {"rate": 2.0, "burst": 20, "share": 1.0, "queue": 64, "wait": 30.0}),
+    ("chat", {"rate": 0.5, "burst": 6, "share": 0.75, "queue": 32, "wait": 15.0}),
+    # Batch questions wait for a slot instead of failing halfway through a stream
+    ("batch", {"rate": 0.05, "burst": 2, "share": 0.5, "queue": 256, "wait": None}),
+    # Speculative work never queues: it runs on a spare slot or not at all
+    ("prefetch", {"rate": 3.0, "burst": 10, "share": 0.25, "queue": 0, "wait": None}),
+])
+
+# "METHOD /route" -> admission class; anything else (status pages, reads) is not limited
+ENDPOINT_CLASSES = {
+    "POST /send-assignment": "interactive",
+    "POST /upload/{doc_type}": "interactive",
+    "POST /attachments": "interactive",
+    "POST /rosters": "interactive",
+    "DELETE /rosters/{roster_id}": "interactive",
+    "DELETE /assignments/{assignment_id}": "interactive",
+    "DELETE /reminders/{reminder_id}": "interactive",
+    "POST /admin/config/reload": "interactive",
+    "POST /query": "chat",
+    "POST /query/agent": "chat",
+    "POST /query/prefetch": "prefetch",
+    "POST /query/batch": "batch",
+}
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+    
+    def take(self, now: float) -> float:
+        """0 when a request may go ahead, otherwise seconds until it could"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class AdmissionControl:
+    """Per-client rate limits plus a priority gate in front of the model slots.
+    
+    A request first takes a token from its client's bucket for its class (429 when empty),
+    then a slot. Classes may only fill their share of the capacity, and freed slots go to
+    the highest-priority waiter, so a flood of student chat can't starve a professor's
+    action. Full queues and overlong waits are shed with 503; both carry Retry-After.
+    """
+    
+    def __init__(self, capacity: int, classes: dict = None, max_clients: int = 10000):
+        self.classes = classes or ADMISSION_CLASSES
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()   # (client, class) -> TokenBucket, least recently used first
+        self.waiting = {name: deque() for name in self.classes}   # (loop, future) per waiter
+        self.in_flight = {name: 0 for name in self.classes}
+        self.hold_seconds = {name: 1.0 for name in self.classes}  # moving average slot hold time
+        self.counters = {name: {"admitted": 0, "rate_limited": 0, "queue_full": 0, "timed_out": 0}
+                         for name in self.classes}
+        self.waits = {name: deque(maxlen=256) for name in self.classes}
+        self._lock = threading.Lock()
+        self.resize(capacity)
+    
+    def resize(self, capacity: int):
+        with self._lock:
+            self.capacity = max(1, capacity)
+            self.ceilings = {name: max(1, int(self.capacity * spec["share"]))
+                             for name, spec in self.classes.items() if spec["share"] is not None}
+            self._grant()
+    
+    def check_rate(self, client: str, name: str):
+        spec = self.classes[name]
+        with self._lock:
+            bucket = self.buckets.get((client, name))
+            if bucket is None:
+                bucket = self.buckets[(client, name)] = TokenBucket(spec["rate"], spec["burst"])
+                while len(self.buckets) > self.max_clients:
+                    self.buckets.popitem(last=False)
+            self.buckets.move_to_end((client, name))
+            retry_after = bucket.take(time.monotonic())
+            if retry_after:
+                self.counters[name]["rate_limited"] += 1
+                raise AdmissionRejected(429, f"Too many {name} requests", retry_after)
+    
+    def has_capacity(self, name: str) -> bool:
+        return not self.waiting[name] and sum(self.in_flight.values()) < self.ceilings[name]
+    
+    def _estimate(self, name: str) -> float:
+        """Seconds until a new waiter of this class would likely get a slot"""
+        ahead = 0
+        for other in self.ceilings:
+            ahead += len(self.waiting[other])
+            if other == name:
+                break
+        return self.hold_seconds[name] * (ahead + 1) / self.ceilings[name]
+    
+    def _grant(self):
+        """Hand freed slots to waiters, highest priority first; called with the lock held"""
+        for name in self.ceilings:
+            queue = self.waiting[name]
+            while queue and sum(self.in_flight.values()) < self.ceilings[name]:
+                loop, future = queue.popleft()
+                self.in_flight[name] += 1
+                loop.call_soon_threadsafe(self._deliver, future, name)
+    
+    def _deliver(self, future: asyncio.Future, name: str):
+        if future.done():
+            self.release(name)   # the waiter gave up just as it was granted
+        else:
+            future.set_result(None)
+    
+    async def acquire(self, name: str):
+        spec = self.classes[name]
+        started = time.monotonic()
+        with self._lock:
+            if self.has_capacity(name):
+                self.in_flight[name] += 1
+                self.counters[name]["admitted"] += 1
+                self.waits[name].append(0.0)
+                return
+            if len(self.waiting[name]) >= spec["queue"]:
+                self.counters[name]["queue_full"] += 1
+                raise AdmissionRejected(503, f"Server busy ({name} queue full)", self._estimate(name))
+            entry = (asyncio.get_running_loop(), asyncio.get_running_loop().create_future())
+            self.waiting[name].append(entry)
+        
+        try:
+            await asyncio.wait_for(entry[1], spec["wait"])
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if entry in self.waiting[name]:
+                    self.waiting[name].remove(entry)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters[name]["timed_out"] += 1
+                    raise AdmissionRejected(503, f"Server busy ({name} wait exceeded)", self._estimate(name))
+            raise
+        with self._lock:
+            self.counters[name]["admitted"] += 1
+            self.waits[name].append(time.monotonic() - started)
+    
+    def try_acquire(self, name: str) -> bool:
+        """Take a free slot without waiting, for work on threads that can simply be skipped"""
+        with self._lock:
+            if not self.has_capacity(name):
+                return False
+            self.in_flight[name] += 1
+            self.counters[name]["admitted"] += 1
+            self.waits[name].append(0.0)
+            return True
+    
+    def release(self, name: str, held: float = None):
+        with self._lock:
+            self.in_flight[name] -= 1
+            if held is not None:
+                self.hold_seconds[name] = 0.8 * self.hold_seconds[name] + 0.2 * held
+            self._grant()
+    
+    @contextlib.asynccontextmanager
+    async def slot(self, name: str):
+        await self.acquire(name)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(name, time.monotonic() - started)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {}
+            for name, counters in self.counters.items():
+                waits = sorted(self.waits[name])
+                classes[name] = {
+                    **counters,
+                    "in_flight": self.in_flight[name],
+                    "queued": len(self.waiting[name]),
+                    "ceiling": self.ceilings.get(name),
+                    "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    "wait_ms_p95": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None,
+                }
+            return {"capacity": self.capacity, "in_use": sum(self.in_flight.values()),
+                    "clients": len({client for client, _ in self.buckets}), "classes": classes}
+
+# ==================== REMINDER SCHEDULER ====================
+
+REMINDER_OFFSETS = [(timedelta(hours=24), "24 hours"), (timedelta(hours=1), "1 hour")]
+
+class ReminderScheduler:
+    """Assignment reminders on a hashed timing wheel, persisted in SQLite.
+    
+    Insert and cancel are O(1): a reminder lives in one wheel slot (fire minute mod
+    slot count) and is removed from its slot directly. Each tick only visits the slots
+    that came due; reminders more than one revolution away simply stay in their slot.
+    """
+    
+    def __init__(self, path: str, email_manager: EmailManager, tick_seconds: int = 60, slots: int = 1440):
+        self.email_manager = email_manager
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self.wheel = [set() for _ in range(slots)]
+        self.pending = {}     # reminder id -> row dict
+        self.cursor = int(time.time() // tick_seconds)
+        self.sent = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS reminders (
+                id TEXT PRIMARY KEY, fire_at REAL, due_at REAL, recipients TEXT,
+                subject TEXT, assignment_title TEXT, due_date TEXT, due_time TEXT, time_left TEXT
+            )
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self._load()
+    
+    def _load(self):
+        columns = ["id", "fire_at", "due_at", "recipients", "subject", "assignment_title",
+                   "due_date", "due_time", "time_left"]
+        for row in self.conn.execute(f"SELECT {', '.join(columns)} FROM reminders"):
+            reminder = dict(zip(columns, row))
+            reminder["recipients"] = json.loads(reminder["recipients"])
+            self._insert(reminder)
+        if self.pending:
+            print(f"⏰ Loaded {len(self.pending)} pending reminders")
+    
+    def _insert(self, reminder: dict):
+        # Overdue reminders (server was down) land in the next tick's slot
+        tick = max(int(reminder["fire_at"] // self.tick_seconds), self.cursor)
+        reminder["slot"] = tick % self.slots
+        self.pending[reminder["id"]] = reminder
+        self.wheel[reminder["slot"]].add(reminder["id"])
+    
+    def resize(self, slots: int):
+        """Rebuild the wheel with a new slot count, keeping every pending reminder"""
+        with self._lock:
+            if slots == self.slots:
+                return
+            self.slots = slots
+            self.wheel = [set() for _ in range(slots)]
+            for reminder in self.pending.values():
+                self._insert(reminder)
+    
+    def schedule_assignment(self, assignment, due_datetime: datetime) -> List[str]:
+        """Queue the 24h and 1h reminders that are still in the future; due_datetime should
+        be aware (assignment_due()), a naive one is read in the server's time zone"""
+        due_at = due_datetime.timestamp()
+        ids = []
+        with self._lock, self.conn:
+            for offset, time_left in REMINDER_OFFSETS:
+                fire_at = due_at - offset.total_seconds()
+                if fire_at <= time.time():
+                    continue
+                reminder = {
+                    "id": uuid.uuid4().hex, "fire_at": fire_at, "due_at": due_at,
+                    "recipients": assignment.student_emails, "subject": assignment.subject,
+                    "assignment_title": assignment.assignment_title, "due_date": assignment.due_date,
+                    "due_time": assignment.due_time, "time_left": time_left,
+                }
+                self.conn.execute("INSERT INTO reminders VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+                    reminder["id"], fire_at, due_at, json.dumps(reminder["recipients"]), reminder["subject"],
+                    reminder["assignment_title"], reminder["due_date"], reminder["due_time"], time_left))
+                self._insert(reminder)
+                ids.append(reminder["id"])
+        return ids
+    
+    def cancel(self, reminder_id: str) -> bool:
+        with self._lock, self.conn:
+            reminder = self.pending.pop(reminder_id, None)
+            if reminder is None:
+                return False
+            self.wheel[reminder["slot"]].discard(reminder_id)
+            self.conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+            return True
+    
+    def _claim(self, reminder_id: str) -> bool:
+        """Delete the row; only the process whose delete succeeds sends (multi-worker safe)"""
+        with self.conn:
+            return self.conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,)).rowcount == 1
+    
+    def due_reminders(self, now: float = None) -> List[dict]:
+        """Advance the wheel to now and pop every reminder that should fire"""
+        now = now or time.time()
+        current = int(now // self.tick_seconds)
+        fired = []
+        with self._lock:
+            # After a long pause every slot has to be looked at once
+            ticks = range(self.cursor, current + 1) if current - self.cursor < self.slots else range(self.slots)
+            for tick in ticks:
+                bucket = self.wheel[tick % self.slots]
+                for reminder_id in [r for r in bucket if self.pending[r]["fire_at"] <= now]:
+                    bucket.discard(reminder_id)
+                    reminder = self.pending.pop(reminder_id)
+                    if self._claim(reminder_id) and reminder["due_at"] > now:
+                        fired.append(reminder)
+            self.cursor = current
+        return fired
+    
+    def fire(self, reminder: dict):
+        fields = (reminder["assignment_title"], reminder["subject"],
+                  reminder["due_date"], reminder["due_time"], reminder["time_left"])
+        if self.email_manager.send_email(
+            reminder["recipients"],
+            f"⏰ Reminder: {reminder['subject']} - {reminder['assignment_title']} due in {reminder['time_left']}",
+            self.email_manager.create_reminder_email_body(*fields),
+            text_body=self.email_manager.create_reminder_email_text(*fields)
+        ):
+            self.sent += 1
+    
+    async def run(self):
+        while True:
+            for reminder in self.due_reminders():
+                await asyncio.to_thread(self.fire, reminder)
+            await asyncio.sleep(self.tick_seconds / 2)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            upcoming = min((r["fire_at"] for r in self.pending.values()), default=None)
+        return {
+            "pending": len(self.pending),
+            "sent": self.sent,
+            "next_fire_at": datetime.fromtimestamp(upcoming).isoformat() if upcoming else None,
+        }
+
+# ==================== ROSTERS ====================
+
+class RosterStore:
+    """Named class rosters imported from CSV, deduplicated and stored in SQLite"""
+    
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rosters (
+                roster_id TEXT PRIMARY KEY, name TEXT, created REAL
+            );
+            CREATE TABLE IF NOT EXISTS roster_members (
+                roster_id TEXT, email TEXT, PRIMARY KEY (roster_id, email)
+            ) WITHOUT ROWID;
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _email_column(header: List[str]) -> Optional[int]:
+        """Index of the email column when the row is a header; a row holding an address is data"""
+        if any(normalize_email(cell) for cell in header):
+            return None
+        for i, column in enumerate(header):
+            if 'email' in column.lower() or 'e-mail' in column.lower():
+                return i
+        return None
+    
+    def import_csv(self, name: str, stream) -> dict:
+        """Read a CSV text stream row by row; the email column is found from the header,
+        or every cell is checked when there is no header"""
+        reader = csv.reader(stream)
+        stats = {"rows": 0, "addresses": 0, "invalid": 0, "invalid_samples": []}
+        
+        def addresses():
+            column = None
+            for row in reader:
+                if column is None and stats["rows"] == 0:
+                    column = self._email_column(row)
+                    if column is not None:
+                        continue
+                stats["rows"] += 1
+                cells = [row[column]] if column is not None and column < len(row) else row
+                found = [e for e in map(normalize_email, cells) if e]
+                if not found:
+                    stats["invalid"] += 1
+                    if len(stats["invalid_samples"]) < 5:
+                        stats["invalid_samples"].append(",".join(row)[:100])
+                stats["addresses"] += len(found)
+                yield from found
+        
+        roster_id = uuid.uuid4().hex[:12]
+        with self._lock, self.conn:
+            self.conn.execute("INSERT INTO rosters VALUES (?, ?, ?)", (roster_id, name, time.time()))
+            self.conn.executemany("INSERT OR IGNORE INTO roster_members VALUES (?, ?)",
+                                  ((roster_id, email) for email in addresses()))
+            size = self.conn.execute("SELECT COUNT(*) FROM roster_members WHERE roster_id = ?",
+                                     (roster_id,)).fetchone()[0]
+        return {"roster_id": roster_id, "name": name, "students": size,
+                "duplicates": stats["addresses"] - size, **stats}
+    
+    def members(self, roster_id: str) -> List[str]:
+        with self._lock:
+            if not self.conn.execute("SELECT 1 FROM rosters WHERE roster_id = ?", (roster_id,)).fetchone():
+                raise ValueError(f"Unknown roster: {roster_id}")
+            return [row[0] for row in self.conn.execute(
+                "SELECT email FROM roster_members WHERE roster_id = ?", (roster_id,))]
+    
+    def list(self) -> List[dict]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT r.roster_id, r.name, r.created, COUNT(m.email) FROM rosters r "
+                "LEFT JOIN roster_members m ON m.roster_id = r.roster_id GROUP BY r.roster_id ORDER BY r.created"
+            ).fetchall()
+        return [{"roster_id": rid, "name": name, "created": datetime.fromtimestamp(created).isoformat(),
+                 "students": size} for rid, name, created, size in rows]
+    
+    def delete(self, roster_id: str) -> bool:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM roster_members WHERE roster_id = ?", (roster_id,))
+            return self.conn.execute("DELETE FROM rosters WHERE roster_id = ?", (roster_id,)).rowcount == 1
+
+# ==================== ASSIGNMENT REGISTRY ====================
+
+DUE_DEFAULT_DAYS = 14
+
+def college_time(value: datetime) -> datetime:
+    """Naive datetimes (API parameters, tool arguments) are wall-clock times at the college"""
+    return value if value.tzinfo else value.replace(tzinfo=college_zone())
+
+def due_window(query: str, now: datetime = None) -> tuple:
+    """(start, end, label) for the period a deadline question asks about; "today" is the college's"""
+    now = now or datetime.now(college_zone())
+    q = query.lower()
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_end = day_start + timedelta(days=7 - now.weekday())
+    
+    if re.search(r'\b(overdue|missed|past due|late)\b', q):
+        return now - timedelta(days=30), now, "in the last 30 days"
+    if 'today' in q or 'tonight' in q:
+        return now, day_start + timedelta(days=1), "today"
+    if 'tomorrow' in q:
+        return day_start + timedelta(days=1), day_start + timedelta(days=2), "tomorrow"
+    if 'next week' in q:
+        return week_end, week_end + timedelta(days=7), "next week"
+    if 'this week' in q or 'weekend' in q:
+        return now, week_end, "this week"
+    if 'month' in q:
+        month_end = (day_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        return now, month_end, "this month"
+    for i, day in enumerate(WEEKDAYS):
+        if re.search(rf'\b{day}\b', q):
+            start = day_start + timedelta(days=(i - now.weekday()) % 7)
+            return start, start + timedelta(days=1), f"on {day.title()}"
+    return now, now + timedelta(days=DUE_DEFAULT_DAYS), f"in the next {DUE_DEFAULT_DAYS} days"
+
+class AssignmentRegistry:
+    """Every assignment sent out, persisted in SQLite and indexed in memory by due time,
+    subject and recipient.
+    
+    Due times are points, so a sorted array searched with bisect gives the range lookups
+    an interval tree would, at O(log n) plus the matches. Subject and student filters start
+    from whichever of the range slice or the per-key id set is smaller.
+    """
+    
+    COLUMNS = ["seq", "id", "due_at", "due_date", "due_time", "subject", "title", "description",
+               "recipients", "created"]
+    
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS assignments (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE, due_at REAL, due_date TEXT,
+                due_time TEXT, subject TEXT, title TEXT, description TEXT, recipients TEXT, created REAL
+            )
+        """)
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self.listeners = []   # called with the public record after an assignment is added
+        self.change_listeners = []   # called with no arguments after an assignment is added or removed
+        self._reset()
+        self._sync()
+        if self.items:
+            print(f"📚 Loaded {len(self.items)} assignments")
+    
+    def _reset(self):
+        self.due_at = []        # sorted due timestamps
+        self.order = []         # assignment ids, parallel to due_at
+        self.items = {}         # id -> record
+        self.by_subject = {}    # lowercase subject -> ids
+        self.by_recipient = {}  # email -> ids
+        self.last_seq = 0
+        self.data_version = None
+    
+    def _insert(self, record: dict):
+        i = bisect.bisect_right(self.due_at, record["due_at"])
+        self.due_at.insert(i, record["due_at"])
+        self.order.insert(i, record["id"])
+        self.items[record["id"]] = record
+        self.by_subject.setdefault(record["subject"].lower(), set()).add(record["id"])
+        for email in record["recipients"]:
+            self.by_recipient.setdefault(email, set()).add(record["id"])
+        self.last_seq = max(self.last_seq, record.pop("seq", 0))
+    
+    def _discard(self, assignment_id: str) -> Optional[dict]:
+        record = self.items.pop(assignment_id, None)
+        if record is None:
+            return None
+        i = bisect.bisect_left(self.due_at, record["due_at"])
+        while self.order[i] != assignment_id:
+            i += 1
+        del self.due_at[i], self.order[i]
+        self.by_subject[record["subject"].lower()].discard(assignment_id)
+        for email in record["recipients"]:
+            self.by_recipient[email].discard(assignment_id)
+        return record
+    
+    def _sync(self):
+        """Pick up assignments other workers added or removed since the last look"""
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            return
+        self.data_version = version
+        for row in self.conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM assignments WHERE seq > ?",
+                                     (self.last_seq,)):
+            record = dict(zip(self.COLUMNS, row))
+            record["recipients"] = json.loads(record["recipients"])
+            self._insert(record)
+        if self.conn.execute("SELECT COUNT(*) FROM assignments").fetchone()[0] != len(self.items):
+            # Something was deleted elsewhere; rare enough to just rebuild
+            self._reset()
+            self._sync()
+    
+    def add(self, assignment, due_datetime: datetime) -> str:
+        record = {
+            "id": uuid.uuid4().hex[:12], "due_at": college_time(due_datetime).timestamp(),
+            "due_date": assignment.due_date, "due_time": assignment.due_time,
+            "subject": assignment.subject, "title": assignment.assignment_title,
+            "description": assignment.description, "recipients": list(assignment.student_emails),
+            "created": time.time(),
+        }
+        with self._lock, self.conn:
+            self._sync()
+            cursor = self.conn.execute(
+                f"INSERT INTO assignments ({', '.join(self.COLUMNS[1:])}) VALUES ({', '.join('?' * 9)})",
+                (record["id"], record["due_at"], record["due_date"], record["due_time"], record["subject"],
+                 record["title"], record["description"], json.dumps(record["recipients"]), record["created"]))
+            record["seq"] = cursor.lastrowid
+            self._insert(record)
+        for listener in self.listeners:
+            listener(self.public(record), record["recipients"])
+        for listener in self.change_listeners:
+            listener()
+        return record["id"]
+    
+    def remove(self, assignment_id: str) -> bool:
+        with self._lock, self.conn:
+            self._sync()
+            if self._discard(assignment_id) is None:
+                return False
+            self.conn.execute("DELETE FROM assignments WHERE id = ?", (assignment_id,))
+        for listener in self.change_listeners:
+            listener()
+        return True
+    
+    def due(self, start: datetime, end: datetime, student: str = None, subject: str = None,
+            limit: int = None) -> List[dict]:
+        """Assignments due in [start, end), soonest first"""
+        lo_at, hi_at = college_time(start).timestamp(), college_time(end).timestamp()
+        with self._lock:
+            self._sync()
+            lo = bisect.bisect_left(self.due_at, lo_at)
+            hi = bisect.bisect_left(self.due_at, hi_at)
+            filters = [self.by_recipient.get(student.lower(), set()) if student else None,
+                       self.by_subject.get(subject.lower(), set()) if subject else None]
+            filters = sorted((f for f in filters if f is not None), key=len)
+            
+            if filters and len(filters[0]) < hi - lo:
+                ids = sorted((c for c in filters[0] if lo_at <= self.items[c]["due_at"] < hi_at),
+                             key=lambda c: self.items[c]["due_at"])
+                filters = filters[1:]
+            else:
+                ids = self.order[lo:hi]
+            ids = [c for c in ids if all(c in f for f in filters)]
+            return [self.public(self.items[c]) for c in ids[:limit]]
+    
+    @staticmethod
+    def public(record: dict) -> dict:
+        return {"assignment_id": record["id"], "subject": record["subject"], "title": record["title"],
+                "due_date": record["due_date"], "due_time": record["due_time"],
+                "due": datetime.fromtimestamp(record["due_at"], college_zone()).replace(tzinfo=None)
+                .isoformat(timespec='minutes'),
+                "description": record["description"], "recipients": len(record["recipients"])}
+    
+    def subjects_in(self, query: str) -> List[str]:
+        q = query.lower()
+        with self._lock:
+            return [s for s, ids in self.by_subject.items() if ids and re.search(rf'\b{re.escape(s)}\b', q)]
+    
+    def describe_due(self, query: str, now: datetime = None, limit: int = 20) -> str:
+        """Deadlines text for the period, subject and student a question mentions, '' when
+        nothing has been assigned yet"""
+        if not self.items:
             return ""
+        now = now or datetime.now(college_zone())
+        start, end, label = due_window(query, now)
+        student = next(filter(None, map(normalize_email, re.findall(r'[\w.%+-]+@[\w.-]+', query))), None)
+        subjects = self.subjects_in(query) or [None]
+        found = sorted((a for s in subjects for a in self.due(start, end, student, s, limit)),
+                       key=lambda a: a["due"])[:limit]
+        if not found:
+            return f"No assignments due {label}."
+        lines = [f"Assignments due {label} (as of {now.strftime('%A %Y-%m-%d %H:%M')}):"]
+        for a in found:
+            due = datetime.fromisoformat(a["due"])
+            lines.append(f"- {due.strftime('%a %Y-%m-%d %H:%M')}: {a['subject']} - {a['title']}")
+        return "\n".join(lines)
+
+# ==================== IDEMPOTENCY ====================
+
+class DeliveryFailed(Exception):
+    """Nothing reached the recipients; raised so an idempotent run isn't stored as done"""
+    pass
+
+class IdempotencyConflict(Exception):
+    pass
+
+class IdempotencyStore:
+    """Results of side-effecting requests keyed by the client's Idempotency-Key header.
     
-    def extract_text_from_image(self, file_path: str) -> str:
+    The first request with a key inserts a pending row and runs; repeats with the same
+    payload fingerprint get the stored result, and repeats that arrive while it is still
+    running wait for it (an asyncio.Event in this worker, polling across workers).
+    Failed runs delete their row so the client can retry. A running owner renews its
+    lease, so only a crashed worker's pending row ever expires.
+    """
+    
+    def __init__(self, path: str, ttl_seconds: int = 86400, lease_seconds: int = 300):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS idempotency (
+                key TEXT PRIMARY KEY, fingerprint TEXT, status TEXT, result TEXT, created REAL
+            );
+        """)
+        self.conn.commit()
+        self.ttl = ttl_seconds
+        self.lease = lease_seconds     # a pending row not renewed for this long belongs to a crashed worker
+        self._lock = threading.Lock()
+        self._events = {}              # key -> (event loop, asyncio.Event) for runs in this worker
+        self.replays = 0
+    
+    @staticmethod
+    def fingerprint(payload: dict) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    
+    def _claim(self, key: str, fingerprint: str) -> Optional[tuple]:
+        """None when this caller now owns the key, else the existing (fingerprint, status, result, created)"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM idempotency WHERE created < ? OR (status = 'pending' AND created < ?)",
+                              (now - self.ttl, now - self.lease))
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO idempotency (key, fingerprint, status, created) VALUES (?, ?, 'pending', ?)",
+                (key, fingerprint, now)).rowcount
+            if inserted:
+                return None
+            return self.conn.execute("SELECT fingerprint, status, result, created FROM idempotency WHERE key = ?",
+                                     (key,)).fetchone()
+    
+    def _renew(self, key: str):
+        # A pending row's created time doubles as its lease
+        with self._lock, self.conn:
+            self.conn.execute("UPDATE idempotency SET created = ? WHERE key = ? AND status = 'pending'",
+                              (time.time(), key))
+    
+    async def _keep_lease(self, key: str):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            self._renew(key)
+    
+    def _finish(self, key: str, result: Optional[dict]):
+        with self._lock, self.conn:
+            if result is None:
+                self.conn.execute("DELETE FROM idempotency WHERE key = ?", (key,))
+            else:
+                self.conn.execute("UPDATE idempotency SET status = 'done', result = ? WHERE key = ?",
+                                  (json.dumps(result), key))
+    
+    async def run(self, key: str, payload: dict, execute) -> tuple:
+        """(result, replayed); execute is an async callable run at most once per key"""
+        fingerprint = self.fingerprint(payload)
+        while True:
+            existing = self._claim(key, fingerprint)
+            if existing is None:
+                break
+            stored_fingerprint, status, result, _ = existing
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyConflict("Idempotency-Key was already used with a different request")
+            if status == "done":
+                self.replays += 1
+                return json.loads(result), True
+            loop, event = self._events.get(key, (None, None))
+            if loop is asyncio.get_running_loop():
+                await event.wait()
+            else:
+                await asyncio.sleep(0.2)    # running in another worker (or event loop)
+        
+        # Shielded so the outcome is recorded even if the first caller disconnects mid-run
+        self._events[key] = (asyncio.get_running_loop(), asyncio.Event())
+        return await asyncio.shield(asyncio.ensure_future(self._execute(key, execute))), False
+    
+    async def _execute(self, key: str, execute) -> dict:
+        result = None
+        # Large roster sends can outlast the lease; renewing it keeps retries from resending
+        renewal = asyncio.ensure_future(self._keep_lease(key))
         try:
-            image = Image.open(file_path)
-            return pytesseract.image_to_string(image)
-        except Exception as e:
-            print(f"OCR extraction error: {e}")
-            return ""
+            result = await execute()
+            return result
+        finally:
+            renewal.cancel()
+            self._finish(key, result)
+            self._events.pop(key)[1].set()
     
-    def store_document(self, file_path: str, doc_type: str) -> bool:
+    def stats(self) -> dict:
+        with self._lock:
+            done, pending = self.conn.execute(
+                "SELECT COALESCE(SUM(status = 'done'), 0), COALESCE(SUM(status = 'pending'), 0) FROM idempotency"
+            ).fetchone()
+        return {"stored": done, "in_flight": pending, "replays": self.replays}
+
+# ==================== AGENT TOOLS ====================
+
+class AgentTools:
+    """Tools the agent loop can call; read-only results are memoized for the turn"""
+    
+    SPECS = {
+        "lookup_timetable": {
+            "description": "Timetable slots for the days, subjects or professors named in the query",
+            "arguments": {"query": "string"},
+            "read_only": True,
+        },
+        "search_documents": {
+            "description": "Matching passages from the syllabus, college information and timetable",
+            "arguments": {"query": "string"},
+            "read_only": True,
+        },
+        "due_assignments": {
+            "description": "Assignments sent to students that are due in a date range",
+            "arguments": {"start": "YYYY-MM-DD", "end": "YYYY-MM-DD", "student": "email (optional)",
+                          "subject": "string (optional)"},
+            "read_only": True,
+        },
+        "create_event": {
+            "description": "Create a calendar event",
+            "arguments": {"summary": "string", "start": "YYYY-MM-DDTHH:MM", "duration_minutes": "number",
+                          "description": "string", "attendees": "list of emails"},
+            "read_only": False,
+        },
+        "send_email": {
+            "description": "Email a plain-text message",
+            "arguments": {"to": "list of emails", "subject": "string", "body": "string"},
+            "read_only": False,
+        },
+    }
+    MAX_RESULT_CHARS = 2000
+    
+    def __init__(self, doc_store, email_manager, calendar_manager, assignments=None):
+        self.doc_store = doc_store
+        self.email_manager = email_manager
+        self.calendar_manager = calendar_manager
+        self.assignments = assignments
+    
+    def describe(self, allow_actions: bool) -> str:
+        return "\n".join(f"- {name}({', '.join(f'{a}: {t}' for a, t in spec['arguments'].items())}): "
+                         f"{spec['description']}" for name, spec in self.SPECS.items()
+                         if allow_actions or spec["read_only"])
+    
+    def lookup_timetable(self, query: str) -> str:
+        return self.doc_store.timetable_index.lookup(query) or str(self.doc_store.timetable) or "No timetable loaded."
+    
+    def search_documents(self, query: str) -> str:
+        sections = []
+        for doc_type in ("syllabus", "info", "timetable"):
+            chunk_ids = self.doc_store.chunk_index.search(query, doc_type)
+            if chunk_ids:
+                chunks = "\n\n".join(self.doc_store.chunk_index.text(c) for c in chunk_ids)
+                sections.append(f"=== {doc_type.upper()} ===\n{chunks}")
+        return "\n\n".join(sections) or "No matching documents."
+    
+    def due_assignments(self, start: str, end: str, student: str = None, subject: str = None) -> List[dict]:
+        if not self.assignments:
+            raise ValueError("No assignment registry")
+        end_datetime = datetime.fromisoformat(end)
+        if len(end) <= 10:
+            end_datetime += timedelta(days=1)   # a date means through the end of that day
+        return self.assignments.due(datetime.fromisoformat(start), end_datetime, student or None,
+                                    subject or None, limit=50)
+    
+    def create_event(self, summary: str, start: str, duration_minutes: int = 60,
+                     description: str = "", attendees: List[str] = None) -> dict:
+        if not self.calendar_manager.service:
+            raise ValueError("Calendar is not connected")
+        start_datetime = datetime.fromisoformat(start)
+        recipients = [normalize_email(e) for e in attendees or []]
+        if None in recipients:
+            raise ValueError(f"Invalid attendee in {attendees}")
+        event_id, event_link = self.calendar_manager.create_event(
+            summary=summary, description=description, start_datetime=start_datetime,
+            end_datetime=start_datetime + timedelta(minutes=int(duration_minutes)), attendees=recipients)
+        if not event_id:
+            raise ValueError("Calendar event could not be created")
+        return {"event_id": event_id, "event_link": event_link}
+    
+    def send_email(self, to: List[str], subject: str, body: str) -> dict:
+        recipients = [normalize_email(e) for e in ([to] if isinstance(to, str) else to)]
+        if not recipients or None in recipients:
+            raise ValueError(f"Invalid recipients: {to}")
+        html = html_escape(body).replace("\n", "<br>")
+        sent = self.email_manager.send_email(recipients, subject, html, text_body=body)
+        return {"sent": sent, "recipients": len(recipients)}
+    
+    async def call(self, call: dict, memo: dict, allow_actions: bool) -> dict:
+        """Run one {"name", "arguments"} call in a worker thread; errors become results the model can read"""
+        name, arguments = call.get("name"), call.get("arguments") or {}
+        spec = self.SPECS.get(name)
+        started = time.perf_counter()
+        outcome = {"name": name, "arguments": arguments, "cached": False}
         try:
-            if file_path.lower().endswith('.pdf'):
-                content = self.extract_text_from_pdf(file_path)
-            elif file_path.lower().endswith('.txt'):
-                content = self.extract_text_from_txt(file_path)
-            elif file_path.lower().endswith(('.png', '.jpg', '.jpeg')):
-                content = self.extract_text_from_image(file_path)
-            else:
-                return False
-            
-            if doc_type == "timetable":
-                self.timetable = content
-            elif doc_type == "syllabus":
-                self.syllabus = content
-            elif doc_type == "info":
-                self.college_info = content
+            if spec is None:
+                raise ValueError(f"Unknown tool: {name}")
+            if not spec["read_only"] and not allow_actions:
+                raise ValueError(f"{name} is not enabled for this request")
+            if not isinstance(arguments, dict):
+                raise ValueError("arguments must be an object")
             
-            return True
+            key = (name, json.dumps(arguments, sort_keys=True))
+            if spec["read_only"] and key in memo:
+                outcome["cached"] = True
+            else:
+                task = asyncio.ensure_future(asyncio.to_thread(getattr(self, name), **arguments))
+                if spec["read_only"]:
+                    memo[key] = task
+            result = await (memo[key] if spec["read_only"] else task)
+            if isinstance(result, str) and len(result) > self.MAX_RESULT_CHARS:
+                result = result[:self.MAX_RESULT_CHARS] + "\n[truncated]"
+            outcome["result"] = result
         except Exception as e:
-            print(f"Document storage error: {e}")
-            return False
+            outcome["error"] = str(e)
+        outcome["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return outcome
+
+# ==================== MEMORY PROFILING ====================
+
+class MemoryProfiler:
+    """tracemalloc-backed allocation tracking per endpoint, idle until started.
     
-    def get_relevant_context(self, query: str) -> str:
-        """Enhanced context retrieval with better matching"""
-        context = []
-        q = query.lower()
-        
-        # Time-related queries - ALWAYS include timetable
-        time_keywords = ['time', 'schedule', 'timetable', 'class', 'when', 'at', 'monday', 'tuesday', 
-                        'wednesday', 'thursday', 'friday', 'saturday', 'today', 'tomorrow']
-        
-        if any(keyword in q for keyword in time_keywords):
-            if self.timetable:
-                context.append(f"=== TIMETABLE ===\n{self.timetable}")
-        
-        # Syllabus queries
-        if any(w in q for w in ['syllabus', 'course', 'subject', 'curriculum', 'topics']):
-            if self.syllabus:
-                context.append(f"=== SYLLABUS ===\n{self.syllabus}")
-        
-        # College info queries
-        if any(w in q for w in ['college', 'campus', 'facility', 'rule', 'regulation', 'hostel', 'library', 'exam']):
-            if self.college_info:
-                context.append(f"=== COLLEGE INFORMATION ===\n{self.college_info}")
+    While tracing, every request adds its traced-memory delta and peak to its endpoint's
+    totals; every sample_every-th request of an endpoint also diffs snapshots taken around
+    it to name the source lines that allocated the most. Concurrent requests share one
+    tracer, so per-endpoint numbers are approximate under load.
+    """
+    
+    IGNORED = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    )
+    
+    def __init__(self, sample_every: int = 20, top: int = 10):
+        self.sample_every = sample_every
+        self.top = top
+        self.endpoints = {}   # "METHOD /path" -> totals and the last sampled top allocators
+    
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing()
+    
+    def start(self, frames: int = 1):
+        if not self.active:
+            tracemalloc.start(frames)
+        self.endpoints = {}
+    
+    def stop(self):
+        tracemalloc.stop()
+    
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(self.IGNORED)
+    
+    def _top(self, stats: list) -> List[dict]:
+        return [{
+            "where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "size_diff_kb": round(getattr(stat, "size_diff", stat.size) / 1024, 1),
+            "count": stat.count,
+        } for stat in stats[:self.top]]
+    
+    async def track(self, endpoint: str, call_next):
+        totals = self.endpoints.setdefault(endpoint, {
+            "requests": 0, "total_delta_kb": 0.0, "max_delta_kb": 0.0, "max_peak_kb": 0.0, "top": []})
+        sampled = totals["requests"] % self.sample_every == 0
+        before_snapshot = self._snapshot() if sampled else None
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
         
-        # If no specific keywords but documents exist, provide all
-        if not context and (self.timetable or self.syllabus or self.college_info):
-            if self.timetable:
-                context.append(f"=== TIMETABLE ===\n{self.timetable[:2000]}")
-            if self.college_info:
-                context.append(f"=== COLLEGE INFO ===\n{self.college_info[:1000]}")
+        response = await call_next()
         
-        return "\n\n".join(context) if context else "No relevant documents found."
+        if not self.active:
+            return response
+        after, peak = tracemalloc.get_traced_memory()
+        delta_kb = (after - before) / 1024
+        totals["requests"] += 1
+        totals["total_delta_kb"] += delta_kb
+        totals["max_delta_kb"] = max(totals["max_delta_kb"], round(delta_kb, 1))
+        totals["max_peak_kb"] = max(totals["max_peak_kb"], round((peak - before) / 1024, 1))
+        if before_snapshot:
+            totals["top"] = self._top(self._snapshot().compare_to(before_snapshot, 'lineno'))
+        return response
+    
+    def report(self) -> dict:
+        if not self.active:
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": self._top(self._snapshot().statistics('lineno')),
+            "endpoints": {name: {**totals, "avg_delta_kb": round(totals["total_delta_kb"] / totals["requests"], 1)
+                                 if totals["requests"] else 0.0}
+                          for name, totals in self.endpoints.items()},
+        }
+
+# ==================== OLLAMA CLIENT ====================
+
+class DeadlineExceeded(Exception):
+    pass
+
+class OllamaPool:
+    """Owned keep-alive connections to the Ollama daemon.
+    
+    One ollama.AsyncClient per event loop, plus one sync client for worker threads,
+    each over a bounded httpx connection pool with connect/read timeouts. Calls take an
+    absolute deadline (time.monotonic()) and stream the generation, so a cancelled or
+    overdue call closes its connection and Ollama stops generating for it.
+    """
+    
+    def __init__(self, host: Optional[str] = None, connect_timeout: float = 5.0,
+                 read_timeout: float = 120.0, max_connections: int = 8):
+        self.host = host
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = self._limits(max_connections)
+        self._async = {}     # event loop -> AsyncClient
+        self._sync = None
+        self._retired = {}   # client replaced by configure() -> its event loop (None if sync)
+        self._in_use = {}    # client -> model calls streaming through it
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.timeouts = 0
+        self.cancelled = 0
+    
+    @staticmethod
+    def _limits(max_connections: int) -> httpx.Limits:
+        return httpx.Limits(max_connections=max_connections,
+                            max_keepalive_connections=max_connections, keepalive_expiry=60)
+    
+    def configure(self, host: Optional[str], connect_timeout: float, read_timeout: float, max_connections: int):
+        """Apply new connection settings. Current clients finish their in-flight generations
+        and are closed as soon as they are idle; later calls get clients built with the new
+        settings. Unchanged settings keep the warm keep-alive connections."""
+        timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        limits = self._limits(max_connections)
+        with self._lock:
+            if (host, timeout, limits) == (self.host, self.timeout, self.limits):
+                return
+            self.host, self.timeout, self.limits = host, timeout, limits
+            replaced = [(client, loop) for loop, client in self._async.items()]
+            if self._sync:
+                replaced.append((self._sync, None))
+            self._async = {}
+            self._sync = None
+            idle = []
+            for client, loop in replaced:
+                if self._in_use.get(client):
+                    self._retired[client] = loop   # closed by the call that finishes last
+                else:
+                    idle.append((client, loop))
+        for client, loop in idle:
+            if loop is None:
+                client._client.close()
+            elif not loop.is_closed():
+                # An AsyncClient must be closed on the loop it belongs to
+                asyncio.run_coroutine_threadsafe(client._client.aclose(), loop)
+    
+    def _release(self, client) -> bool:
+        """Count a finished call off its client; True when the client is retired and now idle"""
+        with self._lock:
+            count = self._in_use.pop(client) - 1
+            if count:
+                self._in_use[client] = count
+                return False
+            if client not in self._retired:
+                return False
+            del self._retired[client]
+            return True
+    
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.timeouts += 1
+            raise DeadlineExceeded("Request deadline passed before the model call")
+        return remaining
+    
+    def async_client(self) -> ollama.AsyncClient:
+        """This event loop's client, counted in use until _release()"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async.get(loop)
+            if client is None:
+                self._async = {l: c for l, c in self._async.items() if not l.is_closed()}
+                client = self._async[loop] = ollama.AsyncClient(self.host, timeout=self.timeout, limits=self.limits)
+            self._in_use[client] = self._in_use.get(client, 0) + 1
+            return client
+    
+    def sync_client(self) -> ollama.Client:
+        """The worker threads' client, counted in use until _release()"""
+        with self._lock:
+            if self._sync is None:
+                self._sync = ollama.Client(self.host, timeout=self.timeout, limits=self.limits)
+            self._in_use[self._sync] = self._in_use.get(self._sync, 0) + 1
+            return self._sync
+    
+    async def stream(self, model: str, messages: List[dict], format: str = '', options: dict = None,
+                     deadline: Optional[float] = None):
+        """Yield the generation piece by piece; cancelling or closing the consumer closes the
+        connection, which stops Ollama generating"""
+        remaining = self._remaining(deadline)
+        self.requests += 1
+        client = self.async_client()
+        stream = None
+        try:
+            stream = await asyncio.wait_for(client.chat(
+                model=model, messages=messages, stream=True, format=format, options=options), remaining)
+            while True:
+                try:
+                    part = await asyncio.wait_for(stream.__anext__(), self._remaining(deadline))
+                except StopAsyncIteration:
+                    return
+                yield part['message']['content']
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise DeadlineExceeded("Model call ran past the request deadline")
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            idle = self._release(client)
+            if stream is not None:
+                await stream.aclose()
+            if idle:
+                await client._client.aclose()
+    
+    async def chat(self, model: str, messages: List[dict], format: str = '', options: dict = None,
+                   deadline: Optional[float] = None) -> str:
+        return "".join([part async for part in self.stream(model, messages, format, options, deadline)])
+    
+    def chat_sync(self, model: str, messages: List[dict], format: str = '', options: dict = None,
+                  deadline: Optional[float] = None) -> str:
+        """Blocking variant for worker threads; the deadline is checked between streamed chunks"""
+        self._remaining(deadline)
+        self.requests += 1
+        parts = []
+        client = self.sync_client()
+        try:
+            stream = client.chat(model=model, messages=messages, stream=True, format=format, options=options)
+            try:
+                for part in stream:
+                    parts.append(part['message']['content'])
+                    if deadline is not None and time.monotonic() > deadline:
+                        self.timeouts += 1
+                        raise DeadlineExceeded("Model call ran past the request deadline")
+            finally:
+                stream.close()
+        finally:
+            if self._release(client):
+                client._client.close()
+        return "".join(parts)
+    
+    async def aclose(self):
+        for client in [*self._async.values(), *self._retired, self._sync]:
+            if isinstance(client, ollama.AsyncClient):
+                await client._client.aclose()
+            elif client:
+                client._client.close()
+        self._async = {}
+        self._retired = {}
+        self._sync = None
+    
+    def stats(self) -> dict:
+        return {"requests": self.requests, "timeouts": self.timeouts, "cancelled": self.cancelled,
+                "event_loops": len(self._async), "retired": len(self._retired)}
 
 # ==================== OLLAMA AGENT ====================
 
+TABLE_QUERY_PROMPT = """Translate the question into one JSON query over the given tables. Reply with JSON only:
+{"table": name, "filters": [{"column": c, "op": op, "value": v}], "group_by": column or null,
+ "aggregate": {"op": "count"|"avg"|"sum"|"min"|"max", "column": numeric column or null},
+ "order": "asc"|"desc"|null, "limit": number or null}
+Filter ops: ==, !=, >, >=, <, <=, between ([low, high]), in ([values]), contains (text),
+month ({"month": 1-12, "year": year or null}, date columns). Dates are YYYY-MM-DD.
+Use column names and example values exactly as listed."""
+
+AGENT_PROMPT = """You can call tools to answer the user or carry out their request. Tools:
+{tools}
+Reply with JSON only. To call tools: {{"tool_calls": [{{"name": tool, "arguments": {{...}}}}]}}.
+Put every call that does not depend on another call's result in the same reply; they run together.
+When you can answer: {{"answer": text}}. Today is {today}."""
+
 class CollegeAgent:
-    def __init__(self, model_name: str = "llama3.2"):
+    def __init__(self, model_name: str = "llama3.2", pool: OllamaPool = None, history_window: int = 4):
         self.model = model_name
+        self.pool = pool or OllamaPool()
+        self.history_window = history_window   # recent messages sent along, after any session summary
         self.system_prompt = """You are a helpful college assistant AI for UIT RGPV. 
 
 IMPORTANT INSTRUCTIONS:
@@ -491,45 +3890,312 @@ IMPORTANT INSTRUCTIONS:
 
 Answer naturally and helpfully using the context provided."""
     
-    def generate_response(self, query: str, context: str, 
-                         conversation_history: List[ChatMessage] = None) -> str:
-        try:
-            messages = [{"role": "system", "content": self.system_prompt}]
-            
-            if conversation_history:
-                for msg in conversation_history[-5:]:
-                    messages.append({"role": msg.role, "content": msg.content})
-            
-            # Enhanced prompt with context
-            user_message = f"""Context Information:
-{context}
+    def build_messages(self, query: str, context: Context,
+                       conversation_history: List[ChatMessage] = None) -> List[dict]:
+        messages = [{"role": "system", "content": self.system_prompt}]
+        
+        if conversation_history:
+            for msg in conversation_history[-(self.history_window + 1):]:
+                messages.append({"role": msg.role, "content": msg.content})
+        
+        # Enhanced prompt with context, rendered straight into the message
+        user_message = context.render("Context Information:\n", f"""
 
 User Question: {query}
 
-Please answer the question using the context provided above. Be specific with details like times, room numbers, and professor names when available."""
-            
-            messages.append({"role": "user", "content": user_message})
-            
-            response = ollama.chat(model=self.model, messages=messages)
-            return response['message']['content']
+Please answer the question using the context provided above. Be specific with details like times, room numbers, and professor names when available.""")
+        
+        messages.append({"role": "user", "content": user_message})
+        return messages
+    
+    def generate_response(self, query: str, context: Context, 
+                         conversation_history: List[ChatMessage] = None,
+                         deadline: Optional[float] = None) -> str:
+        """Blocking generation, for worker threads"""
+        try:
+            return self.pool.chat_sync(self.model, self.build_messages(query, context, conversation_history),
+                                       deadline=deadline)
+        except DeadlineExceeded as e:
+            print(f"Ollama timeout: {e}")
+            return "Error: The model took too long to answer, please try again"
+        except Exception as e:
+            print(f"Ollama error: {e}")
+            return "Error: Make sure Ollama is running (ollama serve)"
+    
+    async def generate_response_async(self, query: str, context: Context,
+                                      conversation_history: List[ChatMessage] = None,
+                                      deadline: Optional[float] = None) -> str:
+        """Generation on the event loop; cancelling the caller cancels the upstream generation"""
+        try:
+            return await self.pool.chat(self.model, self.build_messages(query, context, conversation_history),
+                                        deadline=deadline)
+        except DeadlineExceeded as e:
+            print(f"Ollama timeout: {e}")
+            return "Error: The model took too long to answer, please try again"
         except Exception as e:
             print(f"Ollama error: {e}")
             return "Error: Make sure Ollama is running (ollama serve)"
+    
+    def stream_response(self, query: str, context: Context,
+                        conversation_history: List[ChatMessage] = None,
+                        deadline: Optional[float] = None):
+        """Async iterator over the answer's tokens; errors propagate to the consumer"""
+        return self.pool.stream(self.model, self.build_messages(query, context, conversation_history),
+                                deadline=deadline)
+    
+    async def run_tools(self, query: str, context: Context, tools: AgentTools,
+                        conversation_history: List[ChatMessage] = None,
+                        max_steps: int = 4, allow_actions: bool = False,
+                        deadline: Optional[float] = None) -> tuple:
+        """Tool-calling loop: (answer, per-step timings). Each step is one model round trip plus
+        the tools it asked for, run concurrently; read-only results are shared within the turn."""
+        messages = [{"role": "system", "content": self.system_prompt + "\n\n" + AGENT_PROMPT.format(
+            tools=tools.describe(allow_actions), today=datetime.now().strftime('%A %Y-%m-%d'))}]
+        for msg in (conversation_history or [])[-(self.history_window + 1):]:
+            messages.append({"role": msg.role, "content": msg.content})
+        messages.append({"role": "user", "content": context.render("Context Information:\n", f"\n\nUser Question: {query}")})
+        
+        memo, steps = {}, []
+        for step in range(1, max_steps + 1):
+            started = time.perf_counter()
+            # The last step gets no tools so the budget always ends in an answer
+            final = step == max_steps
+            if final:
+                messages.append({"role": "user", "content": "Answer now with the information gathered so far."})
+            try:
+                content = await self.pool.chat(self.model, messages, format='' if final else 'json',
+                                               deadline=deadline)
+            except DeadlineExceeded as e:
+                print(f"Ollama timeout: {e}")
+                return "Error: The model took too long to answer, please try again", steps
+            except Exception as e:
+                print(f"Ollama error: {e}")
+                return "Error: Make sure Ollama is running (ollama serve)", steps
+            model_ms = round((time.perf_counter() - started) * 1000, 1)
+            
+            decision = {"answer": content}
+            if not final:
+                try:
+                    decision = json.loads(content)
+                except json.JSONDecodeError:
+                    pass
+            calls = decision.get("tool_calls") if isinstance(decision, dict) else None
+            if not calls or not isinstance(calls, list):
+                answer = decision.get("answer", content) if isinstance(decision, dict) else content
+                steps.append({"step": step, "model_ms": model_ms, "tools": [],
+                              "total_ms": round((time.perf_counter() - started) * 1000, 1)})
+                return str(answer), steps
+            
+            results = await asyncio.gather(*(tools.call(c if isinstance(c, dict) else {}, memo, allow_actions)
+                                             for c in calls))
+            steps.append({"step": step, "model_ms": model_ms,
+                          "tools": [{k: r[k] for k in ("name", "ms", "cached")} | {"ok": "error" not in r}
+                                    for r in results],
+                          "total_ms": round((time.perf_counter() - started) * 1000, 1)})
+            messages.append({"role": "assistant", "content": content})
+            messages.append({"role": "user", "content": "Tool results: " + json.dumps(
+                [{k: r[k] for k in ("name", "arguments", "result", "error") if k in r} for r in results],
+                default=str)})
+        return "I could not finish within the step budget.", steps
+    
+    def plan_table_query(self, question: str, tables: List[Table],
+                         deadline: Optional[float] = None) -> Optional[dict]:
+        """Have the model translate a question into a structured table query instead of reading rows"""
+        schemas = json.dumps([t.schema() for t in tables], separators=(',', ':'))
+        messages = [
+            {"role": "system", "content": TABLE_QUERY_PROMPT},
+            {"role": "user", "content": f"Tables: {schemas}\nQuestion: {question}"},
+        ]
+        try:
+            plan = json.loads(self.pool.chat_sync(self.model, messages, format='json',
+                                                  options={"temperature": 0}, deadline=deadline))
+        except Exception as e:
+            print(f"Query planning error: {e}")
+            return None
+        if not isinstance(plan, dict):
+            return None
+        if "table" not in plan and len(tables) == 1:
+            plan["table"] = tables[0].name
+        return plan
 
 # Initialize everything
-doc_store = DocumentStore()
-email_manager = EmailManager(GMAIL_USER, GMAIL_APP_PASSWORD)
-calendar_manager = CalendarManager()
-agent = CollegeAgent()
+ATTACHMENTS_DIR = os.path.join("uploads", "attachments")
+os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
+settings = config.settings
+SHARED_STATE_DB = settings.server.shared_state
+shared_state = SharedState(SHARED_STATE_DB) if SHARED_STATE_DB else None
+assignments = AssignmentRegistry(SHARED_STATE_DB or "assignments.db")
+doc_store = DocumentStore(shared_state, assignments)
+email_manager = EmailManager(settings.email.gmail_user, settings.email.gmail_app_password,
+                             settings.email.smtp_host, settings.email.smtp_port, settings.email.smtp_timeout)
+email_manager.attachments.max_bytes = settings.limits.attachment_cache_bytes
+calendar_manager = CalendarManager(interactive=shared_state is None, time_zone=settings.calendar.time_zone)
+ollama_pool = OllamaPool(settings.ollama.host, settings.ollama.connect_timeout, settings.ollama.read_timeout,
+                         settings.ollama.max_connections)
+agent = CollegeAgent(settings.ollama.model, pool=ollama_pool, history_window=settings.limits.session_window)
+agent_tools = AgentTools(doc_store, email_manager, calendar_manager, assignments)
+response_cache = ResponseCache(settings.limits.response_cache_entries, settings.limits.response_cache_ttl,
+                               shared=shared_state)
+sessions = SessionStore(settings.limits.sessions, settings.limits.session_window, shared=shared_state)
+prefetch = PrefetchCache(settings.limits.prefetch_ttl, settings.limits.prefetch_entries)
+notifications = NotificationHub()
+admission = AdmissionControl(settings.limits.admission_capacity)
+reminder_scheduler = ReminderScheduler(SHARED_STATE_DB or "reminders.db", email_manager,
+                                       slots=settings.limits.reminder_slots)
+rosters = RosterStore(SHARED_STATE_DB or "rosters.db")
+idempotency = IdempotencyStore(SHARED_STATE_DB or "idempotency.db")
+memory_profiler = MemoryProfiler()
+if settings.server.tracemalloc_frames:
+    memory_profiler.start(settings.server.tracemalloc_frames)
+doc_store.listeners.append(response_cache.on_document_change)
+doc_store.listeners.append(prefetch.on_document_change)
+
+def on_assignments_change():
+    """Drop answers and prefetched contexts built from the deadlines as they were"""
+    changes = {"removed": [], "added_terms": set()}
+    response_cache.on_document_change("assignments", changes)
+    prefetch.on_document_change("assignments", changes)
+
+assignments.change_listeners.append(on_assignments_change)
+
+def warm_response_cache(question: str) -> bool:
+    """Answer a likely question ahead of time so its first asker gets a cache hit.
+    
+    Runs on a spare batch slot or not at all; returns False when none is free.
+    """
+    if response_cache.get(question) is not None:
+        return True
+    if not admission.try_acquire("batch"):
+        return False
+    started = time.monotonic()
+    try:
+        context, deps = doc_store.retrieve(question)
+        response = agent.generate_response(question, context)
+    finally:
+        admission.release("batch", time.monotonic() - started)
+    if not response.startswith("Error:"):
+        response_cache.put(question, response, deps)
+    return True
+
+ingest = IngestPipeline(doc_store, warm=warm_response_cache)
+
+# Pushed to /ws/chat clients instead of them polling /documents/status
+assignments.listeners.append(lambda assignment, recipients: notifications.publish("assignment", assignment, recipients))
+doc_store.listeners.append(lambda doc_type, changes: notifications.publish(
+    "document", {"doc_type": doc_type, "added": len(changes["added"]), "removed": len(changes["removed"])}))
+ingest.listeners.append(lambda job: notifications.publish("ingestion", job.to_dict()))
+
+def apply_settings(new: Settings):
+    """Push reloaded settings into the live objects; each resizes in place and keeps its warm state"""
+    global settings
+    settings = new
+    ollama_pool.configure(new.ollama.host, new.ollama.connect_timeout, new.ollama.read_timeout,
+                          new.ollama.max_connections)
+    agent.model = new.ollama.model
+    agent.history_window = new.limits.session_window
+    email_manager.gmail_user = new.email.gmail_user
+    email_manager.gmail_password = new.email.gmail_app_password
+    email_manager.smtp_host = new.email.smtp_host
+    email_manager.smtp_port = new.email.smtp_port
+    email_manager.smtp_timeout = new.email.smtp_timeout
+    email_manager.attachments.max_bytes = new.limits.attachment_cache_bytes
+    calendar_manager.time_zone = new.calendar.time_zone
+    admission.resize(new.limits.admission_capacity)
+    response_cache.resize(new.limits.response_cache_entries, new.limits.response_cache_ttl)
+    sessions.resize(new.limits.sessions, new.limits.session_window)
+    prefetch.resize(new.limits.prefetch_ttl, new.limits.prefetch_entries)
+    reminder_scheduler.resize(new.limits.reminder_slots)
+
+config.listeners.append(apply_settings)
 
 # ==================== API ENDPOINTS ====================
 
+@app.on_event("startup")
+async def start_reminder_scheduler():
+    asyncio.create_task(reminder_scheduler.run())
+
+def reload_config() -> dict:
+    result = config.reload()
+    print(f"⚙️ Configuration reloaded from {config.path}: {', '.join(result['changed']) or 'no changes'}")
+    if result["restart_required"]:
+        print(f"⚠️ Restart to apply: {', '.join(result['restart_required'])}")
+    return result
+
+def reload_config_on_signal():
+    try:
+        reload_config()
+    except Exception as e:
+        print(f"⚠️ Configuration not reloaded, keeping the running settings: {e}")
+
+@app.on_event("startup")
+async def warn_without_admin_token():
+    if not config.settings.server.admin_token:
+        print("⚠️ server.admin_token is not set: /admin endpoints are open to anyone "
+              "and /debug/memory is disabled")
+
+@app.on_event("startup")
+async def install_reload_signal():
+    # kill -HUP <pid> reloads; with several workers, signal each worker process
+    if hasattr(signal, "SIGHUP"):
+        with contextlib.suppress(NotImplementedError, RuntimeError, ValueError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_config_on_signal)
+
+@app.on_event("shutdown")
+async def close_ollama_pool():
+    await ollama_pool.aclose()
+
+@app.middleware("http")
+async def sync_shared_state(request, call_next):
+    # Picks up uploads handled by other workers; a single PRAGMA when nothing changed
+    if shared_state:
+        doc_store.sync()
+    return await call_next(request)
+
+def endpoint_name(request) -> str:
+    """"METHOD /route/{param}" for the route a request will hit"""
+    for route in app.routes:
+        if route.matches(request.scope)[0] == Match.FULL:
+            return f"{request.method} {route.path}"
+    return f"{request.method} (unmatched)"
+
+def client_key(connection) -> str:
+    return connection.client.host if connection.client else "unknown"
+
+@app.middleware("http")
+async def profile_memory(request, call_next):
+    if not memory_profiler.active:
+        return await call_next(request)
+    return await memory_profiler.track(endpoint_name(request), lambda: call_next(request))
+
+# Registered last so it runs first: shed requests before they do any other work
+@app.middleware("http")
+async def admit(request, call_next):
+    admission_class = ENDPOINT_CLASSES.get(endpoint_name(request))
+    if admission_class is None:
+        return await call_next(request)
+    try:
+        admission.check_rate(client_key(request), admission_class)
+        if admission_class in ("batch", "prefetch"):
+            # Batch responses stream, so their questions take slots one by one;
+            # a prefetch takes its slot in the background task it starts
+            return await call_next(request)
+        async with admission.slot(admission_class):
+            return await call_next(request)
+    except AdmissionRejected as e:
+        return JSONResponse({"detail": e.reason, "retry_after": e.retry_after}, status_code=e.status,
+                            headers={"Retry-After": str(e.retry_after)})
+
 @app.get("/")
 async def root():
     return {
         "status": "running",
         "message": "College Assistant API - UIT RGPV",
         "calendar": "Enabled" if calendar_manager.service else "Disabled",
+        "ollama": ollama_pool.stats(),
+        "prefetch": prefetch.stats(),
+        "notifications": notifications.stats(),
+        "admission": admission.stats(),
+        "config": config.stats(),
         "data_loaded": {
             "timetable": bool(doc_store.timetable),
             "college_info": bool(doc_store.college_info)
@@ -538,92 +4204,576 @@ async def root():
 
 @app.post("/upload/{doc_type}")
 async def upload_document(doc_type: str, file: UploadFile = File(...)):
-    if doc_type not in ["timetable", "syllabus", "info"]:
+    if doc_type not in ["timetable", "syllabus", "info", "data"]:
         raise HTTPException(400, "Invalid type")
     
-    file_path = os.path.join(doc_store.uploads_dir, file.filename)
+    if not file.filename.lower().endswith(('.pdf', '.txt', '.png', '.jpg', '.jpeg', '.csv')):
+        raise HTTPException(400, "Unsupported file type")
+    
+    file_path = os.path.join(doc_store.uploads_dir, os.path.basename(file.filename))
     with open(file_path, "wb") as f:
         f.write(await file.read())
     
-    if doc_store.store_document(file_path, doc_type):
-        return {"status": "success", "message": f"{doc_type} uploaded", "filename": file.filename}
-    raise HTTPException(500, "Processing failed")
+    # Extraction and indexing continue in the background; progress is on /documents/status
+    job = ingest.submit(file_path, doc_type)
+    return {"status": "success", "message": f"{doc_type} uploaded, processing", "filename": file.filename,
+            "job_id": job.job_id}
+
+@app.post("/attachments")
+async def upload_attachment(file: UploadFile = File(...)):
+    """Store a file to attach to assignment emails, copied to disk in chunks"""
+    filename = os.path.basename(file.filename)
+    with open(os.path.join(ATTACHMENTS_DIR, filename), "wb") as f:
+        while chunk := await file.read(1024 * 1024):
+            f.write(chunk)
+    return {"status": "success", "attachment": filename}
+
+@app.post("/rosters")
+async def upload_roster(name: str, file: UploadFile = File(...)):
+    """Import a CSV class roster; rows are parsed as they are read from the upload"""
+    stream = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+    result = await asyncio.to_thread(rosters.import_csv, name, stream)
+    if not result["students"]:
+        rosters.delete(result["roster_id"])
+        raise HTTPException(400, "No valid email addresses found")
+    return result
+
+@app.get("/rosters")
+async def list_rosters():
+    return rosters.list()
+
+@app.delete("/rosters/{roster_id}")
+async def delete_roster(roster_id: str):
+    if not rosters.delete(roster_id):
+        raise HTTPException(404, "Roster not found")
+    return {"status": "deleted", "roster_id": roster_id}
+
+def assignment_due(assignment: AssignmentEmail) -> datetime:
+    """Due date and time as entered, in the college's time zone"""
+    due_date_obj = datetime.strptime(assignment.due_date, "%Y-%m-%d")
+    due_time_parts = assignment.due_time.split(":")
+    return due_date_obj.replace(hour=int(due_time_parts[0]), minute=int(due_time_parts[1]), tzinfo=college_zone())
+
+def deliver_assignment(assignment: AssignmentEmail) -> dict:
+    """Create the calendar event, email the class and schedule reminders; blocking"""
+    if assignment.roster_id:
+        roster = rosters.members(assignment.roster_id)
+        assignment.student_emails = list(dict.fromkeys(assignment.student_emails + roster))
+    
+    print(f"\n{'='*60}")
+    print(f"📧 Assignment: {assignment.assignment_title}")
+    print(f"📩 To: {len(assignment.student_emails)} recipients")
+    
+    due_datetime = assignment_due(assignment)
+    
+    attachment_path = None
+    if assignment.attachment:
+        attachment_path = os.path.join(ATTACHMENTS_DIR, os.path.basename(assignment.attachment))
+        if not os.path.exists(attachment_path):
+            raise ValueError(f"Unknown attachment: {assignment.attachment}")
+    
+    # Create calendar event
+    event_id, event_link = None, None
+    calendar_success = False
+    
+    if calendar_manager.service:
+        event_id, event_link = calendar_manager.create_event(
+            summary=f"📚 {assignment.subject}: {assignment.assignment_title}",
+            description=f"Subject: {assignment.subject}\n\n{assignment.description}\n\nDue: {assignment.due_date} at {assignment.due_time}",
+            start_datetime=due_datetime - timedelta(hours=1),
+            end_datetime=due_datetime,
+            attendees=assignment.student_emails
+        )
+        calendar_success = event_id is not None
+    
+    # Send email
+    email_body = email_manager.create_assignment_email_body(
+        assignment.assignment_title,
+        assignment.description,
+        assignment.due_date,
+        assignment.due_time,
+        event_link
+    )
+    
+    email_text = email_manager.create_assignment_email_text(
+        assignment.assignment_title,
+        assignment.description,
+        assignment.due_date,
+        assignment.due_time,
+        event_link
+    )
+    
+    email_sent = email_manager.send_email(
+        assignment.student_emails,
+        f"📚 New Assignment: {assignment.subject} - {assignment.assignment_title}",
+        email_body,
+        attachment_path=attachment_path,
+        text_body=email_text
+    )
+    
+    # Raising drops the Idempotency-Key row, so retrying with the same key sends again
+    if not (email_sent or calendar_success):
+        print(f"❌ Assignment not delivered\n{'='*60}\n")
+        raise DeliveryFailed("Assignment was not delivered: email and calendar both failed")
+    
+    # Calendar sends its own reminders; without it we send them ourselves
+    reminder_ids = []
+    if not calendar_success:
+        reminder_ids = reminder_scheduler.schedule_assignment(assignment, due_datetime)
+        print(f"⏰ Scheduled {len(reminder_ids)} reminder emails")
+    
+    # Remembered for "what's due" questions once it has reached anyone
+    assignment_id = assignments.add(assignment, due_datetime)
+    
+    print(f"{'='*60}\n")
+    
+    return {
+        "status": "success",
+        "assignment_id": assignment_id,
+        "email_sent": email_sent,
+        "calendar_event_created": calendar_success,
+        "event_id": event_id,
+        "event_link": event_link,
+        "reminder_ids": reminder_ids,
+        "recipients": len(assignment.student_emails)
+    }
 
 @app.post("/send-assignment")
-async def send_assignment(assignment: AssignmentEmail):
+async def send_assignment(assignment: AssignmentEmail, response: Response,
+                          idempotency_key: Optional[str] = Header(None, max_length=255)):
     try:
-        print(f"\n{'='*60}")
-        print(f"📧 Assignment: {assignment.assignment_title}")
-        print(f"📩 To: {assignment.student_emails}")
-        
-        # Parse date/time
-        due_date_obj = datetime.strptime(assignment.due_date, "%Y-%m-%d")
-        due_time_parts = assignment.due_time.split(":")
-        due_datetime = due_date_obj.replace(hour=int(due_time_parts[0]), minute=int(due_time_parts[1]))
-        
-        # Create calendar event
-        event_id, event_link = None, None
-        calendar_success = False
-        
-        if calendar_manager.service:
-            event_id, event_link = calendar_manager.create_event(
-                summary=f"📚 {assignment.subject}: {assignment.assignment_title}",
-                description=f"Subject: {assignment.subject}\n\n{assignment.description}\n\nDue: {assignment.due_date} at {assignment.due_time}",
-                start_datetime=due_datetime - timedelta(hours=1),
-                end_datetime=due_datetime,
-                attendees=assignment.student_emails
-            )
-            calendar_success = event_id is not None
-        
-        # Send email
-        email_body = email_manager.create_assignment_email_body(
-            assignment.assignment_title,
-            assignment.description,
-            assignment.due_date,
-            assignment.due_time,
-            event_link
-        )
-        
-        email_sent = email_manager.send_email(
-            assignment.student_emails,
-            f"📚 New Assignment: {assignment.subject} - {assignment.assignment_title}",
-            email_body
-        )
-        
-        print(f"{'='*60}\n")
-        
-        return {
-            "status": "success",
-            "email_sent": email_sent,
-            "calendar_event_created": calendar_success,
-            "event_id": event_id,
-            "event_link": event_link,
-            "recipients": len(assignment.student_emails)
-        }
+        if not idempotency_key:
+            return await asyncio.to_thread(deliver_assignment, assignment)
+        # Retries and double clicks with the same key replay the first result instead of resending
+        result, replayed = await idempotency.run(
+            idempotency_key, assignment.model_dump(),
+            lambda: asyncio.to_thread(deliver_assignment, assignment))
+        response.headers["Idempotent-Replayed"] = "true" if replayed else "false"
+        return result
     
+    except IdempotencyConflict as e:
+        raise HTTPException(422, str(e))
+    except DeliveryFailed as e:
+        raise HTTPException(502, str(e))
     except ValueError as e:
         raise HTTPException(400, str(e))
     except Exception as e:
         print(f"Error in send_assignment: {e}")
         raise HTTPException(500, str(e))
 
+@app.get("/assignments/due")
+async def get_due_assignments(start: Optional[str] = Query(None, alias="from"),
+                              end: Optional[str] = Query(None, alias="to"),
+                              student: Optional[str] = None, subject: Optional[str] = None,
+                              limit: int = Query(200, ge=1, le=5000)):
+    """Assignments due in [from, to); from defaults to now and to to a week after from.
+    Dates without a time cover the whole day."""
+    try:
+        start_datetime = datetime.fromisoformat(start) if start else datetime.now(college_zone()).replace(tzinfo=None)
+        end_datetime = datetime.fromisoformat(end) if end else start_datetime + timedelta(days=7)
+        if end and len(end) <= 10:
+            end_datetime += timedelta(days=1)
+    except ValueError:
+        raise HTTPException(400, "from and to must be ISO dates (YYYY-MM-DD or YYYY-MM-DDTHH:MM)")
+    
+    started = time.perf_counter()
+    due = assignments.due(start_datetime, end_datetime, student, subject, limit)
+    return {
+        "from": start_datetime.isoformat(timespec='minutes'),
+        "to": end_datetime.isoformat(timespec='minutes'),
+        "count": len(due),
+        "assignments": due,
+        "ms": round((time.perf_counter() - started) * 1000, 3)
+    }
+
+@app.delete("/assignments/{assignment_id}")
+async def delete_assignment(assignment_id: str):
+    if not assignments.remove(assignment_id):
+        raise HTTPException(404, "Assignment not found")
+    return {"status": "deleted", "assignment_id": assignment_id}
+
+class ClientDisconnected(Exception):
+    pass
+
+async def until_disconnected(http_request: HttpRequest, awaitable, poll_seconds: float = 0.5):
+    """Await a model call, cancelling it (and so the upstream generation) if the client goes away"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnected()
+    finally:
+        task.cancel()
+
+def request_deadline() -> float:
+    return time.monotonic() + config.settings.ollama.request_deadline
+
 @app.post("/query", response_model=QueryResponse)
-async def query_agent(request: QueryRequest):
+async def query_agent(request: QueryRequest, http_request: HttpRequest):
+    deadline = request_deadline()
+    try:
+        session_id = request.session_id
+        if session_id or not request.conversation_history:
+            session_id = session_id or sessions.new_id()
+            history = sessions.history(session_id)
+        else:
+            # Older clients still send the whole history
+            history = request.conversation_history
+        
+        prefetched = await prefetch.take(request.session_id, request.message)
+        
+        # Answers only depend on the documents when there is no history to follow up on.
+        # A cached answer skips the planner: retrieval only fills in context_used
+        if not history:
+            cached = response_cache.get(request.message)
+            if cached is not None:
+                context, _ = prefetched or await asyncio.to_thread(doc_store.retrieve, request.message)
+                if session_id:
+                    sessions.append(session_id, request.message, cached)
+                return QueryResponse(response=cached, context_used=context.preview(500),
+                                     session_id=session_id)
+        
+        planner = functools.partial(agent.plan_table_query, deadline=deadline)
+        context, deps = prefetched or await asyncio.to_thread(doc_store.retrieve, request.message, planner)
+        response = await until_disconnected(http_request, agent.generate_response_async(
+            request.message, context, history, deadline))
+        if not history and not response.startswith("Error:"):
+            response_cache.put(request.message, response, deps)
+        if session_id:
+            sessions.append(session_id, request.message, response)
+        return QueryResponse(response=response, context_used=context.preview(500),
+                             session_id=session_id)
+    except ClientDisconnected:
+        raise HTTPException(499, "Client closed request")
+    except Exception as e:
+        raise HTTPException(500, str(e))
+
+@app.post("/query/prefetch", status_code=202)
+async def prefetch_query(request: PrefetchRequest):
+    """Start retrieval for what the user has typed so far; the /query that sends the same
+    text with the returned session id reuses it"""
+    session_id = request.session_id or sessions.new_id()
+    return {"session_id": session_id, "started": start_prefetch(session_id, request.message)}
+
+def start_prefetch(session_id: str, message: str) -> bool:
+    # Analytic questions may need the planner model, which is too costly to run speculatively;
+    # without analytic words retrieval never consults it, so the prefetched context is exact
+    if len(message.strip()) < 3 or ANALYTIC_WORDS.search(message.lower()):
+        return False
+    
+    def prepare():
+        context, deps = doc_store.retrieve(message)
+        return context.prepare(), deps
+    
+    async def run():
+        # Rejected at once when no spare slot is free; /query then retrieves itself
+        async with admission.slot("prefetch"):
+            work = asyncio.ensure_future(asyncio.to_thread(prepare))
+            try:
+                return await asyncio.shield(work)
+            except asyncio.CancelledError:
+                # Superseded mid-retrieval: the thread can't be stopped, so keep its slot until it ends
+                await asyncio.wait([work])
+                raise
+    
+    return prefetch.start(session_id, message, run)
+
+@app.post("/query/agent")
+async def query_agent_tools(request: AgentQueryRequest, http_request: HttpRequest):
+    """Answer through the tool-calling loop, returning per-step timings alongside the answer"""
+    deadline = request_deadline()
     try:
-        context = doc_store.get_relevant_context(request.message)
-        response = agent.generate_response(request.message, context, request.conversation_history)
-        return QueryResponse(response=response, context_used=context[:500] if context else None)
+        planner = functools.partial(agent.plan_table_query, deadline=deadline)
+        context, _ = await asyncio.to_thread(doc_store.retrieve, request.message, planner)
+        session_id = request.session_id or sessions.new_id()
+        started = time.perf_counter()
+        response, steps = await until_disconnected(http_request, agent.run_tools(
+            request.message, context, agent_tools, sessions.history(session_id), request.max_steps,
+            request.allow_actions, deadline))
+        sessions.append(session_id, request.message, response)
+        return {
+            "response": response,
+            "session_id": session_id,
+            "steps": steps,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+    except ClientDisconnected:
+        raise HTTPException(499, "Client closed request")
     except Exception as e:
         raise HTTPException(500, str(e))
 
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """Answer many questions at once, streamed back as NDJSON in completion order"""
+    # Duplicate questions (after normalization) share one retrieval and one generation
+    unique = OrderedDict()
+    for index, question in enumerate(request.questions):
+        unique.setdefault(ResponseCache.normalize(question), []).append((index, question))
+    
+    semaphore = asyncio.Semaphore(request.max_concurrency)
+    
+    async def answer(group):
+        question = group[0][1]
+        cached = response_cache.get(question)
+        if cached is not None:
+            return group, cached, True
+        
+        # Closing the stream cancels these tasks, which closes their Ollama connections.
+        # Retrieval may call the planner model, so it runs inside the same slot as generation
+        async with semaphore:
+            try:
+                async with admission.slot("batch"):
+                    deadline = request_deadline()
+                    planner = functools.partial(agent.plan_table_query, deadline=deadline)
+                    context, deps = await asyncio.to_thread(doc_store.retrieve, question, planner)
+                    response = await agent.generate_response_async(question, context, deadline=deadline)
+            except AdmissionRejected as e:
+                return group, f"Error: {e.reason}, retry in {e.retry_after}s", False
+        if not response.startswith("Error:"):
+            response_cache.put(question, response, deps)
+        return group, response, False
+    
+    async def stream():
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(answer(group)) for group in unique.values()]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                group, response, cached = await finished
+                for index, question in group:
+                    yield json.dumps({
+                        "index": index,
+                        "question": question,
+                        "response": response,
+                        "cached": cached
+                    }) + "\n"
+            yield json.dumps({
+                "done": True,
+                "total": len(request.questions),
+                "unique": len(unique),
+                "elapsed_seconds": round(time.perf_counter() - started, 3)
+            }) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.websocket("/ws/chat")
+async def chat_socket(websocket: WebSocket, session_id: Optional[str] = None, email: Optional[str] = None,
+                      token: Optional[str] = None):
+    """One persistent connection per client: streamed answers, cancellation and pushed
+    notifications.
+    
+    Client -> server: {"type": "query", "id", "message"}, {"type": "cancel", "id"},
+    {"type": "prefetch", "message"}, {"type": "ping"}.
+    Server -> client: hello, token, done, cancelled, error, pong and notification messages;
+    token/done/cancelled/error carry the id of the query they belong to.
+    Notifications for one student's email need that address's notification token.
+    """
+    subscriber = normalize_email(email) if email else None
+    if email and not (subscriber and token and
+                      hmac.compare_digest(token, notification_token(subscriber) or "")):
+        # Assignment notifications name the student's deadlines; anyone could ask for any address
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    session_id = session_id or sessions.new_id()
+    queue = notifications.subscribe(subscriber)
+    send_lock = asyncio.Lock()
+    turns = {}   # query id -> task
+    
+    async def send(message: dict):
+        async with send_lock:
+            await websocket.send_json(message)
+    
+    async def forward_notifications():
+        while True:
+            await send(await queue.get())
+    
+    async def answer(turn_id: str, message: str):
+        try:
+            if shared_state:
+                doc_store.sync()   # HTTP middleware doesn't run for WebSocket messages
+            prefetched = await prefetch.take(session_id, message)
+            history = sessions.history(session_id)
+            response = response_cache.get(message) if not history else None
+            cached = response is not None
+            if not cached:
+                parts = []
+                # Retrieval may call the planner model, so it counts against the chat slot too
+                async with admission.slot("chat"):
+                    deadline = request_deadline()
+                    planner = functools.partial(agent.plan_table_query, deadline=deadline)
+                    context, deps = prefetched or await asyncio.to_thread(doc_store.retrieve, message, planner)
+                    async for token in agent.stream_response(message, context, history, deadline):
+                        if token:
+                            parts.append(token)
+                            await send({"type": "token", "id": turn_id, "content": token})
+                response = "".join(parts)
+                if not history:
+                    response_cache.put(message, response, deps)
+            sessions.append(session_id, message, response)
+            await send({"type": "done", "id": turn_id, "response": response, "cached": cached})
+        except DeadlineExceeded as e:
+            print(f"Ollama timeout: {e}")
+            await send({"type": "error", "id": turn_id,
+                        "detail": "The model took too long to answer, please try again"})
+        except AdmissionRejected as e:
+            await send({"type": "error", "id": turn_id, "detail": e.reason, "retry_after": e.retry_after})
+        except (WebSocketDisconnect, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            print(f"WebSocket turn error: {e}")
+            await send({"type": "error", "id": turn_id, "detail": "Make sure Ollama is running (ollama serve)"})
+        finally:
+            turns.pop(turn_id, None)
+    
+    notifier = asyncio.create_task(forward_notifications())
+    try:
+        await send({"type": "hello", "session_id": session_id})
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                kind, turn_id = data.get("type"), str(data.get("id") or uuid.uuid4().hex[:8])
+            except (ValueError, AttributeError):
+                await send({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            message = str(data.get("message") or "")
+            
+            if kind == "query":
+                if not message.strip() or turn_id in turns:
+                    await send({"type": "error", "id": turn_id, "detail": "Empty message or duplicate id"})
+                    continue
+                try:
+                    admission.check_rate(client_key(websocket), "chat")
+                except AdmissionRejected as e:
+                    await send({"type": "error", "id": turn_id, "detail": e.reason, "retry_after": e.retry_after})
+                    continue
+                turns[turn_id] = asyncio.create_task(answer(turn_id, message))
+            elif kind == "cancel":
+                task = turns.pop(turn_id, None)
+                if task and not task.done():
+                    task.cancel()
+                    await send({"type": "cancelled", "id": turn_id})
+            elif kind == "prefetch":
+                with contextlib.suppress(AdmissionRejected):
+                    admission.check_rate(client_key(websocket), "prefetch")
+                    start_prefetch(session_id, message)
+            elif kind == "ping":
+                await send({"type": "pong"})
+            else:
+                await send({"type": "error", "detail": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        notifier.cancel()
+        for task in list(turns.values()):
+            task.cancel()
+        notifications.unsubscribe(queue)
+
+@app.get("/timetable.json")
+async def timetable_json(if_none_match: Optional[str] = Header(None)):
+    """Versioned timetable for answering simple schedule questions on the client.
+    Clients revalidate with If-None-Match and get 304 until the timetable changes."""
+    etag, body = doc_store.timetable_export()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in
+                          [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
 @app.get("/documents/status")
 async def get_document_status():
     return {
         "timetable": bool(doc_store.timetable),
         "syllabus": bool(doc_store.syllabus),
-        "info": bool(doc_store.college_info)
+        "info": bool(doc_store.college_info),
+        "tables": {name: table.rows for name, table in doc_store.tables.items()},
+        "ingestion": [job.to_dict() for job in reversed(ingest.jobs.values())]
     }
 
+def require_admin(token: Optional[str], configured: bool = False):
+    """Check X-Admin-Token; with configured, the endpoint stays closed until a token is set"""
+    expected = config.settings.server.admin_token
+    if not expected:
+        if configured:
+            raise HTTPException(403, "Set server.admin_token (COLLEGE_ADMIN_TOKEN) to use this endpoint")
+        return
+    if not hmac.compare_digest(token or "", expected):
+        raise HTTPException(403, "Admin token required")
+
+# Allocation reports expose code paths and traffic shape, so /debug/memory needs a token
+@app.get("/debug/memory")
+async def get_memory_report(x_admin_token: Optional[str] = Header(None)):
+    """Document/index sizes, plus top allocators overall and per endpoint while tracing"""
+    require_admin(x_admin_token, configured=True)
+    return {"store": doc_store.memory_usage(), **memory_profiler.report()}
+
+# Tracing slows every request down, so turning it on or off is an admin action
+@app.post("/debug/memory/start")
+async def start_memory_tracing(frames: int = 1, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token, configured=True)
+    memory_profiler.start(max(1, min(frames, 25)))
+    return memory_profiler.report()
+
+@app.post("/debug/memory/stop")
+async def stop_memory_tracing(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token, configured=True)
+    report = memory_profiler.report()
+    memory_profiler.stop()
+    return report
+
+@app.get("/debug/admission")
+async def admission_stats():
+    """Slots in use, queue depth, admissions and rejections per priority class"""
+    return admission.stats()
+
+@app.get("/admin/config")
+async def get_config(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return {**config.stats(), "settings": config.public()}
+
+@app.get("/admin/notification-token")
+async def get_notification_token(email: str, x_admin_token: Optional[str] = Header(None)):
+    """Token for /ws/chat?email=...&token=..., for the portal that has signed the student in"""
+    require_admin(x_admin_token, configured=True)
+    subscriber = normalize_email(email)
+    if not subscriber:
+        raise HTTPException(400, "Invalid email address")
+    token = notification_token(subscriber)
+    if not token:
+        raise HTTPException(503, "Set server.notification_secret to issue notification tokens")
+    return {"email": subscriber, "token": token}
+
+@app.post("/admin/config/reload")
+async def reload_config_endpoint(x_admin_token: Optional[str] = Header(None)):
+    """Re-read the config file and environment. Only this worker reloads; with several
+    workers, send SIGHUP to each of them instead."""
+    require_admin(x_admin_token)
+    try:
+        result = reload_config()
+    except ValueError as e:   # includes pydantic's ValidationError and malformed JSON
+        raise HTTPException(400, f"Configuration not reloaded: {e}")
+    return {**result, "settings": config.public()}
+
+@app.get("/reminders")
+async def get_reminders():
+    return reminder_scheduler.stats()
+
+@app.delete("/reminders/{reminder_id}")
+async def cancel_reminder(reminder_id: str):
+    if not reminder_scheduler.cancel(reminder_id):
+        raise HTTPException(404, "Reminder not found")
+    return {"status": "cancelled", "reminder_id": reminder_id}
+
+@app.get("/documents/compaction")
+async def get_document_compaction():
+    """Tokens saved per document by ingest-time compaction"""
+    return doc_store.compaction
+
 if __name__ == "__main__":
     import uvicorn
     print("\n🚀 College Assistant Backend - UIT RGPV")
@@ -0,0 +1,43 @@
+"""
+Multi-worker launcher for College Assistant
+Workers share documents and cached answers through a SQLite (WAL) database
+Usage: python serve.py [--workers N] [--port 8000] [--state college_state.db]
+
+Equivalent gunicorn command:
+    COLLEGE_SHARED_STATE=college_state.db gunicorn main:app -k uvicorn.workers.UvicornWorker -w N
+"""
+
+import argparse
+import os
+import uvicorn
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def authenticate_calendar_once():
+    """Run the browser OAuth flow here so workers only ever load token.pickle"""
+    if os.path.exists('token.pickle') or not os.path.exists('credentials.json'):
+        return
+    from setup_calendar import setup_calendar
+    setup_calendar()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run College Assistant with several workers")
+    parser.add_argument("--workers", type=int, default=available_cores())
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--state", default="college_state.db")
+    args = parser.parse_args()
+    
+    os.environ["COLLEGE_SHARED_STATE"] = os.path.abspath(args.state)
+    authenticate_calendar_once()
+    
+    print(f"\n🚀 College Assistant Backend - {args.workers} workers")
+    print(f"🗄️ Shared state: {os.environ['COLLEGE_SHARED_STATE']}\n")
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+if __name__ == "__main__":
+    main()
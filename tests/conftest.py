@@ -0,0 +1,61 @@
+"""
+Shared test setup
+main.py builds its stores at import time (SQLite files, attachment cache, default
+documents), so tests import it from a scratch working directory instead of the repo
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def pytest_configure(config):
+    # Before collection, so the test modules' `import main` happens in here
+    os.chdir(tempfile.mkdtemp(prefix="college-tests-"))
+
+TIMETABLE = """TIMETABLE - Computer Science
+
+TUESDAY:
+9:00 AM - 10:00 AM: Computer Networks - Room 303 - Prof. Davis
+10:00 AM - 11:00 AM: Software Engineering - Room 101 - Prof. Verma
+11:00 AM - 12:00 PM: Networks Lab - Lab 3 - Prof. Davis
+1:00 PM - 2:00 PM: Compiler Design - Room 205 - Prof. Verma
+2:00 PM - 4:00 PM: Compiler Lab - Lab 1 - Prof. Verma
+
+WEDNESDAY:
+9:00 AM - 10:00 AM: Compiler Design - Room 205 - Prof. Verma
+11:00 AM - 12:00 PM: Software Engineering - Room 101 - Prof. Verma
+"""
+
+@pytest.fixture
+def timetable_table():
+    import main
+    return main.TimetableIndex(TIMETABLE).to_table()
+
+@pytest.fixture
+def doc_store():
+    """A store with the test timetable, no shared state or assignments"""
+    import main
+    store = main.DocumentStore()
+    store.set_document("timetable", TIMETABLE)
+    return store
+
+@pytest.fixture
+def registry(tmp_path):
+    import main
+    return main.AssignmentRegistry(str(tmp_path / "assignments.db"))
+
+@pytest.fixture
+def make_assignment():
+    """AssignmentEmail factory; keyword arguments override the defaults"""
+    import main
+
+    def make(**fields):
+        return main.AssignmentEmail(**{"student_emails": ["a@uni.edu", "b@uni.edu"], "subject": "DBMS",
+                                       "assignment_title": "ER diagram", "description": "Draw it",
+                                       "due_date": "2026-10-21", "due_time": "23:59", **fields})
+    return make
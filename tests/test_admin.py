@@ -0,0 +1,44 @@
+import pytest
+
+
+@pytest.fixture
+def client():
+    import main
+    from fastapi.testclient import TestClient
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    import main
+    monkeypatch.setattr(main.config.settings.server, "admin_token", "s3cret")
+    return "s3cret"
+
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/debug/memory"),
+    ("post", "/debug/memory/start"),
+    ("post", "/debug/memory/stop"),
+])
+def test_debug_memory_is_closed_without_a_configured_token(client, method, path):
+    response = getattr(client, method)(path, headers={"X-Admin-Token": "anything"})
+    assert response.status_code == 403
+    assert "admin_token" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Admin-Token": "wrong"}])
+def test_memory_report_needs_the_token(client, admin_token, headers):
+    response = client.get("/debug/memory", headers=headers)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "Admin token required"
+
+
+def test_memory_report_with_the_token(client, admin_token):
+    response = client.get("/debug/memory", headers={"X-Admin-Token": admin_token})
+    assert response.status_code == 200
+    assert "store" in response.json()
+
+
+def test_config_needs_the_token_once_set(client, admin_token):
+    assert client.get("/admin/config").status_code == 403
+    assert client.get("/admin/config", headers={"X-Admin-Token": admin_token}).status_code == 200
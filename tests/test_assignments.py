@@ -0,0 +1,80 @@
+"""Assignment registry, deadline questions and their cache invalidation (user-044)"""
+
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+NOW = datetime(2026, 10, 19, 10, 0)   # a Monday
+
+def test_due_range_and_filters(registry, make_assignment):
+    dbms = registry.add(make_assignment(), NOW + timedelta(days=2))
+    registry.add(make_assignment(subject="OS", student_emails=["c@uni.edu"]), NOW + timedelta(days=9))
+
+    assert [a["assignment_id"] for a in registry.due(NOW, NOW + timedelta(days=7))] == [dbms]
+    assert len(registry.due(NOW, NOW + timedelta(days=14))) == 2
+    assert [a["subject"] for a in registry.due(NOW, NOW + timedelta(days=14), student="C@uni.edu")] == ["OS"]
+    assert registry.due(NOW, NOW + timedelta(days=14), subject="dbms", student="c@uni.edu") == []
+
+def test_remove(registry, make_assignment):
+    assignment_id = registry.add(make_assignment(), NOW + timedelta(days=1))
+    assert registry.remove(assignment_id)
+    assert not registry.remove(assignment_id)
+    assert registry.due(NOW, NOW + timedelta(days=7)) == []
+
+def test_other_connections_see_new_assignments(registry, make_assignment, tmp_path):
+    other = main.AssignmentRegistry(str(tmp_path / "assignments.db"))
+    registry.add(make_assignment(), NOW + timedelta(days=1))
+    assert len(other.due(NOW, NOW + timedelta(days=7))) == 1
+
+@pytest.mark.parametrize("question, start, end", [
+    ("what's due today?", NOW, datetime(2026, 10, 20)),
+    ("anything due tomorrow?", datetime(2026, 10, 20), datetime(2026, 10, 21)),
+    ("what is due on friday", datetime(2026, 10, 23), datetime(2026, 10, 24)),
+])
+def test_due_window(question, start, end):
+    assert main.due_window(question, NOW)[:2] == (start, end)
+
+def test_describe_due(registry, make_assignment):
+    assert registry.describe_due("what's due this week?", NOW) == ""
+    registry.add(make_assignment(), NOW + timedelta(days=2))
+    text = registry.describe_due("what's due this week?", NOW)
+    assert "DBMS - ER diagram" in text
+    assert registry.describe_due("what's due tomorrow?", NOW) == "No assignments due tomorrow."
+
+def test_deadline_answers_depend_on_assignments_even_when_there_are_none(registry):
+    store = main.DocumentStore(assignments=registry)
+    _, deps = store.retrieve("what's due this week?")
+    assert "doc:assignments" in deps
+
+    cache = main.ResponseCache()
+    cache.put("what's due this week?", "Nothing is due", deps)
+    assert cache.get("what's due this week?") is None
+
+def test_adding_or_removing_assignments_invalidates(registry, make_assignment):
+    cache = main.ResponseCache()
+    registry.change_listeners.append(
+        lambda: cache.on_document_change("assignments", {"removed": [], "added_terms": set()}))
+    # An entry cached before deadlines were tracked, built from whole documents
+    cache.put("what do I have to submit", "Nothing", None)
+    registry.add(make_assignment(), NOW + timedelta(days=1))
+    assert cache.get("what do I have to submit") is None
+
+    assignment_id = registry.add(make_assignment(), NOW + timedelta(days=1))
+    cache.put("what do I have to submit", "ER diagram", None)
+    registry.remove(assignment_id)
+    assert cache.get("what do I have to submit") is None
+
+def test_app_registry_invalidates_the_response_cache():
+    assert main.on_assignments_change in main.assignments.change_listeners
+
+def test_days_are_the_colleges(registry, make_assignment):
+    # 20:00 UTC on Monday is already 01:30 Tuesday in Asia/Kolkata
+    now = datetime(2026, 10, 19, 20, 0, tzinfo=timezone.utc)
+    start, end, _ = main.due_window("what's due today?", now.astimezone(main.college_zone()))
+    assert (start.date(), end.date()) == (date(2026, 10, 20), date(2026, 10, 21))
+
+    registry.add(make_assignment(), main.assignment_due(make_assignment(due_date="2026-10-20", due_time="09:00")))
+    [due] = registry.due(datetime(2026, 10, 20), datetime(2026, 10, 21))   # naive: college wall clock
+    assert due["due"] == "2026-10-20T09:00"
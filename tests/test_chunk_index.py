@@ -0,0 +1,96 @@
+"""Incremental chunk index and chunk-level answer cache invalidation (user-029)"""
+
+import pytest
+
+import main
+from conftest import TIMETABLE
+
+NOTES = """NOTICES:
+Library closes at 8 PM
+
+EXAMS:
+Mid-terms start on 3 November
+"""
+
+@pytest.fixture
+def index():
+    index = main.ChunkIndex()
+    index.update("info", NOTES)
+    return index
+
+def chunk_with(index, doc_type, text):
+    return next(c for c in index.docs[doc_type] if text in index.text(c))
+
+def test_split_breaks_at_blank_lines_and_headings():
+    assert main.ChunkIndex.split("NOTICES:\nLibrary closes\nEXAMS:\nMid-terms\n\nfooter") == [
+        "NOTICES:\nLibrary closes", "EXAMS:\nMid-terms", "footer"]
+
+def test_update_touches_only_changed_chunks(index):
+    kept = chunk_with(index, "info", "Library")
+    changes = index.update("info", NOTES.replace("3 November", "10 November"))
+    assert changes["reused"] == 1 and len(changes["added"]) == 1 and len(changes["removed"]) == 1
+    assert changes["added_terms"] == {"exams", "mid", "terms", "start", "10", "november"}
+    assert chunk_with(index, "info", "Library") == kept
+    assert "3" not in index.postings and index.postings["10"] == changes["added"]
+    assert index.search("when do mid-terms start", "info") == list(changes["added"])
+
+def test_removed_chunk_leaves_no_postings_or_lines(index):
+    exams = chunk_with(index, "info", "Mid-terms")
+    index.update("info", NOTES.split("\n\n")[0])
+    assert exams not in index.chunks
+    assert "november" not in index.postings
+    assert not index.chunks_for_lines(["Mid-terms start on 3 November"])
+
+def test_chunk_shared_by_two_documents_outlives_one(index):
+    index.update("syllabus", NOTES)
+    assert index.update("syllabus", "")["removed"]
+    library = chunk_with(index, "info", "Library")
+    assert index.chunks[library]["refs"] == 1 and library in index.postings["library"]
+
+@pytest.fixture
+def cache(doc_store):
+    cache = main.ResponseCache()
+    doc_store.listeners.append(cache.on_document_change)
+    return cache
+
+def remember(cache, doc_store, question):
+    _, deps = doc_store.retrieve(question)
+    cache.put(question, f"answer to {question}", deps)
+
+def test_answers_from_other_days_survive_an_edit(cache, doc_store):
+    remember(cache, doc_store, "What classes are on Wednesday?")
+    remember(cache, doc_store, "When is Computer Networks?")
+    doc_store.set_document("timetable", TIMETABLE.replace("Room 303", "Room 404"))
+    assert cache.get("What classes are on Wednesday?") is not None
+    assert cache.get("When is Computer Networks?") is None
+
+def test_new_chunks_drop_answers_they_may_change(cache, doc_store):
+    remember(cache, doc_store, "When is Machine Learning?")
+    remember(cache, doc_store, "What classes are on Wednesday?")
+    doc_store.set_document("timetable", TIMETABLE + "\nTHURSDAY:\n9:00 AM - 10:00 AM: Machine Learning - Room 110 - Prof. Rao\n")
+    assert cache.get("When is Machine Learning?") is None
+    assert cache.get("What classes are on Wednesday?") is not None
+
+def test_answers_without_deps_drop_on_any_change(cache, doc_store):
+    cache.put("Hello there", "Hi!")
+    doc_store.set_document("timetable", TIMETABLE.replace("Room 303", "Room 404"))
+    assert cache.get("Hello there") is None
+
+def test_only_the_uploading_worker_cleans_the_shared_level(tmp_path):
+    shared = main.SharedState(str(tmp_path / "shared.db"))
+    cache = main.ResponseCache(shared=shared)
+    cache.put("When is Computer Networks?", "Tuesday 9 AM", {"chunk-a"})
+    cache.on_document_change("timetable", {"removed": {"chunk-a"}, "added_terms": set(), "local": False})
+    assert [key for key, _ in shared.cache_entries()] == ["when is computer networks"]
+    cache.on_document_change("timetable", {"removed": {"chunk-a"}, "added_terms": set(), "local": True})
+    assert shared.cache_entries() == []
+
+def test_shared_hits_stay_within_the_local_bound(tmp_path):
+    shared = main.SharedState(str(tmp_path / "shared.db"))
+    writer = main.ResponseCache(shared=shared)
+    for day in ("Monday", "Tuesday", "Wednesday"):
+        writer.put(f"What is on {day}?", day, {f"chunk-{day}"})
+    reader = main.ResponseCache(max_entries=2, shared=shared)
+    assert [reader.get(f"What is on {day}?") for day in ("Monday", "Tuesday", "Wednesday")] == [
+        "Monday", "Tuesday", "Wednesday"]
+    assert reader.stats()["entries"] == 2
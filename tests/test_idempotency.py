@@ -0,0 +1,89 @@
+"""Idempotency-Key replay, conflicts and leases for assignment sends (user-042)"""
+
+import asyncio
+import time
+
+import pytest
+
+import main
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "idempotency.db")
+
+@pytest.fixture
+def store(db):
+    return main.IdempotencyStore(db)
+
+class Send:
+    """An execute callable that counts its runs and can be slowed down or made to fail"""
+
+    def __init__(self, seconds: float = 0, fail: bool = False):
+        self.seconds = seconds
+        self.fail = fail
+        self.runs = 0
+
+    async def __call__(self):
+        self.runs += 1
+        await asyncio.sleep(self.seconds)
+        if self.fail:
+            raise main.DeliveryFailed("both channels down")
+        return {"status": "success", "run": self.runs}
+
+def test_repeat_replays_the_first_result(store):
+    send = Send()
+
+    async def twice():
+        return [await store.run("k1", {"title": "ER"}, send) for _ in range(2)]
+
+    (first, replayed_first), (second, replayed_second) = asyncio.run(twice())
+    assert send.runs == 1
+    assert first == second == {"status": "success", "run": 1}
+    assert (replayed_first, replayed_second) == (False, True)
+    assert store.stats() == {"stored": 1, "in_flight": 0, "replays": 1}
+
+def test_concurrent_repeats_wait_for_the_running_send(store):
+    send = Send(seconds=0.1)
+
+    async def together():
+        return await asyncio.gather(*(store.run("k1", {"title": "ER"}, send) for _ in range(3)))
+
+    results = asyncio.run(together())
+    assert send.runs == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+
+def test_same_key_with_another_payload_conflicts(store):
+    asyncio.run(store.run("k1", {"title": "ER"}, Send()))
+    with pytest.raises(main.IdempotencyConflict):
+        asyncio.run(store.run("k1", {"title": "Normalization"}, Send()))
+
+def test_failed_send_can_be_retried(store):
+    with pytest.raises(main.DeliveryFailed):
+        asyncio.run(store.run("k1", {"title": "ER"}, Send(fail=True)))
+    assert store.stats()["in_flight"] == 0
+    result, replayed = asyncio.run(store.run("k1", {"title": "ER"}, Send()))
+    assert result["status"] == "success" and not replayed
+
+def test_crashed_workers_pending_row_expires(db):
+    crashed = main.IdempotencyStore(db, lease_seconds=60)
+    assert crashed._claim("k1", crashed.fingerprint({"title": "ER"})) is None
+    with crashed.conn:
+        crashed.conn.execute("UPDATE idempotency SET created = created - 120")
+    send = Send()
+    result, replayed = asyncio.run(main.IdempotencyStore(db, lease_seconds=60).run("k1", {"title": "ER"}, send))
+    assert send.runs == 1 and not replayed
+
+def test_long_send_keeps_its_lease(db):
+    # Two workers on one database; the send outlasts the lease several times over
+    first, second = (main.IdempotencyStore(db, lease_seconds=0.2) for _ in range(2))
+    send = Send(seconds=0.8)
+
+    async def retry_midway():
+        running = asyncio.ensure_future(first.run("k1", {"title": "ER"}, send))
+        await asyncio.sleep(0.5)
+        retried = await second.run("k1", {"title": "ER"}, send)
+        return await running, retried
+
+    (result, replayed), (retried, retried_replayed) = asyncio.run(retry_midway())
+    assert send.runs == 1
+    assert result == retried and (replayed, retried_replayed) == (False, True)
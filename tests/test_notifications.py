@@ -0,0 +1,45 @@
+"""Per-student notification subscriptions on /ws/chat (user-047)"""
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import main
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main.config.settings.server, "notification_secret", "portal-secret")
+    return TestClient(main.app)
+
+def subscribe(client, **params):
+    query = "&".join(f"{name}={value}" for name, value in params.items())
+    with client.websocket_connect(f"/ws/chat?{query}") as socket:
+        assert socket.receive_json()["type"] == "hello"
+        # Delivered in order, so a socket that skips the first gets the broadcast instead
+        main.notifications.publish("assignment", {"title": "ER diagram"}, ["a@uni.edu"])
+        main.notifications.publish("document", {"doc_type": "timetable"})
+        return socket.receive_json()
+
+def test_token_subscribes_to_that_students_notifications(client):
+    message = subscribe(client, email="A@uni.edu", token=main.notification_token("a@uni.edu"))
+    assert message["type"] == "notification" and message["data"] == {"title": "ER diagram"}
+
+@pytest.mark.parametrize("token", [None, "forged", main.hmac.new(b"other", b"a@uni.edu", "sha256").hexdigest()])
+def test_email_without_its_token_is_refused(client, token):
+    params = {"email": "a@uni.edu", **({"token": token} if token else {})}
+    with pytest.raises(WebSocketDisconnect) as refused:
+        subscribe(client, **params)
+    assert refused.value.code == 1008
+
+def test_another_students_token_is_refused(client):
+    with pytest.raises(WebSocketDisconnect):
+        subscribe(client, email="a@uni.edu", token=main.notification_token("b@uni.edu"))
+
+def test_no_secret_means_no_personal_subscriptions(client, monkeypatch):
+    token = main.notification_token("a@uni.edu")
+    monkeypatch.setattr(main.config.settings.server, "notification_secret", None)
+    with pytest.raises(WebSocketDisconnect):
+        subscribe(client, email="a@uni.edu", token=token)
+
+def test_anonymous_sockets_skip_personal_notifications(client):
+    assert subscribe(client)["event"] == "document"
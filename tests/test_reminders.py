@@ -0,0 +1,79 @@
+"""Reminder timing wheel and due times in the college's time zone (user-033)"""
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import main
+
+class Outbox:
+    """Stands in for EmailManager: records reminder emails instead of sending them"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_email(self, recipients, subject, body, text_body=None):
+        self.sent.append((recipients, subject))
+        return True
+
+    create_reminder_email_body = create_reminder_email_text = staticmethod(lambda *fields: "")
+
+@pytest.fixture
+def outbox():
+    return Outbox()
+
+@pytest.fixture
+def scheduler(tmp_path, outbox):
+    return main.ReminderScheduler(str(tmp_path / "reminders.db"), outbox, slots=16)
+
+def due_in(hours: float) -> datetime:
+    return datetime.now(timezone.utc) + timedelta(hours=hours)
+
+def test_due_time_is_read_in_the_college_zone(make_assignment):
+    # Asia/Kolkata is UTC+5:30 whatever zone the server runs in
+    due = main.assignment_due(make_assignment(due_date="2030-01-10", due_time="18:30"))
+    assert due.timestamp() == datetime(2030, 1, 10, 13, 0, tzinfo=timezone.utc).timestamp()
+
+def test_reminders_fire_24h_and_1h_before(scheduler, make_assignment):
+    due = due_in(48)
+    ids = scheduler.schedule_assignment(make_assignment(), due)
+    fire_at = sorted(scheduler.pending[i]["fire_at"] for i in ids)
+    assert fire_at == [due.timestamp() - 24 * 3600, due.timestamp() - 3600]
+
+def test_past_reminders_are_skipped(scheduler, make_assignment):
+    assert len(scheduler.schedule_assignment(make_assignment(), due_in(2))) == 1
+    assert scheduler.schedule_assignment(make_assignment(), due_in(0.5)) == []
+
+def test_only_due_reminders_pop(scheduler, make_assignment):
+    due = due_in(48)
+    scheduler.schedule_assignment(make_assignment(), due)
+    assert scheduler.due_reminders(time.time()) == []
+    # 16 one-minute slots: a day ahead is many revolutions away, yet fires on time
+    fired = scheduler.due_reminders(due.timestamp() - 24 * 3600)
+    assert [r["time_left"] for r in fired] == ["24 hours"]
+    assert [r["time_left"] for r in scheduler.due_reminders(due.timestamp() - 60)] == ["1 hour"]
+    assert scheduler.pending == {}
+
+def test_cancel(scheduler, make_assignment):
+    due = due_in(48)
+    first, second = scheduler.schedule_assignment(make_assignment(), due)
+    assert scheduler.cancel(first)
+    assert not scheduler.cancel(first)
+    assert [r["id"] for r in scheduler.due_reminders(due.timestamp() - 60)] == [second]
+
+def test_pending_reminders_survive_a_restart(scheduler, make_assignment, outbox, tmp_path):
+    ids = scheduler.schedule_assignment(make_assignment(), due_in(48))
+    restarted = main.ReminderScheduler(str(tmp_path / "reminders.db"), outbox, slots=16)
+    assert set(restarted.pending) == set(ids)
+
+def test_each_reminder_is_sent_by_one_worker(scheduler, make_assignment, outbox, tmp_path):
+    due = due_in(48)
+    scheduler.schedule_assignment(make_assignment(), due)
+    other = main.ReminderScheduler(str(tmp_path / "reminders.db"), outbox, slots=16)
+    now = due.timestamp() - 60
+    fired = scheduler.due_reminders(now) + other.due_reminders(now)
+    assert len(fired) == 2
+
+    scheduler.fire(fired[0])
+    assert outbox.sent[0][0] == ["a@uni.edu", "b@uni.edu"]
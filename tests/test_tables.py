@@ -0,0 +1,81 @@
+"""Table engine, rule-based question parser and planner fallback (user-038)"""
+
+import io
+
+import pytest
+
+import main
+
+REVIEWS = """Title,Date,Rating,Review
+Great,2024-01-05,5,Loved it
+Fine,2024-01-20,3,Okay
+Bad,2024-02-02,1,Cold food
+Good,2024-02-14,4,
+"""
+
+@pytest.fixture
+def reviews():
+    return main.Table.from_csv("reviews", io.StringIO(REVIEWS))
+
+def count(table, question):
+    plan = main.parse_table_question(table, question)
+    return plan and table.execute(plan)
+
+def test_csv_columns_are_typed(reviews):
+    assert reviews.types == {"Title": "text", "Date": "date", "Rating": "number", "Review": "text"}
+    assert reviews.rows == 4
+
+def test_filters_and_aggregates(reviews):
+    result = reviews.execute({"filters": [{"column": "rating", "op": ">=", "value": 4}],
+                              "aggregate": {"op": "avg", "column": "Rating"}})
+    assert result["matched_rows"] == 2
+    assert result["value"] == 4.5
+
+def test_month_filter(reviews):
+    result = reviews.execute({"filters": [{"column": "Date", "op": "month", "value": {"month": 2}}]})
+    assert result["value"] == 2
+
+def test_invalid_query_is_rejected(reviews):
+    with pytest.raises(ValueError):
+        reviews.execute({"aggregate": {"op": "avg", "column": "Title"}})
+
+def test_parser_average(reviews):
+    result = count(reviews, "What is the average rating?")
+    assert result["value"] == 3.25
+
+def test_plural_category_value(timetable_table):
+    # "labs" names the kind "lab"; the day alone would count all five Tuesday slots
+    result = count(timetable_table, "How many labs are there on Tuesday?")
+    assert result["value"] == 2
+
+def test_category_filter_with_group(timetable_table):
+    result = count(timetable_table, "How many lectures does Prof. Verma have each day?")
+    assert result["groups"] == [["Tuesday", 2], ["Wednesday", 2]]
+
+def test_unknown_category_value_is_left_to_the_planner(timetable_table):
+    # Nobody named Smith teaches here; counting every lecture would be a wrong "Computed" number
+    assert main.parse_table_question(timetable_table, "How many lectures does Prof. Smith have each day?") is None
+
+def test_longest_value_wins(timetable_table):
+    result = count(timetable_table, "How many compiler design lectures are there?")
+    assert result["filters"] == [{"column": "subject", "op": "==", "value": "compiler design"},
+                                 {"column": "kind", "op": "==", "value": "lecture"}]
+    assert result["value"] == 2
+
+def test_planner_gets_only_unparsed_questions(doc_store):
+    calls = []
+
+    def planner(query, tables):
+        calls.append([t.name for t in tables])
+        return {"table": "timetable", "filters": [{"column": "professor", "op": "==", "value": "prof. smith"}]}
+
+    parsed = doc_store.query_tables("How many labs are there on Tuesday?", planner)
+    assert calls == [] and parsed[0][1]["value"] == 2
+    planned = doc_store.query_tables("How many lectures does Prof. Smith have each day?", planner)
+    assert calls == [["timetable"]] and planned[0][1]["value"] == 0
+
+@pytest.mark.parametrize("order, expected", [("asc", ["C", "A", "B"]), ("desc", ["A", "C", "B"])])
+def test_groups_without_a_value_sort_last(order, expected):
+    table = main.Table.from_csv("scores", io.StringIO("Title,Rating\nA,5\nB,\nC,1\n"))
+    result = table.execute({"group_by": "Title", "aggregate": {"op": "avg", "column": "Rating"}, "order": order})
+    assert [key for key, _ in result["groups"]] == expected